@@ -0,0 +1,77 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import argparse
+import random
+import string
+import timeit
+
+from common.config import TEAM_NAME_MAX_EDIT_DISTANCE, TEAM_NAME_FUZZY_MIN_LENGTH
+from sports_data.matcher import TeamMatcher
+from sports_data.team import TeamIndex
+
+# command line arguments
+parser = argparse.ArgumentParser(
+    description='Time building a TeamMatcher from synthetic teams, and matching the text detections of a frame.')
+parser.add_argument('--teams', type=int, default=5000, help='number of synthetic teams (default=5000)')
+parser.add_argument('--lines', type=int, default=25, help='LINE detections per frame (default=25)')
+parser.add_argument('--words', type=int, default=50, help='WORD detections per frame (default=50)')
+parser.add_argument('--frames', type=int, default=1000, help='number of frames to match (default=1000)')
+parser.add_argument('--seed', type=int, default=0, help='random seed (default=0)')
+
+
+def random_word(rng, min_length=3, max_length=10):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_length, max_length)))
+
+
+def synthetic_teams(rng, count):
+    """Teams of one to three words with a unique 5 letter abbreviation, the format of sports_data/data/teams.yaml"""
+    items = {}
+    abbrs = set()
+    while len(items) < count:
+        name = ' '.join(random_word(rng).capitalize() for _ in range(rng.randint(1, 3)))
+        abbr = ''.join(rng.choice(string.ascii_uppercase) for _ in range(5))
+        if name in items or abbr in abbrs:
+            continue
+        abbrs.add(abbr)
+        items[name] = {'id': f'team_{len(items)}', 'abbr': [abbr]}
+    return items
+
+
+def synthetic_detections(rng, teams, lines, words):
+    """Text detections of a frame, a few of them naming a team, some with a typo"""
+    team_names = list(teams)
+    detections = []
+    for i in range(lines):
+        text = ' '.join(random_word(rng) for _ in range(rng.randint(2, 5)))
+        if i % 5 == 0:
+            text += ' ' + rng.choice(team_names)
+        detections.append({'Id': i, 'Type': 'LINE', 'DetectedText': text})
+    for i in range(words):
+        word = random_word(rng)
+        if i % 10 == 0:
+            name = rng.choice(team_names).split()[0]
+            word = name[:-1] + 'x' if len(name) >= TEAM_NAME_FUZZY_MIN_LENGTH else name
+        detections.append({'Id': lines + i, 'ParentId': i % lines, 'Type': 'WORD', 'DetectedText': word})
+    return detections
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    teams = synthetic_teams(rng, args.teams)
+
+    start = timeit.default_timer()
+    matcher = TeamMatcher(TeamIndex(teams), max_distance=TEAM_NAME_MAX_EDIT_DISTANCE,
+                          min_fuzzy_length=TEAM_NAME_FUZZY_MIN_LENGTH)
+    build_sec = timeit.default_timer() - start
+
+    frames = [synthetic_detections(rng, teams, args.lines, args.words) for _ in range(args.frames)]
+    start = timeit.default_timer()
+    matched = sum(len(matcher.match(detections)) for detections in frames)
+    match_sec = timeit.default_timer() - start
+
+    print(f'{args.teams} teams: index built in {build_sec:.3f} s')
+    print(f'{args.frames} frames of {args.lines + args.words} detections: {match_sec / args.frames * 1000:.3f} ms '
+          f'per frame, {matched / args.frames:.1f} matches per frame')
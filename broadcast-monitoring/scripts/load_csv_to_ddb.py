@@ -4,7 +4,7 @@
 
 import argparse
 import boto3
-from common.utils import convert_csv_to_ddb
+from common.utils import bump_schedule_versions, convert_csv_to_ddb, read_csv_items
 import logging
 
 logging.basicConfig()
@@ -17,6 +17,11 @@ parser.add_argument('table', help='Dynamo db table name')
 parser.add_argument('delimiter', default=',', nargs='?', help='Delimiter for csv records (default=,)')
 parser.add_argument('region', default='us-east-1', nargs='?', help='Dynamo db region name (default=us-east-1')
 parser.add_argument('endpoint', default='', nargs='?', help='endpoint for DDB. default empty')
+parser.add_argument('--workers', type=int, default=8, help='threads writing batches of records (default=8)')
+parser.add_argument('--diff', action='store_true',
+                    help='only write the records that differ from the items already in the table')
+parser.add_argument('--no-schedule-version', dest='schedule_version', action='store_false',
+                    help='don\'t bump the Schedule_Version of the streams loaded, for a table other than the schedule')
 
 if __name__ == '__main__':
     args = parser.parse_args()
@@ -27,4 +32,12 @@ if __name__ == '__main__':
     else:
         dynamodb = boto3.resource('dynamodb', region_name=args.region)
     # write records to dynamo db
-    convert_csv_to_ddb(args.csvFile, args.table, args.delimiter)
+    counts = convert_csv_to_ddb(args.csvFile, args.table, args.delimiter, ddb_client=dynamodb, workers=args.workers,
+                                diff=args.diff)
+    print(counts)
+    if args.schedule_version and counts['written']:
+        # the expected program lambdas read the schedules of the streams again on their next version check
+        with open(args.csvFile) as csv_file:
+            stream_ids = {item['Stream_ID'] for item in read_csv_items(csv_file, args.delimiter)}
+        bump_schedule_versions(args.table, stream_ids, ddb_client=dynamodb)
+        print(f'Bumped the schedule version of {len(stream_ids)} streams')
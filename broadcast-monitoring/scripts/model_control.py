@@ -1,11 +1,26 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import argparse
 import boto3
-import fire
 import re
 
 client = boto3.client('rekognition')
 
 version_name_re = re.compile(r'version/(?P<version_name>[a-zA-Z0-9_.\-]{1,255})/[0-9]+')
 
+# command line arguments
+parser = argparse.ArgumentParser(description='Start or stop a Rekognition Custom Labels model.')
+subparsers = parser.add_subparsers(dest='command', required=True)
+start_parser = subparsers.add_parser('start_model', help='start the model and wait for it to be running')
+start_parser.add_argument('project_arn', help='ARN of the Custom Labels project')
+start_parser.add_argument('model_arn', help='ARN of the model (project version)')
+start_parser.add_argument('min_inference_units', type=int, default=1, nargs='?',
+                          help='inference units of the running model (default=1)')
+stop_parser = subparsers.add_parser('stop_model', help='stop the model')
+stop_parser.add_argument('model_arn', help='ARN of the model (project version)')
+
 
 def start_model(project_arn, model_arn, min_inference_units=1):
 
@@ -46,4 +61,8 @@ def stop_model(model_arn):
 
 
 if __name__ == "__main__":
-    fire.Fire()
+    args = parser.parse_args()
+    if args.command == 'start_model':
+        start_model(args.project_arn, args.model_arn, args.min_inference_units)
+    else:
+        stop_model(args.model_arn)
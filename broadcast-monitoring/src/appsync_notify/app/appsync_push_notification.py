@@ -7,69 +7,104 @@ import logging
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
 
 # Conditionally add /opt to the PYTHON PATH for lambda layer
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.config import APPSYNC_API_ENDPOINT_URL, APPSYNC_API_KEY, LOG_LEVEL
+from common.config import APPSYNC_API_ENDPOINT_URL, APPSYNC_API_KEY, LOG_LEVEL, APPSYNC_CONNECT_TIMEOUT_SEC, \
+    APPSYNC_READ_TIMEOUT_SEC, APPSYNC_BATCH_MAX_SIZE
 
 logger = logging.getLogger('AppSyncPushNotification')
 logger.setLevel(LOG_LEVEL)
 
+SEGMENT_SUMMARY_FIELDS = '''
+        Stream_ID
+        Start_DateTime
+        Duration_Sec
+        S3_Key
+        Station_Status
+        Audio_Status
+        Sports_Status
+        Team_Status
+        Thumbnail_Key
+'''
+
+NEW_SEGMENT_READY_GQL = '''
+    mutation NewSegmentSummaryReady($input: newSegmentSummaryReadyInput!) {
+      newSegmentSummaryReady(input: $input) {''' + SEGMENT_SUMMARY_FIELDS + '''      }
+    }
+    '''
 
-def execute_gql(gql_query, params={}):
+
+def create_session():
+    """
+    Session shared by the invocations of a container, so the connection to AppSync is kept alive between
+    notifications instead of paying a TCP and TLS handshake every time
+    """
+    new_session = requests.Session()
+    new_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    new_session.headers.update({
+        'Content-Type': "application/graphql",
+        'cache-control': "no-cache",
+    })
+    return new_session
+
+
+session = create_session()
+
+
+class GraphQLError(Exception):
+    """AppSync answered with errors, which it does with a 200 status code"""
+
+    def __init__(self, errors):
+        super().__init__(f'graphQL errors: {json.dumps(errors)}')
+        self.errors = errors
+
+
+def check_gql_response(response):
+    """
+    Raise when the request failed, or when AppSync returned errors for it
+    :return: the errors of the aliased mutations that failed while others succeeded, by alias
+    """
+    response.raise_for_status()
+    errors = response.json().get('errors') or []
+    alias_errors = {}
+    for error in errors:
+        path = error.get('path') or []
+        # errors without a path, e.g. validation errors, fail the whole request
+        if not path or not isinstance(path[0], str):
+            raise GraphQLError(errors)
+        alias_errors.setdefault(path[0], []).append(error)
+    return alias_errors
+
+
+def execute_gql(gql_query, params={}, endpoint_url=None):
     """
     Utitliy function that executes GraphQL queries
     :param gql_query: GraphQL query (can be query, mutation, subscription, etc.)
     :param params: variable arguments
+    :param endpoint_url: GraphQL endpoint, the AppSync API by default
     :return: response from graph QL server
     """
-    headers = {
-        'Content-Type': "application/graphql",
-        'x-api-key': APPSYNC_API_KEY,
-        'cache-control': "no-cache",
-    }
-    logger.debug(f'graphQL request headers: {headers}')
-
     payload_obj = {"query": gql_query, "variables": json.dumps(params)}
     payload = json.dumps(payload_obj)
     logger.debug(f'graphQL request payload: {payload}')
 
-    response = requests.request("POST", APPSYNC_API_ENDPOINT_URL, data=payload, headers=headers)
-    logger.info(f'graphQL response: {json.loads(response.content.decode("utf-8"))}')
+    response = session.post(endpoint_url or APPSYNC_API_ENDPOINT_URL, data=payload,
+                            headers={'x-api-key': APPSYNC_API_KEY},
+                            timeout=(APPSYNC_CONNECT_TIMEOUT_SEC, APPSYNC_READ_TIMEOUT_SEC))
+    logger.info(f'graphQL response: {response.status_code}, {len(response.content)} bytes')
+    logger.debug(f'graphQL response body: {response.text}')
     return response
 
 
-def push_appsync(stream_id, segment_start_date_time_str, segment_duration_sec, segment_s3_key, thumbnail_s3_key,
-                 media_check_status):
+def segment_summary_input(stream_id, segment_start_date_time_str, segment_duration_sec, segment_s3_key,
+                          thumbnail_s3_key, media_check_status):
     """
-    Notify AppSync subscribers that a new segment summary is available.
-    :param stream_id:
-    :param segment_start_date_time_str:
-    :param segment_duration_sec:
-    :param segment_s3_key:
-    :param thumbnail_s3_key:
-    :param media_check_status:
-    :return: none
+    :return: newSegmentSummaryReadyInput of a segment
     """
-
-    new_segment_ready_gql = '''
-    mutation NewSegmentSummaryReady($input: newSegmentSummaryReadyInput!) {
-      newSegmentSummaryReady(input: $input) {
-        Stream_ID
-        Start_DateTime
-        Duration_Sec
-        S3_Key
-        Station_Status
-        Audio_Status
-        Sports_Status
-        Team_Status
-        Thumbnail_Key
-      }
-    }
-    '''
-
     new_segment_summary_ready_input = {
         "Stream_ID": stream_id,
         "Start_DateTime": segment_start_date_time_str,
@@ -81,6 +116,73 @@ def push_appsync(stream_id, segment_start_date_time_str, segment_duration_sec, s
 
     for checks in media_check_status:
         new_segment_summary_ready_input[checks] = media_check_status[checks]
+    return new_segment_summary_ready_input
+
 
-    execute_gql(new_segment_ready_gql, params={"input": new_segment_summary_ready_input})
+def push_appsync(stream_id, segment_start_date_time_str, segment_duration_sec, segment_s3_key, thumbnail_s3_key,
+                 media_check_status, endpoint_url=None):
+    """
+    Notify AppSync subscribers that a new segment summary is available.
+    :param stream_id:
+    :param segment_start_date_time_str:
+    :param segment_duration_sec:
+    :param segment_s3_key:
+    :param thumbnail_s3_key:
+    :param media_check_status:
+    :param endpoint_url: GraphQL endpoint, the AppSync API by default
+    :return: none
+    """
+    new_segment_summary_ready_input = segment_summary_input(stream_id, segment_start_date_time_str,
+                                                            segment_duration_sec, segment_s3_key, thumbnail_s3_key,
+                                                            media_check_status)
+
+    response = execute_gql(NEW_SEGMENT_READY_GQL, params={"input": new_segment_summary_ready_input},
+                           endpoint_url=endpoint_url)
+    alias_errors = check_gql_response(response)
+    if alias_errors:
+        raise GraphQLError([error for errors in alias_errors.values() for error in errors])
     logger.info('success pushing to AppSync.')
+
+
+def build_batched_mutation(summary_inputs):
+    """
+    Single mutation document running newSegmentSummaryReady once for each input, each under its own alias.
+    Subscribers are notified of every aliased mutation, as if they had been sent one by one.
+    :return: (query, variables)
+    """
+    variable_defs = ', '.join(f'$input{i}: newSegmentSummaryReadyInput!' for i in range(len(summary_inputs)))
+    fields = ''.join(
+        f'''
+      segment{i}: newSegmentSummaryReady(input: $input{i}) {{''' + SEGMENT_SUMMARY_FIELDS + '''      }'''
+        for i in range(len(summary_inputs))
+    )
+    query = f'''
+    mutation NewSegmentSummariesReady({variable_defs}) {{{fields}
+    }}
+    '''
+    variables = {f'input{i}': summary_input for i, summary_input in enumerate(summary_inputs)}
+    return query, variables
+
+
+def push_appsync_batch(summary_inputs, batch_size=APPSYNC_BATCH_MAX_SIZE, endpoint_url=None):
+    """
+    Notify AppSync subscribers of several new segment summaries, with up to batch_size of them per request.
+    A failed request doesn't stop the following ones.
+    :param summary_inputs: list of newSegmentSummaryReadyInput, see segment_summary_input
+    :return: indexes in summary_inputs of the summaries that weren't pushed
+    """
+    failed = []
+    for start in range(0, len(summary_inputs), batch_size):
+        batch = summary_inputs[start:start + batch_size]
+        query, variables = build_batched_mutation(batch)
+        try:
+            alias_errors = check_gql_response(execute_gql(query, params=variables, endpoint_url=endpoint_url))
+        except (requests.RequestException, ValueError, GraphQLError):
+            logger.error(f'Error pushing {len(batch)} segment summaries to AppSync', exc_info=True)
+            failed.extend(range(start, start + len(batch)))
+            continue
+        if alias_errors:
+            logger.error(f'graphQL errors pushing segment summaries: {json.dumps(alias_errors)}')
+        failed.extend(start + i for i in range(len(batch)) if f'segment{i}' in alias_errors)
+        logger.info(f'success pushing {len(batch) - len(alias_errors)} segment summaries to AppSync.')
+    return failed
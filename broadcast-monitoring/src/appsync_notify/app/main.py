@@ -7,22 +7,26 @@ import logging
 import sys
 import json
 
+import boto3
+
 # Conditionally add /opt to the PYTHON PATH for lambda layer
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
 from common.utils import check_enabled
-from common.config import LOG_LEVEL, APPSYNC_NOTIFY_CONFIG_KEY
+from common.config import LOG_LEVEL, APPSYNC_NOTIFY_CONFIG_KEY, APPSYNC_NOTIFY_QUEUE_URL
 
 try:
-    from .appsync_push_notification import push_appsync
+    from .appsync_push_notification import push_appsync, push_appsync_batch, segment_summary_input
 except ImportError:
-    from appsync_push_notification import push_appsync
+    from appsync_push_notification import push_appsync, push_appsync_batch, segment_summary_input
 
 logging.basicConfig()
 logger = logging.getLogger('FindExpectedProgramMain')
 logger.setLevel(LOG_LEVEL)
 
+sqs = boto3.client('sqs')
+
 
 @check_enabled(APPSYNC_NOTIFY_CONFIG_KEY)
 def lambda_handler(event, context):
@@ -83,6 +87,14 @@ def lambda_handler(event, context):
     thumbnail_s3_key = event['thumbnailKey']
     status_summary = event['statusSummary']
 
+    if APPSYNC_NOTIFY_QUEUE_URL:
+        # pushed along with the summaries of other segments finishing around the same time by batch_lambda_handler
+        summary_input = segment_summary_input(stream_id, segment_start_dt, segment_duration, segment_s3_key,
+                                              thumbnail_s3_key, status_summary)
+        sqs.send_message(QueueUrl=APPSYNC_NOTIFY_QUEUE_URL, MessageBody=json.dumps(summary_input))
+        logger.info('queued segment summary notification')
+        return event
+
     # notify frontend new stream summary is available
     push_appsync(stream_id=stream_id,
                  segment_start_date_time_str=segment_start_dt,
@@ -92,3 +104,19 @@ def lambda_handler(event, context):
                  media_check_status=status_summary
                  )
     return event
+
+
+def batch_lambda_handler(event, context):
+    """
+    Pushes the segment summaries queued by lambda_handler, all the messages of the SQS batch in one aliased mutation.
+    Only the messages whose summary wasn't pushed are reported back, so SQS retries them and not the whole batch
+    :param event: SQS event, the body of each record is a newSegmentSummaryReadyInput
+    :return: partial batch response, with the ids of the messages to retry
+    """
+    records = event['Records']
+    summary_inputs = [json.loads(record['body']) for record in records]
+    logger.info('Pushing %d segment summaries', len(summary_inputs))
+    failed = push_appsync_batch(summary_inputs)
+    if failed:
+        logger.warning('%d segment summaries will be retried', len(failed))
+    return {'batchItemFailures': [{'itemIdentifier': records[i]['messageId']} for i in failed]}
@@ -0,0 +1,139 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ..app import appsync_push_notification
+from ..app.appsync_push_notification import build_batched_mutation, push_appsync, push_appsync_batch, session, \
+    GraphQLError
+from ..app.main import batch_lambda_handler
+
+
+class StubGraphQLServer(object):
+    """
+    Local HTTP server recording the GraphQL requests it receives and answering them with an empty result, or with the
+    (status, body) returned by respond for the request body
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.respond = lambda body: (200, {'data': {}})
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append({'headers': dict(self.headers), 'body': json.loads(body)})
+                status, response = stub.respond(json.loads(body))
+                response = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        # connections kept alive by the client are handled in daemon threads, which shutdown() doesn't wait for
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/graphql'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def graphql_stub():
+    with StubGraphQLServer() as stub:
+        yield stub
+
+
+def summary_input(i):
+    return {'Stream_ID': f'test_{i}', 'Start_DateTime': '2020-03-05T18:49:28.708000Z', 'Duration_Sec': 5,
+            'S3_Key': f'live/test_{i}_00031.ts'}
+
+
+def test_push_appsync(graphql_stub):
+    push_appsync('test_1', '2020-03-05T18:49:28.708000Z', 5, 'live/test_1_00031.ts', None,
+                 {'Audio_Status': True, 'Station_Status': False}, endpoint_url=graphql_stub.url)
+    push_appsync('test_1', '2020-03-05T18:49:33.708000Z', 5, 'live/test_1_00032.ts', 'frames/test_1.jpg', {},
+                 endpoint_url=graphql_stub.url)
+
+    assert len(graphql_stub.requests) == 2
+    first = graphql_stub.requests[0]['body']
+    assert 'newSegmentSummaryReady(input: $input)' in first['query']
+    assert json.loads(first['variables']) == {'input': {**summary_input(1), 'Audio_Status': True,
+                                                        'Station_Status': False}}
+    assert json.loads(graphql_stub.requests[1]['body']['variables'])['input']['Thumbnail_Key'] == 'frames/test_1.jpg'
+
+
+def test_push_appsync_graphql_errors(graphql_stub):
+    graphql_stub.respond = lambda body: (200, {'data': None, 'errors': [{'message': 'Not Authorized'}]})
+    with pytest.raises(GraphQLError):
+        push_appsync('test_1', '2020-03-05T18:49:28.708000Z', 5, 'live/test_1_00031.ts', None, {},
+                     endpoint_url=graphql_stub.url)
+
+
+def test_build_batched_mutation():
+    query, variables = build_batched_mutation([summary_input(1), summary_input(2)])
+    assert 'mutation NewSegmentSummariesReady($input0: newSegmentSummaryReadyInput!, ' \
+           '$input1: newSegmentSummaryReadyInput!)' in query
+    assert 'segment0: newSegmentSummaryReady(input: $input0)' in query
+    assert 'segment1: newSegmentSummaryReady(input: $input1)' in query
+    assert variables == {'input0': summary_input(1), 'input1': summary_input(2)}
+
+
+def test_push_appsync_batch(graphql_stub):
+    push_appsync_batch([summary_input(i) for i in range(5)], batch_size=2, endpoint_url=graphql_stub.url)
+
+    assert [len(json.loads(request['body']['variables'])) for request in graphql_stub.requests] == [2, 2, 1]
+
+
+def test_push_appsync_batch_failures(graphql_stub):
+    def respond(body):
+        if json.loads(body['variables'])['input0']['Stream_ID'] == 'test_0':
+            return 500, {}
+        # the summary of test_3 fails alone, as the second summary of the second request
+        return 200, {'data': {'segment0': {}, 'segment1': None},
+                     'errors': [{'message': 'Not Authorized', 'path': ['segment1']}]}
+
+    graphql_stub.respond = respond
+    failed = push_appsync_batch([summary_input(i) for i in range(5)], batch_size=2, endpoint_url=graphql_stub.url)
+
+    assert len(graphql_stub.requests) == 3
+    assert failed == [0, 1, 3]
+
+
+def sqs_event(count):
+    return {'Records': [{'messageId': f'message-{i}', 'body': json.dumps(summary_input(i))} for i in range(count)]}
+
+
+def test_batch_lambda_handler(graphql_stub, monkeypatch):
+    monkeypatch.setattr(appsync_push_notification, 'APPSYNC_API_ENDPOINT_URL', graphql_stub.url)
+    response = batch_lambda_handler(sqs_event(3), None)
+
+    assert response == {'batchItemFailures': []}
+    assert len(graphql_stub.requests) == 1
+    assert json.loads(graphql_stub.requests[0]['body']['variables']) == {
+        f'input{i}': summary_input(i) for i in range(3)
+    }
+
+
+def test_batch_lambda_handler_partial_failure(graphql_stub, monkeypatch):
+    monkeypatch.setattr(appsync_push_notification, 'APPSYNC_API_ENDPOINT_URL', graphql_stub.url)
+    graphql_stub.respond = lambda body: (200, {'data': {'segment0': {}, 'segment1': None, 'segment2': {}},
+                                               'errors': [{'message': 'Not Authorized', 'path': ['segment1']}]})
+
+    assert batch_lambda_handler(sqs_event(3), None) == {'batchItemFailures': [{'itemIdentifier': 'message-1'}]}
@@ -2,16 +2,20 @@
 # SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
 # Licensed under the Amazon Software License  http://aws.amazon.com/asl/
 
-import ffmpeg
-import re
+import os
+import sys
 from collections import namedtuple
 
-silence_start_re = re.compile(r' silence_start: (?P<start>[0-9]+(\.?[0-9]*))')
-silence_end_re = re.compile(r' silence_end: (?P<end>[0-9]+(\.?[0-9]*))')
-silence_duration_re = re.compile(r' silence_duration: (?P<duration>[0-9]+(\.?[0-9]*))')
+import ffmpeg
+
+# Conditionally add /opt to the PYTHON PATH
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
 
-mean_volume_re = re.compile(r' mean_volume: (?P<mean>-?[0-9]+(\.?[0-9]*))')
-max_volume_re = re.compile(r' max_volume: (?P<max>-?[0-9]+(\.?[0-9]*))')
+# the ffmpeg output parsers are shared with the single pass segment analysis
+from common.segment_analysis import parse_volume_output, parse_silence_output, parse_astats_output, \
+    parse_ebur128_output, silencedetect_duration, split_edge_silence  # noqa: F401
+from common.utils import stream_to_process
 
 # For more info on the silencedetect filter see https://www.ffmpeg.org/ffmpeg-filters.html#silencedetect
 DEFAULT_THRESHOLD = '-60dB'    # silence threshold in dB
@@ -25,70 +29,62 @@ def with_volumedetect(stream, **kwargs):
     return ffmpeg.filter(stream, 'volumedetect')
 
 
-def parse_volume_output(lines):
-    """Parses the output of ffmpeg for volume data"""
-
-    max_volume = None
-    mean_volume = None
-
-    for line in lines:
-        max_result = max_volume_re.search(line)
-        mean_result = mean_volume_re.search(line)
-
-        if max_result:
-            max_volume = float(max_result.group('max'))
-
-        elif mean_result:
-            mean_volume = float(mean_result.group('mean'))
-
-    if max_volume and mean_volume:
-        return mean_volume, max_volume
-
-
-def with_silencedetect(stream, threshold=DEFAULT_THRESHOLD, duration=DEFAULT_DURATION, **kwargs):
-    """Adds the ffmpeg silencedetect filter to detect silence in a stream"""
-    return ffmpeg.filter(stream, 'silencedetect', n=threshold, d=duration)
-
-
-def parse_silence_output(lines):
-    """Parses the output of ffmpeg for chunks of silence section denoted by a start, end tuples"""
+def with_silencedetect(stream, threshold=DEFAULT_THRESHOLD, duration=DEFAULT_DURATION, edge_duration=None, **kwargs):
+    """
+    Adds the ffmpeg silencedetect filter to detect silence in a stream. With edge_duration, shorter silence is
+    detected too, see execute_ffmpeg
+    """
+    return ffmpeg.filter(stream, 'silencedetect', n=threshold, d=silencedetect_duration(duration, edge_duration))
 
-    chunk_starts = []
-    chunk_ends = []
 
-    for line in lines:
-        silence_start = silence_start_re.search(line)
-        silence_end = silence_end_re.search(line)
+def with_astats(stream, **kwargs):
+    """Adds the ffmpeg astats filter to measure RMS and peak level of each channel"""
+    return ffmpeg.filter(stream, 'astats')
 
-        if silence_start:
-            chunk_starts.append(float(silence_start.group('start')))
-        elif silence_end:
-            chunk_ends.append(float(silence_end.group('end')))
 
-    return list(zip(chunk_starts, chunk_ends))
+def with_ebur128(stream, **kwargs):
+    """Adds the ffmpeg ebur128 filter to measure EBU R128 loudness. framelog=info logs the short-term loudness"""
+    return ffmpeg.filter(stream, 'ebur128', framelog='info')
 
 
-def execute_ffmpeg(input_file, processors=None, **kwargs):
+def execute_ffmpeg(input_file, processors=None, input_stream=None, **kwargs):
     """
     Run ffmpeg with a set of audio processors to add filters to a call
     and process the results into a dict
+    If input_stream (file-like object, e.g. a s3 StreamingBody) is given, it is piped into ffmpeg instead of
+    reading input_file
+    With the edge_duration keyword argument, silencedetect only reports the chunks of at least duration, and the
+    shorter chunks at the start and end of the segment under 'edge_chunks'
     """
     if processors is None:
         processors = [
             AudioProcessor('volumedetect', with_volumedetect, parse_volume_output),
-            AudioProcessor('silencedetect', with_silencedetect, parse_silence_output)
+            AudioProcessor('silencedetect', with_silencedetect, parse_silence_output),
+            AudioProcessor('astats', with_astats, parse_astats_output),
+            AudioProcessor('ebur128', with_ebur128, parse_ebur128_output)
         ]
 
-    stream = ffmpeg.input(input_file)
+    stream = ffmpeg.input('pipe:0' if input_stream is not None else input_file)
 
     for with_filter in [ap.with_filter for ap in processors]:
         stream = with_filter(stream, **kwargs)
 
-    ret_code, out = ffmpeg.output(stream, '-', format='null').run(quiet=True)
+    output = ffmpeg.output(stream, '-', format='null')
+    if input_stream is not None:
+        process = output.run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+        _, out = stream_to_process(process, input_stream)
+        if process.returncode:
+            raise RuntimeError(f'ffmpeg exited with code {process.returncode}')
+    else:
+        ret_code, out = output.run(quiet=True)
 
-    if ret_code:
-        raise RuntimeError
+        if ret_code:
+            raise RuntimeError
 
     output_lines = out.decode('utf-8').splitlines()
 
-    return {ap.name: ap.output_processor(output_lines) for ap in processors}
+    results = {ap.name: ap.output_processor(output_lines) for ap in processors}
+    if kwargs.get('edge_duration') and 'silencedetect' in results:
+        results['silencedetect'], results['edge_chunks'] = split_edge_silence(
+            results['silencedetect'], kwargs.get('duration', DEFAULT_DURATION))
+    return results
@@ -12,15 +12,20 @@ if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
 from audio_detect import execute_ffmpeg
-from common.utils import download_file_from_s3, check_enabled, cleanup_dir
-from common.config import LOG_LEVEL
+from pcm_audio import execute_pcm_analysis
+from common.segment_analysis import convert_audio_results
+from common.utils import download_file_from_s3, open_s3_stream, check_enabled, cleanup_dir
+from common.config import LOG_LEVEL, SILENCE_THRESHOLD, SILENCE_DURATION, SILENCE_EDGE_DURATION, SEGMENT_INPUT_MODE, \
+    AUDIO_ENGINE
 
 logging.basicConfig()
 logger = logging.getLogger('AudioDetection')
 logger.setLevel(LOG_LEVEL)
 
-SILENCE_THRESHOLD = os.getenv('SILENCE_THRESHOLD', '-60dB')
-SILENCE_DURATION = os.getenv('SILENCE_DURATION', 1)
+AUDIO_ENGINES = {
+    'ffmpeg': execute_ffmpeg,
+    'numpy': execute_pcm_analysis
+}
 
 
 @check_enabled("audio_check_enabled")
@@ -53,42 +58,59 @@ def lambda_handler(event, context):
     {
       "volume": {
         "mean": -22.0,
-        "max": -4.3
+        "max": -4.3,
+        "channels": [               # RMS (mean) and peak (max) of each channel
+          { "mean": -21.5, "max": -4.3 },
+          { "mean": -22.6, "max": -5.1 }
+        ],
+        "loudness": {               # EBU R128, in LUFS
+          "integrated": -23.4,
+          "short_term_max": -19.8
+        }
       },
       "silence_chunks": [
         { "start": 1.33494, "end": 1.84523 },
         { "start": 3.52498, "end": 3.85456 }
+      ],
+      "edge_silence": {             # numpy audio engine only
+        "leading": 0.0,
+        "trailing": 0.35
+      },
+      "edge_silence_chunks": [      # ffmpeg audio engine only, silence at the edges shorter than silence chunks
+        { "start": 5.65, "end": 6.0 }
       ]
     }
     """
     logger.info('Received event: %s', json.dumps(event, indent=2))
 
+    # the single pass segment analysis already ran the audio filters
+    if event.get('analysis', {}).get('audio') is not None:
+        logger.info('Using audio results of the segment analysis')
+        return event['analysis']['audio']
+
     s3_bucket = event['s3Bucket']
     segment_s3_key = event['parsed']['lastSegment']['s3Key']
 
-    # the cleanup_dir decorator will ensure the tmp/ working directory gets cleaned up if lambda container is reused
-    input_stream = download_file_from_s3(s3_bucket, segment_s3_key)
-
-    raw_results = execute_ffmpeg(
-        input_stream, threshold=SILENCE_THRESHOLD, duration=SILENCE_DURATION
-    )
-
-    logger.info(f'raw results:{raw_results}')
-
-    results = {
-        'silence_chunks': [convert_silence_to_dict(seg) for seg in raw_results['silencedetect']]
-    }
-    if raw_results['volumedetect']:
-        results['volume'] = convert_volume_to_dict(raw_results['volumedetect'])
+    if AUDIO_ENGINE not in AUDIO_ENGINES:
+        raise ValueError(f'Invalid audio engine: {AUDIO_ENGINE} (Valid: {", ".join(AUDIO_ENGINES)})')
+    execute_audio_analysis = AUDIO_ENGINES[AUDIO_ENGINE]
+    analysis_args = {'threshold': SILENCE_THRESHOLD, 'duration': SILENCE_DURATION}
+    if AUDIO_ENGINE == 'ffmpeg':
+        # the numpy engine measures the edge silence on its own
+        analysis_args['edge_duration'] = SILENCE_EDGE_DURATION
 
-    return results
+    if SEGMENT_INPUT_MODE == 'stream':
+        raw_results = execute_audio_analysis(
+            None, input_stream=open_s3_stream(s3_bucket, segment_s3_key), **analysis_args
+        )
+    else:
+        # the cleanup_dir decorator will ensure the tmp/ working directory gets cleaned up if lambda container is reused
+        input_file = download_file_from_s3(s3_bucket, segment_s3_key)
 
+        raw_results = execute_audio_analysis(input_file, **analysis_args)
 
-def convert_volume_to_dict(vol):
-    mean_vol, max_vol = vol
-    return {'mean': mean_vol, 'max': max_vol}
-
+    logger.info(f'raw results:{raw_results}')
 
-def convert_silence_to_dict(silence):
-    start, end = silence
-    return {'start': start, 'end': end}
+    return convert_audio_results(raw_results['volumedetect'], raw_results['silencedetect'],
+                                 raw_results.get('astats'), raw_results.get('ebur128'), raw_results.get('edges'),
+                                 raw_results.get('edge_chunks'))
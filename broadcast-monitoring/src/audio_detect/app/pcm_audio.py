@@ -0,0 +1,283 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import os
+import struct
+import subprocess
+import sys
+
+import numpy as np
+
+# Conditionally add /opt to the PYTHON PATH
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
+
+from common.config import LOG_LEVEL
+from common.utils import Timer, stream_to_process
+
+"""
+In-process audio analysis engine. ffmpeg only decodes the first audio stream to 16 bit PCM, which is read from its
+stdout into a NumPy array. Volume, silence and loudness are computed over the samples instead of parsing the
+volumedetect/silencedetect/astats/ebur128 log output. The samples are written in a wav container so the channel
+count and the sample rate come with the data.
+"""
+
+logger = logging.getLogger('PCMAudio')
+logger.setLevel(LOG_LEVEL)
+
+DEFAULT_THRESHOLD = '-60dB'  # silence threshold in dB, or as an amplitude ratio
+DEFAULT_DURATION = 2  # silence duration in seconds
+# length of the windows the RMS is computed over to find silence
+WINDOW_SEC = 0.01
+
+# ITU-R BS.1770 loudness: 400ms gating blocks (momentary) and 3s short-term windows, both updated every 100ms
+LOUDNESS_BLOCK_SEC = 0.4
+SHORT_TERM_SEC = 3.0
+LOUDNESS_STEP_SEC = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# weight of each channel for the common layouts, in ffmpeg's channel order. LFE is left out, surrounds weigh 1.41
+CHANNEL_WEIGHTS = {
+    6: [1.0, 1.0, 1.0, 0.0, 1.41, 1.41],  # 5.1
+    8: [1.0, 1.0, 1.0, 0.0, 1.41, 1.41, 1.41, 1.41]  # 7.1
+}
+
+PCM_FULL_SCALE = 32768.0
+# power of a single LSB of 16 bit audio. digital silence is reported at this level instead of -inf
+MIN_POWER = (1 / PCM_FULL_SCALE) ** 2
+
+
+def decode_pcm(input_file, input_stream=None, ffmpeg_cmd='ffmpeg'):
+    """
+    Decode the first audio stream to 16 bit PCM with ffmpeg
+    :param input_file: path of the media file. Ignored if input_stream is given
+    :param input_stream: file-like object to pipe into ffmpeg, e.g. a s3 StreamingBody
+    :return: (samples as an int16 array of shape (number of samples, channels), sample rate)
+    """
+    command = [ffmpeg_cmd, '-nostdin', '-hide_banner', '-i', 'pipe:0' if input_stream is not None else input_file,
+               '-map', '0:a:0', '-map_metadata', '-1', '-acodec', 'pcm_s16le', '-f', 'wav', 'pipe:1']
+    logger.info(f'ffmpeg command: {command}')
+    timer = Timer('decode audio to pcm', logger_fn=logger.info)
+    timer.tic()
+    if input_stream is not None:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = stream_to_process(process, input_stream)
+    else:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.stdout, process.stderr
+    timer.toc()
+    if process.returncode:
+        logger.error('ffmpeg failed: %s', stderr.decode('utf-8', errors='replace'))
+        raise RuntimeError(f'ffmpeg exited with code {process.returncode}')
+    return parse_wav(stdout)
+
+
+def parse_wav(data):
+    """
+    Read the samples of a 16 bit PCM wav. ffmpeg can't seek back to fill in the chunk sizes when writing to a pipe,
+    so the data chunk is taken to run until the end of the buffer.
+    :return: (samples as an int16 array of shape (number of samples, channels), sample rate)
+    """
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError('Not a wav file')
+    channels = sample_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', data, offset)
+        if chunk_id == b'fmt ':
+            channels, sample_rate = struct.unpack_from('<HI', data, offset + 10)
+        elif chunk_id == b'data':
+            if channels is None:
+                raise ValueError('wav data chunk before fmt chunk')
+            pcm = np.frombuffer(data, dtype='<i2', count=(len(data) - offset - 8) // 2, offset=offset + 8)
+            pcm = pcm[:len(pcm) - len(pcm) % channels]
+            return pcm.reshape((-1, channels)), sample_rate
+        # chunks are padded to an even size
+        offset += 8 + chunk_size + chunk_size % 2
+    raise ValueError('No data chunk in wav')
+
+
+def parse_threshold(threshold):
+    """Convert a silencedetect noise threshold, e.g. '-60dB' or 0.001, to an amplitude ratio"""
+    if isinstance(threshold, str) and threshold.lower().endswith('db'):
+        return 10 ** (float(threshold[:-2]) / 20)
+    return float(threshold)
+
+
+def power_to_db(power):
+    return round(float(10 * np.log10(max(power, MIN_POWER))), 1)
+
+
+def measure_volume(samples):
+    """
+    Mean (RMS) and max (peak) volume in dB, the same measures as volumedetect
+    :param samples: float array of shape (number of samples, channels), normalized to [-1, 1]
+    :return: (mean, max) overall, and a list of (mean, max) for each channel
+    """
+    channel_power = np.mean(np.square(samples, dtype=np.float64), axis=0)
+    channel_peak = np.max(np.abs(samples), axis=0)
+    channels = [(power_to_db(power), power_to_db(peak ** 2)) for power, peak in zip(channel_power, channel_peak)]
+    return (power_to_db(np.mean(channel_power)), power_to_db(np.max(channel_peak) ** 2)), channels
+
+
+def biquad_response(b, a, z):
+    """Frequency response of a biquad filter at the points z on the unit circle"""
+    return (b[0] + b[1] / z + b[2] / z ** 2) / (a[0] + a[1] / z + a[2] / z ** 2)
+
+
+def k_weighting_response(num_bins, nfft, sample_rate):
+    """
+    Frequency response of the BS.1770 K-weighting filter (high shelf, then high pass), for each rfft bin.
+    The biquads are derived for the sample rate from the analog prototype of the 48kHz coefficients in the standard,
+    the same way libebur128 (and the ffmpeg ebur128 filter) does.
+    """
+    z = np.exp(2j * np.pi * np.arange(num_bins) / nfft)
+
+    # stage 1: high shelf, +4dB above ~1.7kHz, models the acoustic effect of the head
+    gain_db, q, fc = 3.999843853973347, 0.7071752369554196, 1681.974450955533
+    k = np.tan(np.pi * fc / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    # stage 2: RLB high pass at ~38Hz
+    q, fc = 0.5003270373238773, 38.13547087602444
+    k = np.tan(np.pi * fc / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass_b = [1.0, -2.0, 1.0]
+    high_pass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return biquad_response(shelf_b, shelf_a, z) * biquad_response(high_pass_b, high_pass_a, z)
+
+
+def k_weight(samples, sample_rate):
+    """
+    Apply the K-weighting filter to every channel. The filter is applied in the frequency domain over the whole
+    segment, zero padded so the filter response doesn't wrap around.
+    """
+    num_samples = len(samples)
+    nfft = 1 << int(np.ceil(np.log2(2 * num_samples)))
+    spectrum = np.fft.rfft(samples, nfft, axis=0)
+    spectrum *= k_weighting_response(len(spectrum), nfft, sample_rate)[:, None]
+    return np.fft.irfft(spectrum, nfft, axis=0)[:num_samples]
+
+
+def power_to_lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, MIN_POWER))
+
+
+def measure_loudness(samples, sample_rate):
+    """
+    EBU R128 integrated loudness and the max short-term loudness
+    :param samples: float array of shape (number of samples, channels), normalized to [-1, 1]
+    :return: (integrated, max short-term) in LUFS. max short-term is None if the audio is shorter than 3 seconds
+    """
+    num_samples, num_channels = samples.shape
+    weights = np.array(CHANNEL_WEIGHTS.get(num_channels, [1.0] * num_channels))
+    weighted = k_weight(samples, sample_rate)
+    # running sum of the squared samples to get the power of any window without summing it again
+    energy = np.concatenate((np.zeros((1, num_channels)), np.cumsum(np.square(weighted), axis=0)))
+    step = int(round(LOUDNESS_STEP_SEC * sample_rate))
+
+    def window_power(window_sec):
+        window = int(round(window_sec * sample_rate))
+        starts = np.arange(0, num_samples - window + 1, step)
+        # channel weighted sum of the mean square of each window
+        return ((energy[starts + window] - energy[starts]) / window) @ weights
+
+    block_power = window_power(LOUDNESS_BLOCK_SEC)
+    block_power = block_power[power_to_lufs(block_power) > ABSOLUTE_GATE_LUFS]
+    integrated = ABSOLUTE_GATE_LUFS
+    if len(block_power):
+        relative_gate = power_to_lufs(np.mean(block_power)) + RELATIVE_GATE_LU
+        integrated = power_to_lufs(np.mean(block_power[power_to_lufs(block_power) > relative_gate]))
+
+    short_term_power = window_power(SHORT_TERM_SEC)
+    short_term_max = round(float(power_to_lufs(np.max(short_term_power))), 1) if len(short_term_power) else None
+    return round(float(integrated), 1), short_term_max
+
+
+def silent_runs(samples, sample_rate, threshold=DEFAULT_THRESHOLD, window_sec=WINDOW_SEC):
+    """
+    Find the runs of consecutive windows where the RMS of every channel is below the threshold
+    :param samples: float array of shape (number of samples, channels), normalized to [-1, 1]
+    :return: list of (start, end) tuples in seconds, the last run ends at the last sample
+    """
+    num_samples = len(samples)
+    window = max(1, int(round(sample_rate * window_sec)))
+    window_starts = np.arange(0, num_samples, window)
+    window_lengths = np.diff(np.append(window_starts, num_samples))
+    # mean square of each window for each channel, shape (number of windows, channels)
+    window_power = np.add.reduceat(np.square(samples, dtype=np.float64), window_starts, axis=0)
+    window_power /= window_lengths[:, None]
+    silent = np.all(window_power < parse_threshold(threshold) ** 2, axis=1)
+
+    # edges of the runs of silent windows
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+    return [(window_starts[run_start] / sample_rate, min(run_end * window, num_samples) / sample_rate)
+            for run_start, run_end in zip(run_starts, run_ends)]
+
+
+def find_silence(samples, sample_rate, threshold=DEFAULT_THRESHOLD, duration=DEFAULT_DURATION,
+                 window_sec=WINDOW_SEC):
+    """
+    Find the sections where the RMS of every channel stays below the threshold for at least duration seconds.
+    Silence running until the end of the samples is reported ending at the last sample.
+    :param samples: float array of shape (number of samples, channels), normalized to [-1, 1]
+    :return: list of (start, end) tuples in seconds
+    """
+    return [(round(start, 6), round(end, 6)) for start, end in silent_runs(samples, sample_rate, threshold, window_sec)
+            if end - start >= float(duration)]
+
+
+def find_edge_silence(samples, sample_rate, threshold=DEFAULT_THRESHOLD, window_sec=WINDOW_SEC):
+    """
+    Silence at the very start and end of the samples, however short. Used to join silence across segments.
+    :return: (leading, trailing) in seconds
+    """
+    runs = silent_runs(samples, sample_rate, threshold, window_sec)
+    audio_duration = len(samples) / sample_rate
+    leading = runs[0][1] if runs and runs[0][0] == 0 else 0.0
+    trailing = audio_duration - runs[-1][0] if runs and runs[-1][1] >= audio_duration else 0.0
+    return round(leading, 6), round(trailing, 6)
+
+
+def analyze_pcm(pcm, sample_rate, threshold=DEFAULT_THRESHOLD, duration=DEFAULT_DURATION):
+    """
+    Compute volume, silence, the volume of each channel and loudness over 16 bit PCM samples
+    :param pcm: int16 array of shape (number of samples, channels)
+    :return: a dict in the same form as audio_detect.execute_ffmpeg, plus the (leading, trailing) silence under 'edges'
+    """
+    if len(pcm) == 0:
+        logger.warning('No audio samples decoded')
+        return {'volumedetect': None, 'silencedetect': [], 'astats': [], 'ebur128': None, 'edges': None}
+
+    samples = pcm.astype(np.float32) / PCM_FULL_SCALE
+    volume, channels = measure_volume(samples)
+    return {
+        'volumedetect': volume,
+        'silencedetect': find_silence(samples, sample_rate, threshold, duration),
+        'astats': channels,
+        'ebur128': measure_loudness(samples, sample_rate),
+        'edges': find_edge_silence(samples, sample_rate, threshold)
+    }
+
+
+def execute_pcm_analysis(input_file, input_stream=None, threshold=DEFAULT_THRESHOLD, duration=DEFAULT_DURATION):
+    """
+    Decode the audio once and compute all the measures in process
+    :return: a dict in the same form as audio_detect.execute_ffmpeg
+    """
+    pcm, sample_rate = decode_pcm(input_file, input_stream=input_stream)
+    logger.info(f'Decoded {len(pcm)} samples, {pcm.shape[1]} channels at {sample_rate} Hz')
+    timer = Timer('pcm analysis', logger_fn=logger.info)
+    timer.tic()
+    results = analyze_pcm(pcm, sample_rate, threshold, duration)
+    timer.toc()
+    return results
@@ -0,0 +1,103 @@
+import io
+import struct
+import wave
+
+import numpy as np
+import pytest
+
+from ..app.pcm_audio import analyze_pcm, find_edge_silence, find_silence, measure_loudness, parse_threshold, parse_wav
+
+SAMPLE_RATE = 8000
+
+
+def tone(seconds, amplitude=0.5, frequency=440):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+def to_wav(pcm):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(pcm.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def test_parse_wav():
+    pcm = np.stack([tone(0.5), silence(0.5)], axis=1)
+    samples, sample_rate = parse_wav(to_wav(pcm))
+    assert sample_rate == SAMPLE_RATE
+    assert np.array_equal(samples, pcm)
+
+
+def test_parse_wav_from_pipe():
+    # ffmpeg writing to a pipe leaves the placeholder sizes in the header
+    pcm = np.stack([tone(0.5), tone(0.5)], axis=1)
+    data = bytearray(to_wav(pcm))
+    struct.pack_into('<I', data, 4, 0xFFFFFFFF)
+    struct.pack_into('<I', data, 40, 0xFFFFFFFF)
+    samples, _ = parse_wav(bytes(data))
+    assert np.array_equal(samples, pcm)
+
+    with pytest.raises(ValueError):
+        parse_wav(b'not a wav file')
+
+
+def test_parse_threshold():
+    assert parse_threshold('-60dB') == pytest.approx(0.001)
+    assert parse_threshold(0.01) == 0.01
+
+
+def test_analyze_pcm():
+    left = np.concatenate([tone(1), silence(2.5), tone(1)])
+    # right channel is silent for longer, but silence requires every channel to be silent
+    right = np.concatenate([tone(1), silence(3.5)])
+    results = analyze_pcm(np.stack([left, right], axis=1), SAMPLE_RATE, threshold='-60dB', duration=2)
+
+    assert results['silencedetect'] == [(1.0, 3.5)]
+    mean, max = results['volumedetect']
+    assert max == pytest.approx(-6.0, abs=0.1)
+    # a sine wave's RMS is 3dB below its peak
+    left_volume, right_volume = results['astats']
+    assert left_volume == (pytest.approx(-9.0 + 10 * np.log10(2 / 4.5), abs=0.1), pytest.approx(-6.0, abs=0.1))
+    assert right_volume[0] < left_volume[0]
+
+
+def test_find_silence_until_end():
+    samples = np.concatenate([tone(1), silence(1.5)]).reshape((-1, 1)) / 32768.0
+    assert find_silence(samples, SAMPLE_RATE, duration=1) == [(1.0, 2.5)]
+    assert find_silence(samples, SAMPLE_RATE, duration=2) == []
+
+
+def test_find_edge_silence():
+    samples = np.concatenate([silence(0.3), tone(1), silence(0.5)]).reshape((-1, 1)) / 32768.0
+    # shorter than the silence duration, still reported
+    assert find_edge_silence(samples, SAMPLE_RATE) == (0.3, 0.5)
+    assert find_edge_silence(tone(1).reshape((-1, 1)) / 32768.0, SAMPLE_RATE) == (0.0, 0.0)
+
+
+def test_analyze_pcm_without_samples():
+    results = analyze_pcm(np.zeros((0, 2), dtype=np.int16), SAMPLE_RATE)
+    assert results == {'volumedetect': None, 'silencedetect': [], 'astats': [], 'ebur128': None, 'edges': None}
+
+
+def test_measure_loudness():
+    # a 1kHz sine in one channel reads 3.01 dB below its peak level (BS.1770)
+    t = np.arange(4 * 48000) / 48000
+    sine = 0.1 * np.sin(2 * np.pi * 1000 * t)
+    integrated, short_term_max = measure_loudness(sine.reshape((-1, 1)), 48000)
+    assert integrated == pytest.approx(-23.0, abs=0.1)
+    assert short_term_max == pytest.approx(-23.0, abs=0.1)
+
+    # same in both channels adds up
+    integrated, _ = measure_loudness(np.stack([sine, sine], axis=1), 48000)
+    assert integrated == pytest.approx(-20.0, abs=0.1)
+
+    # shorter than a short-term window, and silence is below the absolute gate
+    assert measure_loudness(np.zeros((48000, 2)), 48000) == (-70.0, None)
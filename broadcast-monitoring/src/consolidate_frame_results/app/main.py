@@ -12,8 +12,8 @@ import boto3
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.config import DDB_FRAME_TABLE, DDB_FRAGMENT_TABLE, LOG_LEVEL
-from common.utils import DDBUpdateBuilder, get_item_ddb, convert_from_ddb, convert_to_ddb
+from common.config import DDB_FRAME_TABLE, LOG_LEVEL
+from common.utils import DDBBatchWriter, batch_get_items_ddb, convert_from_ddb, convert_to_ddb
 
 from checks import station_logo_check, team_text_check, calculate_team_confidence, sports_check
 
@@ -79,9 +79,17 @@ def consolidate_fragment_lambda_handler(event, context):
       ]
     }
     :param context: lambda environment context
-    :return: None.  This step will write its results to DynamoDB
+    :return: the frames and the segment results of the checks, written to DynamoDB by the Consolidate step
+    {
+      "frames": [ ...same as the input frames ],
+      "statuses": {
+        "Station_Status": true,
+        "Team_Status": true,
+        ...
+      }
+    }
     """
-    logger.info("DDB Frame Table: %s | DDB Fragment Table: %s", DDB_FRAME_TABLE, DDB_FRAGMENT_TABLE)
+    logger.info("DDB Frame Table: %s", DDB_FRAME_TABLE)
     config = event['config']
     stream_id = event['parsed']['streamId']
     segment_start_dt = event['parsed']['lastSegment']['startDateTime']
@@ -93,37 +101,30 @@ def consolidate_fragment_lambda_handler(event, context):
     active_configs = {k for k, v in config.items() if v}
     active_checks = [check for check in frame_checks if set(check.config_names).issubset(active_configs)]
 
+    result = {'frames': event['frames'], 'statuses': {}}
+
     # test if any of the frame configs are active
     if not active_checks:
         logger.info('No active configurations to process.  Exiting frame consolidation')
-        return
+        return result
 
     # build a list of attributes to retrieve from DDB from the active checks
-    data_attributes = ', '.join({attr for check in active_checks for attr in check.ddb_attrs})
-    frame_data = []
+    data_attributes = sorted({attr for check in active_checks for attr in check.ddb_attrs})
 
-    # get ddb attributes for each frame
-    for frame in event['frames']:
-        item = get_item_ddb(
-            Key={'Stream_ID': frame['Stream_ID'], 'DateTime': frame['DateTime']},
-            table_name=DDB_FRAME_TABLE,
-            ProjectionExpression=data_attributes,
-            ddb_client=dynamodb
-        )
+    # get ddb attributes of all the frames at once
+    frame_data = batch_get_items_ddb(
+        DDB_FRAME_TABLE,
+        frame_keys(event['frames']),
+        ddb_client=dynamodb,
+        projection_attrs=data_attributes
+    )
 
-        frame_data.append(item)
+    # results of each check, passed on to be written with the rest of the segment row
+    result['statuses'] = dict(check_processing_helper(active_checks, frame_data))
 
-    # update ddb row with results of each check
-    with DDBUpdateBuilder(
-            key={'Start_DateTime': segment_start_dt, 'Stream_ID': stream_id},
-            table_name=DDB_FRAGMENT_TABLE,
-            ddb_client=dynamodb
-    ) as ddb_update_builder:
-        # write attributes to the segment row from each check
-        for result_name, result_data in check_processing_helper(active_checks, frame_data):
-            ddb_update_builder.update_attr(result_name, result_data)
-
-    logger.info('%d frame checks completed', len(active_checks))
+    logger.info('%d frame checks completed for segment %s of %s: %s', len(active_checks), segment_start_dt, stream_id,
+                result['statuses'])
+    return result
 
 
 def consolidate_team_data_lambda_handler(event, context):
@@ -174,34 +175,20 @@ def consolidate_team_data_lambda_handler(event, context):
         logger.info('No team configurations active. Exiting frame consolidation')
         return
 
-    # build a list of attributes to retrieve from DDB from the active checks
-    data_attributes = ', '.join(calculate_team_confidence.ddb_attrs)
-
-    # get ddb attributes for each frame
-    for frame in event['frames']:
-        s3_key = frame['S3_Key']
-        frame_key = {'Stream_ID': frame['Stream_ID'], 'DateTime': frame['DateTime']}
-        # get stored data for the frame to process
-        frame_data = get_item_ddb(
-            Key=frame_key,
-            table_name=DDB_FRAME_TABLE,
-            ProjectionExpression=data_attributes,
-            ddb_update_builder=dynamodb
-        )
-
-        converted_data = convert_from_ddb(frame_data)
-
-        # update ddb row with results of each check
-        with DDBUpdateBuilder(
-            key=frame_key,
-            table_name=DDB_FRAME_TABLE,
-            ddb_client=dynamodb
-        ) as ddb_update_builder:
-            # write attributes to the segment row from each check
-            for result_name, result_data in consolidate_team_confidence(converted_data):
-                ddb_update_builder.update_attr(result_name, result_data, convert_to_ddb)
-
-        logger.info('Team data consolidated for frame: %s', s3_key)
+    # get the whole frame items at once: they're written back with the team results in batches
+    frames = batch_get_items_ddb(DDB_FRAME_TABLE, frame_keys(event['frames']), ddb_client=dynamodb)
+
+    with DDBBatchWriter(DDB_FRAME_TABLE, ddb_client=dynamodb) as writer:
+        for frame in frames:
+            converted_data = convert_from_ddb(frame)
+            converted_data.update(dict(consolidate_team_confidence(converted_data)))
+            writer.put_item(convert_to_ddb(converted_data))
+
+    logger.info('Team data consolidated for %d frames', len(frames))
+
+
+def frame_keys(frames):
+    return [{'Stream_ID': frame['Stream_ID'], 'DateTime': frame['DateTime']} for frame in frames]
 
 
 def check_processing_helper(checks, frame_data):
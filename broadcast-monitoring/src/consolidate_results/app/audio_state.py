@@ -0,0 +1,153 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import os
+import sys
+from collections import namedtuple
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+
+# Conditionally add /opt to the PYTHON PATH for lambda layer
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
+
+from common.config import LOG_LEVEL, DDB_AUDIO_STATE_TABLE, SEGMENT_GAP_TOLERANCE_SEC, UTC_TIME_FMT
+from common.utils import dynamodb, convert_to_ddb, parse_date_time_from_str
+
+logger = logging.getLogger('AudioState')
+logger.setLevel(LOG_LEVEL)
+
+# a silence chunk this close to the start or end of the segment is taken to continue across the boundary
+EDGE_TOLERANCE_SEC = 0.1
+
+SegmentSilence = namedtuple('SegmentSilence', ['duration', 'boundary', 'trailing'])
+
+
+def edge_silence(audio, segment_duration, tolerance=EDGE_TOLERANCE_SEC):
+    """
+    Silence at the start and at the end of the segment, including silence shorter than the silencedetect duration.
+    The numpy audio engine measures it directly. Otherwise it's taken from the silence chunks touching the edges,
+    and from the shorter edge silence chunks the ffmpeg engine reports with SILENCE_EDGE_DURATION.
+    :return: (leading, trailing) in seconds
+    """
+    if 'edge_silence' in audio:
+        return audio['edge_silence']['leading'], audio['edge_silence']['trailing']
+    leading = trailing = 0.0
+    for chunk in audio['silence_chunks'] + audio.get('edge_silence_chunks', []):
+        if chunk['start'] <= tolerance:
+            leading = max(leading, chunk['end'])
+        if chunk['end'] >= segment_duration - tolerance:
+            trailing = max(trailing, segment_duration - chunk['start'])
+    return leading, trailing
+
+
+def stitch_silence(audio, segment_duration, carried_silence, min_duration, tolerance=EDGE_TOLERANCE_SEC):
+    """
+    Join the silence at the start of the segment with the silence carried over from the end of the previous segment.
+    Silence too short for silencedetect on either side of the boundary counts when the two together are long enough.
+    :param carried_silence: trailing silence of the previous segment, 0 if the segments aren't contiguous
+    :param min_duration: minimum duration of a silence, same as the silencedetect duration
+    :return: SegmentSilence with the silence duration within this segment, the duration of the silence spanning
+     the boundary with the previous segment (0 if none) and the trailing silence to carry over to the next segment
+    """
+    silence_duration = sum([chunk['end'] - chunk['start'] for chunk in audio['silence_chunks']])
+    leading, trailing = edge_silence(audio, segment_duration, tolerance)
+
+    boundary = 0.0
+    if carried_silence > 0 and leading > 0 and carried_silence + leading >= min_duration:
+        boundary = carried_silence + leading
+        if not any(chunk['start'] <= tolerance for chunk in audio['silence_chunks']):
+            # not detected as a chunk on its own
+            silence_duration += leading
+
+    if leading >= segment_duration - tolerance:
+        # silent throughout, the silence carried over keeps going
+        trailing = carried_silence + segment_duration
+    return SegmentSilence(silence_duration, boundary, trailing)
+
+
+class StreamAudioState(object):
+    """
+    Compact per stream record of the recent audio, carried between executions of the state machine: the trailing
+    silence of the last processed segment and the duration and silence of the segments within the status window.
+    Executions of the same stream may overlap, so the record only moves forward in time.
+    """
+
+    def __init__(self, stream_id, table_name=DDB_AUDIO_STATE_TABLE, ddb_client=None):
+        self.stream_id = stream_id
+        self.table_name = table_name
+        self.table = (ddb_client or dynamodb).Table(table_name)
+        self.last_start = None
+        self.last_end = None
+        self.trailing_silence = 0.0
+        self.window = []
+
+    def load(self):
+        try:
+            item = self.table.get_item(Key={'Stream_ID': self.stream_id}).get('Item')
+        except ClientError as e:
+            logger.error(f'Error getting audio state of {self.stream_id} from {self.table_name}', exc_info=True)
+            raise e
+        if item:
+            self.last_start = parse_date_time_from_str(item['Last_Start_DateTime'])
+            self.last_end = parse_date_time_from_str(item['Last_End_DateTime'])
+            self.trailing_silence = float(item['Trailing_Silence_Sec'])
+            self.window = [{'Start_DateTime': segment['Start_DateTime'],
+                            'Duration_Sec': float(segment['Duration_Sec']),
+                            'Silence_Sec': float(segment['Silence_Sec'])} for segment in item.get('Window', [])]
+        return self
+
+    def carried_silence(self, segment_start):
+        """Trailing silence of the last processed segment if the segment starting at segment_start follows it"""
+        if self.last_end is None:
+            return 0.0
+        if abs((segment_start - self.last_end).total_seconds()) > SEGMENT_GAP_TOLERANCE_SEC:
+            logger.info(f'Segment at {segment_start} does not follow the last one ending at {self.last_end}')
+            return 0.0
+        return self.trailing_silence
+
+    def window_totals(self, segment_start, window_sec):
+        """
+        Duration and silence of the earlier segments starting within window_sec before segment_start
+        :return: (duration, silence) in seconds
+        """
+        window_start = segment_start - timedelta(seconds=window_sec)
+        segments = [segment for segment in self.window
+                    if window_start <= parse_date_time_from_str(segment['Start_DateTime']) < segment_start]
+        return sum(s['Duration_Sec'] for s in segments), sum(s['Silence_Sec'] for s in segments)
+
+    def save(self, segment_start, segment_duration, silence_duration, trailing_silence, window_sec):
+        """Record the segment, unless a later segment of the stream was already recorded"""
+        segment_end = segment_start + timedelta(seconds=segment_duration)
+        window_start = segment_end - timedelta(seconds=window_sec)
+        window = [segment for segment in self.window
+                  if window_start <= parse_date_time_from_str(segment['Start_DateTime']) < segment_start]
+        window.append({'Start_DateTime': segment_start.strftime(UTC_TIME_FMT),
+                       'Duration_Sec': segment_duration,
+                       'Silence_Sec': silence_duration})
+        item = {
+            'Stream_ID': self.stream_id,
+            'Last_Start_DateTime': segment_start.strftime(UTC_TIME_FMT),
+            'Last_End_DateTime': segment_end.strftime(UTC_TIME_FMT),
+            'Trailing_Silence_Sec': trailing_silence,
+            'Window': window
+        }
+        try:
+            self.table.put_item(
+                Item=convert_to_ddb(item),
+                ConditionExpression='attribute_not_exists(Stream_ID) OR Last_Start_DateTime < :start',
+                ExpressionAttributeValues={':start': item['Last_Start_DateTime']}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info(f'Audio state of {self.stream_id} already has a later segment than {segment_start}')
+                return
+            logger.error(f'Error saving audio state of {self.stream_id} to {self.table_name}', exc_info=True)
+            raise e
+        self.last_start = segment_start
+        self.last_end = segment_end
+        self.trailing_silence = trailing_silence
+        self.window = window
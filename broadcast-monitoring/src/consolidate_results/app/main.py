@@ -11,9 +11,15 @@ import json
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.utils import convert_float_to_dec, convert_dict_float_to_dec, check_enabled, DDBUpdateBuilder, get_item_ddb
+from common.utils import convert_float_to_dec, convert_to_ddb, check_enabled, DDBUpdateBuilder, \
+    parse_date_time_from_str
 from common.config import (LOG_LEVEL, DDB_FRAGMENT_TABLE, STATION_LOGO_CHECK_CONFIG_KEY, TEAM_CHECK_CONFIG_KEY,
-                           SPORTS_CHECK_CONFIG_KEY)
+                           SPORTS_CHECK_CONFIG_KEY, SILENCE_DURATION, AUDIO_STATUS_WINDOW_SEC)
+
+try:
+    from .audio_state import StreamAudioState, stitch_silence
+except ImportError:
+    from audio_state import StreamAudioState, stitch_silence
 
 logging.basicConfig()
 logger = logging.getLogger('FindExpectedProgramMain')
@@ -75,7 +81,14 @@ def lambda_handler(event, context):
                  "confidence": 0.8843594193458557
              }
            },
-          []
+          {
+            "frames": [...],
+            "statuses": {
+              "Station_Status": true,
+              "Team_Status": true,
+              ...
+            }
+          }
         ]
       }
     }
@@ -85,19 +98,29 @@ def lambda_handler(event, context):
     segment_start_dt = event['parsed']['lastSegment']['startDateTime']
     stream_id = event['parsed']['streamId']
     segment_relative_start_time = event['parsed']['lastSegment']['startTimeRelative']
-    segment_start_time_in_loop = event['parsed']['expectedProgram']['Segment_Start_Time_In_Loop']
+    # a live input doesn't loop: its segments have the epoch seconds the program was looked up with instead
+    segment_start_time_in_loop = event['parsed']['expectedProgram'].get('Segment_Start_Time_In_Loop')
+    segment_start_epoch_sec = event['parsed']['expectedProgram'].get('Segment_Start_Epoch_Sec')
     segment_duration = event['parsed']['lastSegment']['durationSec']
 
     segment_table_key = {'Start_DateTime': segment_start_dt, 'Stream_ID': stream_id}
     with DDBUpdateBuilder(key=segment_table_key, table_name=DDB_FRAGMENT_TABLE) as ddb_update_builder:
-        ddb_update_builder.update_attr('Start_Time_Sec', convert_float_to_dec(segment_relative_start_time))
-        ddb_update_builder.update_attr('Start_Time_Sec_In_Loop', convert_float_to_dec(segment_start_time_in_loop))
+        # the relative start time isn't probed for live inputs
+        if segment_relative_start_time is not None:
+            ddb_update_builder.update_attr('Start_Time_Sec', convert_float_to_dec(segment_relative_start_time))
+        if segment_start_time_in_loop is not None:
+            ddb_update_builder.update_attr('Start_Time_Sec_In_Loop', convert_float_to_dec(segment_start_time_in_loop))
+        if segment_start_epoch_sec is not None:
+            ddb_update_builder.update_attr('Start_Epoch_Sec', convert_float_to_dec(segment_start_epoch_sec))
         ddb_update_builder.update_attr('Finished', True)
 
         audio_on_status = process_audio_check(event, ddb_update_builder, segment_duration)
-        station_status = get_station_logo_status(event, segment_table_key)
-        team_status = get_team_status(event, segment_table_key)
-        sports_status = get_sports_status(event, segment_table_key)
+        # results of the frame checks, computed by the frame branch of the state machine
+        for name, value in frame_statuses(event).items():
+            ddb_update_builder.update_attr(name, value, convert_to_ddb)
+        station_status = get_station_logo_status(event)
+        team_status = get_team_status(event)
+        sports_status = get_sports_status(event)
     status_summary = {
         'Audio_Status': audio_on_status,
         'Station_Status': station_status,
@@ -105,7 +128,7 @@ def lambda_handler(event, context):
         'Sports_Status': sports_status
     }
 
-    frames = event['detections'][FRAME_RESULT]
+    frames = event['detections'][FRAME_RESULT]['frames']
     thumbnail_s3_key = frames[0]['S3_Key']
 
     event['thumbnailKey'] = thumbnail_s3_key
@@ -113,31 +136,23 @@ def lambda_handler(event, context):
     return event
 
 
+def frame_statuses(event):
+    return event['detections'][FRAME_RESULT].get('statuses', {})
+
+
 @check_enabled(STATION_LOGO_CHECK_CONFIG_KEY)
-def get_station_logo_status(event, segment_table_key):
-    # TODO: modify the state machine so this result get passed from previous processing to save a call to DDB
-    item = get_item_ddb(
-        table_name=DDB_FRAGMENT_TABLE, Key=segment_table_key, AttributesToGet=['Station_Status']
-    )
-    return item.get('Station_Status', None)
+def get_station_logo_status(event):
+    return frame_statuses(event).get('Station_Status', None)
 
 
 @check_enabled(TEAM_CHECK_CONFIG_KEY)
-def get_team_status(event, segment_table_key):
-    # TODO: modify the state machine so this result get passed from previous processing to save a call to DDB
-    item = get_item_ddb(
-        table_name=DDB_FRAGMENT_TABLE, Key=segment_table_key, AttributesToGet=['Team_Status']
-    )
-    return item.get('Team_Status', None)
+def get_team_status(event):
+    return frame_statuses(event).get('Team_Status', None)
 
 
 @check_enabled(SPORTS_CHECK_CONFIG_KEY)
-def get_sports_status(event, segment_table_key):
-    # TODO: modify the state machine so this result get passed from previous processing to save a call to DDB
-    item = get_item_ddb(
-        table_name=DDB_FRAGMENT_TABLE, Key=segment_table_key, AttributesToGet=['Sports_Status']
-    )
-    return item.get('Sports_Status', None)
+def get_sports_status(event):
+    return frame_statuses(event).get('Sports_Status', None)
 
 
 @check_enabled("audio_check_enabled")
@@ -148,25 +163,41 @@ def process_audio_check(event, ddb_update_builder, segment_duration):
         ddb_update_builder.update_attr('Audio_Check_Error', audio["Error"])
         return None
     # process results for audio detection
-    audio_on_status, silence_duration, silence_confidence = eval_audio_status(audio, segment_duration)
+    stream_id = event['parsed']['streamId']
+    segment_start = parse_date_time_from_str(event['parsed']['lastSegment']['startDateTime'])
+    audio_state = StreamAudioState(stream_id).load()
+    # silence carried over from the previous segment of the stream
+    silence = stitch_silence(audio, segment_duration, audio_state.carried_silence(segment_start),
+                             float(SILENCE_DURATION))
+    window_duration, window_silence = audio_state.window_totals(segment_start, AUDIO_STATUS_WINDOW_SEC)
+    audio_on_status, silence_confidence = eval_audio_status(silence.duration + window_silence,
+                                                            segment_duration + window_duration)
+    audio_state.save(segment_start, segment_duration, silence.duration, silence.trailing, AUDIO_STATUS_WINDOW_SEC)
+
     if 'volume' in audio:
-        ddb_update_builder.update_attr('Volume', convert_dict_float_to_dec(audio['volume']))
+        # volume holds nested per channel and loudness measures
+        ddb_update_builder.update_attr('Volume', convert_to_ddb(audio['volume']))
     ddb_update_builder.update_attr('Silence', json.dumps(audio['silence_chunks']))
     ddb_update_builder.update_attr('Audio_Status', audio_on_status)
-    ddb_update_builder.update_attr('Silence_Duration', convert_float_to_dec(silence_duration))
+    ddb_update_builder.update_attr('Silence_Duration', convert_float_to_dec(silence.duration))
     ddb_update_builder.update_attr('Silence_Confidence', convert_float_to_dec(silence_confidence))
+    if silence.boundary:
+        ddb_update_builder.update_attr('Boundary_Silence_Duration', convert_float_to_dec(silence.boundary))
     logger.info(f'Audio on status: {audio_on_status}')
     return audio_on_status
 
 
-def eval_audio_status(audio, segment_duration):
-    silence_duration = sum([chunk['end'] - chunk['start'] for chunk in audio['silence_chunks']])
-    silence_percentage = silence_duration / segment_duration if segment_duration > 0 else 0
-    logger.info(f'Silence: {silence_duration} / {segment_duration} = {silence_percentage}')
-    # TODO: add support for looking back
+def eval_audio_status(silence_duration, duration):
+    """
+    :param silence_duration: silence within the evaluated duration
+    :param duration: duration of the segment, or of the status window ending with the segment
+    :return: (audio on status, confidence)
+    """
+    silence_percentage = silence_duration / duration if duration > 0 else 0
+    logger.info(f'Silence: {silence_duration} / {duration} = {silence_percentage}')
     audio_on_status = silence_percentage <= 0.5
     silence_confidence = min(100, (0.5 + abs(0.5 - silence_percentage)) * 100.0)
-    return audio_on_status, silence_duration, silence_confidence
+    return audio_on_status, silence_confidence
 
 
 if __name__ == '__main__':
@@ -210,7 +241,12 @@ if __name__ == '__main__':
                 },
                 "silence_chunks": []
             },
-            [{"S3_Key": "frames/test_video_single_pipeline/test_1/original/2020/02/17/23/34:10:919500.jpg"}]
+            {
+                "frames": [
+                    {"S3_Key": "frames/test_video_single_pipeline/test_1/original/2020/02/17/23/34:10:919500.jpg"}
+                ],
+                "statuses": {"Team_Status": True}
+            }
         ]
     }
 
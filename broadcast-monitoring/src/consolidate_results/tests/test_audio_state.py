@@ -0,0 +1,111 @@
+from datetime import datetime
+from decimal import Decimal
+
+import boto3
+import pytest
+from botocore.stub import Stubber, ANY
+from pytest import approx
+
+from ..app.audio_state import StreamAudioState, edge_silence, stitch_silence
+
+SEGMENT_START = datetime(2020, 1, 23, 21, 36, 35, 290000)
+
+
+@pytest.fixture()
+def ddb_stub():
+    ddb = boto3.resource('dynamodb')
+    with Stubber(ddb.meta.client) as stubber:
+        yield ddb, stubber
+        stubber.assert_no_pending_responses()
+
+
+def audio_state_item(last_end, trailing_silence, window):
+    return {
+        'Stream_ID': {'S': 'test_1'},
+        'Last_Start_DateTime': {'S': '2020-01-23T21:36:29.284000Z'},
+        'Last_End_DateTime': {'S': last_end},
+        'Trailing_Silence_Sec': {'N': str(trailing_silence)},
+        'Window': {'L': [{'M': {'Start_DateTime': {'S': start},
+                                'Duration_Sec': {'N': str(duration)},
+                                'Silence_Sec': {'N': str(silence)}}} for start, duration, silence in window]}
+    }
+
+
+def test_edge_silence():
+    audio = {'silence_chunks': [{'start': 0.0, 'end': 1.5}, {'start': 4.5, 'end': 6.0}]}
+    assert edge_silence(audio, 6.0) == (1.5, 1.5)
+    assert edge_silence({'silence_chunks': [{'start': 2.0, 'end': 3.0}]}, 6.0) == (0.0, 0.0)
+    # measured by the numpy audio engine
+    assert edge_silence({'silence_chunks': [], 'edge_silence': {'leading': 0.4, 'trailing': 0.0}}, 6.0) == (0.4, 0.0)
+    # shorter than the silence duration, detected by the ffmpeg audio engine
+    audio = {'silence_chunks': [{'start': 2.0, 'end': 3.5}], 'edge_silence_chunks': [{'start': 5.7, 'end': 6.0}]}
+    assert edge_silence(audio, 6.0) == approx((0.0, 0.3))
+
+
+@pytest.mark.parametrize(
+    'audio, carried_silence, expected', [
+        # silence too short on both sides of the boundary for silencedetect
+        ({'silence_chunks': [], 'edge_silence': {'leading': 0.6, 'trailing': 0.0}}, 0.7, (0.6, 1.3, 0.0)),
+        # not long enough together
+        ({'silence_chunks': [], 'edge_silence': {'leading': 0.2, 'trailing': 0.0}}, 0.3, (0.0, 0.0, 0.0)),
+        # the same, detected by the ffmpeg audio engine
+        ({'silence_chunks': [], 'edge_silence_chunks': [{'start': 0.0, 'end': 0.6}]}, 0.7, (0.6, 1.3, 0.0)),
+        # already detected as a chunk, not counted twice
+        ({'silence_chunks': [{'start': 0.0, 'end': 1.5}]}, 0.7, (1.5, 2.2, 0.0)),
+        # silent throughout, silence keeps going into the next segment
+        ({'silence_chunks': [{'start': 0.0, 'end': 6.0}]}, 2.0, (6.0, 8.0, 8.0)),
+        # nothing carried over
+        ({'silence_chunks': [{'start': 4.0, 'end': 6.0}]}, 0.0, (2.0, 0.0, 2.0)),
+    ]
+)
+def test_stitch_silence(audio, carried_silence, expected):
+    silence = stitch_silence(audio, 6.0, carried_silence, min_duration=1.0)
+    assert (silence.duration, silence.boundary, silence.trailing) == approx(expected)
+
+
+def test_stream_audio_state(ddb_stub):
+    ddb, stubber = ddb_stub
+    window = [('2020-01-23T21:36:05.260000Z', 6.006, 0.0),
+              ('2020-01-23T21:36:23.278000Z', 6.006, 1.0),
+              ('2020-01-23T21:36:29.284000Z', 6.006, 2.5)]
+    stubber.add_response('get_item', {'Item': audio_state_item('2020-01-23T21:36:35.290000Z', 1.25, window)},
+                         {'TableName': 'test', 'Key': {'Stream_ID': 'test_1'}})
+    state = StreamAudioState('test_1', table_name='test', ddb_client=ddb).load()
+
+    assert state.carried_silence(SEGMENT_START) == 1.25
+    # a segment went missing in between
+    assert state.carried_silence(datetime(2020, 1, 23, 21, 36, 41, 296000)) == 0.0
+    # only the segments started within 15 seconds before this one
+    assert state.window_totals(SEGMENT_START, 15) == approx((12.012, 3.5))
+
+    stubber.add_response('put_item', {}, {
+        'TableName': 'test',
+        'Item': {
+            'Stream_ID': 'test_1',
+            'Last_Start_DateTime': '2020-01-23T21:36:35.290000Z',
+            'Last_End_DateTime': '2020-01-23T21:36:41.296000Z',
+            'Trailing_Silence_Sec': Decimal('0.5'),
+            'Window': [
+                {'Start_DateTime': '2020-01-23T21:36:29.284000Z', 'Duration_Sec': Decimal('6.006'),
+                 'Silence_Sec': Decimal('2.5')},
+                {'Start_DateTime': '2020-01-23T21:36:35.290000Z', 'Duration_Sec': Decimal('6.006'),
+                 'Silence_Sec': Decimal('0.5')}
+            ]
+        },
+        'ConditionExpression': ANY,
+        'ExpressionAttributeValues': {':start': '2020-01-23T21:36:35.290000Z'}
+    })
+    state.save(SEGMENT_START, 6.006, 0.5, 0.5, window_sec=15)
+    assert state.carried_silence(datetime(2020, 1, 23, 21, 36, 41, 296000)) == 0.5
+
+
+def test_stream_audio_state_only_moves_forward(ddb_stub):
+    ddb, stubber = ddb_stub
+    stubber.add_response('get_item', {}, {'TableName': 'test', 'Key': {'Stream_ID': 'test_1'}})
+    state = StreamAudioState('test_1', table_name='test', ddb_client=ddb).load()
+    assert state.carried_silence(SEGMENT_START) == 0.0
+    assert state.window_totals(SEGMENT_START, 30) == (0, 0)
+
+    stubber.add_client_error('put_item', service_error_code='ConditionalCheckFailedException')
+    state.save(SEGMENT_START, 6.006, 0.0, 0.0, window_sec=30)
+    assert state.last_end is None
@@ -0,0 +1,85 @@
+import pytest
+from botocore.stub import Stubber, ANY
+
+from common.utils import dynamodb
+from ..app.main import lambda_handler
+
+THUMBNAIL_KEY = 'frames/test_video_single_pipeline/test_1/original/2020/02/17/23/34:10:919500.jpg'
+
+
+@pytest.fixture()
+def ddb_stub():
+    with Stubber(dynamodb.meta.client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_lambda_handler_writes_frame_statuses_in_one_update(ddb_stub):
+    event = {
+        'config': {
+            'audio_check_enabled': False,
+            'station_logo_check_enabled': True,
+            'team_detect_check_enabled': True,
+            'sports_detect_check_enabled': False
+        },
+        'parsed': {
+            'streamId': 'test_1',
+            'lastSegment': {
+                'startDateTime': '2020-02-18T23:34:18.426500Z',
+                'startTimeRelative': 137.435,
+                'durationSec': 7.5075
+            },
+            'expectedProgram': {'Segment_Start_Time_In_Loop': 137.435}
+        },
+        'detections': [
+            {'Error': 'audio disabled'},
+            {
+                'frames': [{'S3_Key': THUMBNAIL_KEY}],
+                'statuses': {'Station_Status': True, 'Team_Status': False, 'Has_Logo_Detect_Error': True}
+            }
+        ]
+    }
+    ddb_stub.add_response('update_item', {}, {
+        'TableName': ANY,
+        'Key': {'Start_DateTime': '2020-02-18T23:34:18.426500Z', 'Stream_ID': 'test_1'},
+        'UpdateExpression': 'set #Start_Time_Sec = :Start_Time_Sec,#Start_Time_Sec_In_Loop = :Start_Time_Sec_In_Loop,'
+                            '#Finished = :Finished,#Station_Status = :Station_Status,#Team_Status = :Team_Status,'
+                            '#Has_Logo_Detect_Error = :Has_Logo_Detect_Error',
+        'ExpressionAttributeNames': ANY,
+        'ExpressionAttributeValues': ANY
+    })
+
+    result = lambda_handler(event, None)
+    assert result['thumbnailKey'] == THUMBNAIL_KEY
+    assert result['statusSummary'] == {
+        'Audio_Status': None,
+        'Station_Status': True,
+        'Team_Status': False,
+        'Sports_Status': None
+    }
+
+
+def test_lambda_handler_live_segment(ddb_stub):
+    event = {
+        'config': {'audio_check_enabled': False},
+        'parsed': {
+            'streamId': 'live_1',
+            'lastSegment': {
+                'startDateTime': '2020-01-23T22:00:01.500000Z',
+                'startTimeRelative': None,
+                'durationSec': 6
+            },
+            'expectedProgram': {'Segment_Start_Epoch_Sec': 1579816801.5}
+        },
+        'detections': [{'Error': 'audio disabled'}, {'frames': [{'S3_Key': THUMBNAIL_KEY}], 'statuses': {}}]
+    }
+    # the epoch seconds don't go in the attribute of the reuse index, which has times in the loop of the input
+    ddb_stub.add_response('update_item', {}, {
+        'TableName': ANY,
+        'Key': {'Start_DateTime': '2020-01-23T22:00:01.500000Z', 'Stream_ID': 'live_1'},
+        'UpdateExpression': 'set #Start_Epoch_Sec = :Start_Epoch_Sec,#Finished = :Finished',
+        'ExpressionAttributeNames': ANY,
+        'ExpressionAttributeValues': ANY
+    })
+
+    lambda_handler(event, None)
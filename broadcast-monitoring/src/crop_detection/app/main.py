@@ -15,49 +15,97 @@ from io import BytesIO
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.utils import (from_s3_object, upload_file_to_s3, DDBUpdateBuilder, DecimalEncoder, check_enabled,
-                          get_item_ddb, cleanup_dir)
-from common.config import WORKING_DIR, LOG_LEVEL, DDB_FRAME_TABLE, STATION_LOGO_CHECK_CONFIG_KEY
+from common.utils import from_s3_object, upload_to_s3, DDBUpdateBuilder, DecimalEncoder, check_enabled, get_item_ddb
+from common.config import LOG_LEVEL, DDB_FRAME_TABLE, STATION_LOGO_CHECK_CONFIG_KEY, CROP_MAX_SIZE
 
 logging.basicConfig()
 logger = logging.getLogger('ImageCrop')
 logger.setLevel(LOG_LEVEL)
 
 
-def crop(bytes, bb, output_path):
-    """
-    Read in an image from bytes and given bounding box (Width, Height, Left, Top), crop the image and save to file.
-    """
-    image = Image.open(bytes)
-    width, height = image.size
+def crop_box(size, bb):
+    """Pixel box (left, top, right, bottom) of a bounding box (Width, Height, Left, Top) in an image of size"""
+    width, height = size
     left = bb['Left'] * width
     top = bb['Top'] * height
-    right = bb['Width'] * width + left
-    bottom = bb['Height'] * height + top
-    cropped = image.crop((left, top, right, bottom))
-    cropped.save(output_path)
-    logger.info(f'Cropped image to {output_path}')
+    return left, top, bb['Width'] * width + left, bb['Height'] * height + top
 
 
-def crop_image_from_s3(src_s3_bucket, src_s3_key, bb, name, dst_s3_bucket=None, dst_s3_key=None):
+def draft_scale(size, bbs, max_size):
     """
-    Download image from s3, crop it by specified bounding box (Width, Height, Left, Top),
-    then write the cropped image to s3
+    Size to decode an image of size at, so the largest of the crops has max_size pixels on its longest side.
+    None when the crops need the full resolution.
+    """
+    if not max_size or not bbs:
+        return None
+    width, height = size
+    longest = max(max(bb['Width'] * width, bb['Height'] * height) for bb in bbs)
+    if longest <= max_size:
+        return None
+    return int(width * max_size / longest), int(height * max_size / longest)
+
+
+def crop(image_bytes, bbs, image_format, max_size=CROP_MAX_SIZE):
+    """
+    Decode an image once and crop it by each bounding box (Width, Height, Left, Top).
+    JPEG images are decoded at a reduced scale (draft mode) when every crop fits in max_size pixels at that scale.
+    :return: list of the cropped images encoded in image_format, in the order of bbs
+    """
+    image = Image.open(image_bytes)
+    draft_size = draft_scale(image.size, bbs, max_size)
+    if draft_size is not None and image.format == 'JPEG':
+        image.draft('RGB', draft_size)
+        logger.info(f'Decoding {image.size[0]}x{image.size[1]} image for crops of at most {max_size} pixels')
+    image.load()
+
+    crops = []
+    for bb in bbs:
+        cropped = image.crop(crop_box(image.size, bb))
+        if max_size:
+            cropped.thumbnail((max_size, max_size))
+        with BytesIO() as buf:
+            cropped.save(buf, format=image_format)
+            crops.append(buf.getvalue())
+    logger.info(f'Cropped {len(crops)} images')
+    return crops
+
+
+def crop_s3_key(src_s3_key, bb, name):
+    """Key of an image cropped from src_s3_key, next to it with the same extension"""
+    src_root, src_ext = os.path.splitext(src_s3_key)
+    return f'{src_root}_crop_{name}_{bb["Left"]:0.3f}_{bb["Top"]:0.3f}{src_ext}'
+
+
+def crop_images_from_s3(src_s3_bucket, src_s3_key, crops, dst_s3_bucket=None):
     """
-    # use the same image file extension as the source image
-    src_ext = os.path.splitext(src_s3_key)[1]
-    output_path = os.path.join(WORKING_DIR, f'cropped{src_ext}')
+    Download image from s3, crop it by each of the specified bounding boxes (Width, Height, Left, Top) from a single
+    decode, then write the cropped images to s3 straight from memory
+    :param crops: list of (bounding box, dst_s3_key) of the images to crop
+    :return: list of (dst_s3_bucket, dst_s3_key) of the cropped images
+    """
+    # use the same image format as the source image
+    image_format = Image.registered_extensions().get(os.path.splitext(src_s3_key)[1].lower(), 'JPEG')
     with BytesIO() as buf:
-        crop(from_s3_object(src_s3_bucket, src_s3_key, buf), bb, output_path)
+        cropped_images = crop(from_s3_object(src_s3_bucket, src_s3_key, buf), [bb for bb, _ in crops], image_format)
     if dst_s3_bucket is None:
         dst_s3_bucket = src_s3_bucket
+
+    content_type = Image.MIME.get(image_format, 'application/octet-stream')
+    for (_, dst_s3_key), cropped_image in zip(crops, cropped_images):
+        upload_to_s3(dst_s3_bucket, dst_s3_key, cropped_image, ContentType=content_type)
+    return [(dst_s3_bucket, dst_s3_key) for _, dst_s3_key in crops]
+
+
+def crop_image_from_s3(src_s3_bucket, src_s3_key, bb, name, dst_s3_bucket=None, dst_s3_key=None):
+    """
+    Download image from s3, crop it by specified bounding box (Width, Height, Left, Top),
+    then write the cropped image to s3
+    """
     if dst_s3_key is None:
-        dst_s3_key = f'{os.path.splitext(src_s3_key)[0]}_crop_{name}_{bb["Left"]:0.3f}_{bb["Top"]:0.3f}{src_ext}'
-    upload_file_to_s3(dst_s3_bucket, dst_s3_key, output_path)
-    return dst_s3_bucket, dst_s3_key
+        dst_s3_key = crop_s3_key(src_s3_key, bb, name)
+    return crop_images_from_s3(src_s3_bucket, src_s3_key, [(bb, dst_s3_key)], dst_s3_bucket)[0]
 
 
-@cleanup_dir()
 @check_enabled(STATION_LOGO_CHECK_CONFIG_KEY)
 def crop_station_logo_lambda_handler(event, context):
     """
@@ -88,9 +136,48 @@ def crop_station_logo_lambda_handler(event, context):
     }
     :return null
     """
-    frame_s3_bucket = event['frame']['S3_Bucket']
-    frame_s3_key = event['frame']['S3_Key']
-    frame_table_key = {'Stream_ID': event['frame']['Stream_ID'], 'DateTime': event['frame']['DateTime']}
+    crop_station_logo(event['frame'])
+
+
+@check_enabled(STATION_LOGO_CHECK_CONFIG_KEY)
+def crop_station_logos_lambda_handler(event, context):
+    """
+    Crops the detected station logo of all the frames of a segment, after the batched frame analysis.
+    A frame that fails to crop is logged and skipped.
+
+    :param event: e.g.
+    {
+      "parsed": {
+        ...
+      },
+      "config": {
+        "station_logo_check_enabled": true,
+        ...
+      },
+      "frames": [
+        {
+          "Stream_ID": "test_1",
+          "DateTime": "2020-02-22T22:14:53.375000Z",
+          ...
+          "S3_Bucket": "aws-rnd-broadcast-maas-video-processing-dev-crop",
+          "S3_Key": "frames/test_video_single_pipeline/test_1/original/2020/02/22/22/14:53:375000.jpg"
+        },
+        ...
+      ]
+    }
+    :return null
+    """
+    for frame_info in event['frames']:
+        try:
+            crop_station_logo(frame_info)
+        except Exception:
+            logger.error('Error cropping station logo of frame: %s', frame_info['S3_Key'], exc_info=True)
+
+
+def crop_station_logo(frame_info):
+    frame_s3_bucket = frame_info['S3_Bucket']
+    frame_s3_key = frame_info['S3_Key']
+    frame_table_key = {'Stream_ID': frame_info['Stream_ID'], 'DateTime': frame_info['DateTime']}
     # download detection
     item = get_item_ddb(table_name=DDB_FRAME_TABLE, Key=frame_table_key, AttributesToGet=['Detected_Station_Logos'])
 
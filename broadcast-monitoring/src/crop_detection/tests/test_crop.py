@@ -0,0 +1,77 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from common.utils import s3
+from ..app.main import crop, crop_image_from_s3, crop_images_from_s3, draft_scale
+
+LOGO_BB = {'Width': 0.25, 'Height': 0.25, 'Left': 0.5, 'Top': 0.25}
+CORNER_BB = {'Width': 0.125, 'Height': 0.125, 'Left': 0.0, 'Top': 0.0}
+
+
+def frame_jpeg(width=1280, height=720):
+    image = Image.new('RGB', (width, height), (0, 0, 255))
+    image.paste((255, 0, 0), (640, 180, 960, 360))
+    with BytesIO() as buf:
+        image.save(buf, format='JPEG')
+        return buf.getvalue()
+
+
+def add_frame_responses(s3_stub, frame):
+    s3_stub.add_response('head_object', {'ContentLength': len(frame)}, {'Bucket': 'frames', 'Key': 'test_1/0.jpg'})
+    s3_stub.add_response('get_object', {'Body': StreamingBody(BytesIO(frame), len(frame)),
+                                        'ContentLength': len(frame)}, {'Bucket': 'frames', 'Key': 'test_1/0.jpg'})
+
+
+@pytest.fixture()
+def s3_stub():
+    with Stubber(s3) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+
+
+def test_draft_scale():
+    assert draft_scale((1280, 720), [LOGO_BB], 0) is None
+    assert draft_scale((1280, 720), [LOGO_BB], 320) is None
+    assert draft_scale((1280, 720), [LOGO_BB, CORNER_BB], 80) == (320, 180)
+
+
+def test_crop():
+    crops = crop(BytesIO(frame_jpeg()), [LOGO_BB, CORNER_BB], 'JPEG', max_size=0)
+    logo = Image.open(BytesIO(crops[0]))
+    assert (logo.format, logo.size) == ('JPEG', (320, 180))
+    red, green, blue = logo.getpixel((160, 90))
+    assert red > 200 and blue < 50
+    assert Image.open(BytesIO(crops[1])).size == (160, 90)
+
+    # decoded at a reduced scale, the crops are at most max_size pixels
+    crops = crop(BytesIO(frame_jpeg()), [LOGO_BB, CORNER_BB], 'JPEG', max_size=80)
+    assert Image.open(BytesIO(crops[0])).size == (80, 45)
+    assert Image.open(BytesIO(crops[1])).size == (40, 22)
+
+
+def test_crop_images_from_s3(s3_stub):
+    frame = frame_jpeg()
+    add_frame_responses(s3_stub, frame)
+    for key in ['test_1/0_crop_NBC_0.500_0.250.jpg', 'test_1/0_crop_ABC_0.000_0.000.jpg']:
+        s3_stub.add_response('put_object', {}, {'ACL': 'bucket-owner-full-control', 'Bucket': 'frames', 'Key': key,
+                                                'Body': ANY, 'ContentType': 'image/jpeg'})
+
+    results = crop_images_from_s3('frames', 'test_1/0.jpg', [(LOGO_BB, 'test_1/0_crop_NBC_0.500_0.250.jpg'),
+                                                             (CORNER_BB, 'test_1/0_crop_ABC_0.000_0.000.jpg')])
+    assert results == [('frames', 'test_1/0_crop_NBC_0.500_0.250.jpg'),
+                       ('frames', 'test_1/0_crop_ABC_0.000_0.000.jpg')]
+
+
+def test_crop_image_from_s3(s3_stub):
+    frame = frame_jpeg()
+    add_frame_responses(s3_stub, frame)
+    s3_stub.add_response('put_object', {}, {'ACL': 'bucket-owner-full-control', 'Bucket': 'crops',
+                                            'Key': 'test_1/0_crop_NBC_0.500_0.250.jpg', 'Body': ANY,
+                                            'ContentType': 'image/jpeg'})
+
+    assert crop_image_from_s3('frames', 'test_1/0.jpg', LOGO_BB, 'NBC', dst_s3_bucket='crops') == \
+        ('crops', 'test_1/0_crop_NBC_0.500_0.250.jpg')
@@ -5,7 +5,7 @@
 # SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
 # Licensed under the Amazon Software License  http://aws.amazon.com/asl/
 
-from boto3.dynamodb.conditions import Key, Attr
+from datetime import timezone
 import os
 import sys
 import logging
@@ -14,23 +14,33 @@ import logging
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.utils import query_item_ddb, convert_float_to_dec
-from common.config import DDB_SCHEDULE_TABLE, LOG_LEVEL
+from common.utils import convert_float_to_dec, parse_date_time_from_str
+from common.config import LOG_LEVEL
+
+try:
+    from .schedule_cache import ScheduleCache
+except ImportError:
+    from schedule_cache import ScheduleCache
 
 logging.basicConfig()
 logger = logging.getLogger('FindExpectedProgram')
 logger.setLevel(LOG_LEVEL)
 
+# schedules are shared by the invocations of a container
+schedule_cache = ScheduleCache()
+
 
-def find_expected_program_for_looping_input(stream_id, segment_start_time, duration_sec, ddb_client=None):
+def find_expected_program_for_looping_input(stream_id, segment_start_time, duration_sec, ddb_client=None,
+                                            cache=None):
     """
     Find the expected program for the given video stream segment if the input is in looping
-    (True live events will use a different approach by comparing absolute date time with program date time.
+    (True live events are looked up by absolute date time instead, see find_expected_program_for_live_input)
     :param stream_id: stream identifier
     :param segment_start_time: relative start timestamp of the video segment
     :param duration_sec: duration of video segment in seconds
     :param ddb_client: optional. a ddb client can be provided to overwrite the default client.
-    :return: a dictionary of metadata about the expected program
+    :param cache: optional. ScheduleCache to look up the schedule from, the container's cache by default.
+    :return: a dictionary of metadata about the expected program, None when no program is scheduled for the segment
         {
           "Team_Info": "MAN V TOT",
           "Station_Logo": "NBC",
@@ -43,23 +53,26 @@ def find_expected_program_for_looping_input(stream_id, segment_start_time, durat
           "languageCode": "en-en"
         }
     """
-    loop_end_time = get_loop_end_time(stream_id, ddb_client)
+    if cache is None:
+        cache = schedule_cache if ddb_client is None else ScheduleCache(ddb_client=ddb_client)
+    schedule = cache.get(stream_id)
+    if not schedule.loop_end_time:
+        logger.warning(f'No program scheduled for stream {stream_id}')
+        return None
+
+    loop_end_time = schedule.loop_end_time
     # because the expected program loops, use modulo operation to find the start time to look up in the schedule table
     # here we do math using Decimal to avoid floating point precision problems
-    segment_start_time_in_loop = convert_float_to_dec(segment_start_time) % convert_float_to_dec(loop_end_time)
+    segment_start_time_in_loop = convert_float_to_dec(segment_start_time) % loop_end_time
     logger.info(f'Loop input end time: {loop_end_time}, start time in loop: {segment_start_time_in_loop}')
 
-    query_params = {
-        'ScanIndexForward': True,
-        'KeyConditionExpression': Key('Stream_ID').eq(stream_id) & Key('Start_Time').lte(
-            segment_start_time_in_loop + convert_float_to_dec(duration_sec)),
-        'FilterExpression': Attr('End_Time').gt(segment_start_time_in_loop)
-    }
-
     # technically, it's possible one segment can straddle between two programs.
     # however, given segments is 6-10 seconds long, we will just take the first program
-    items = query_item_ddb(DDB_SCHEDULE_TABLE, ddb_client, **query_params)
-    expected_program = items[0]
+    expected_program = schedule.find(segment_start_time_in_loop,
+                                     segment_start_time_in_loop + convert_float_to_dec(duration_sec))
+    if expected_program is None:
+        logger.warning(f'No program scheduled for stream {stream_id} at {segment_start_time_in_loop} in loop')
+        return None
     expected_program['Start_Time'] = float(expected_program['Start_Time'])
     expected_program['End_Time'] = float(expected_program['End_Time'])
     expected_program['Segment_Start_Time_In_Loop'] = float(segment_start_time_in_loop)
@@ -70,21 +83,45 @@ def find_expected_program_for_looping_input(stream_id, segment_start_time, durat
     return expected_program
 
 
-def get_loop_end_time(stream_id, ddb_client):
+def segment_epoch_sec(segment_start_date_time):
+    """Epoch seconds of a program date time like 2020-01-23T21:36:35.290000Z, as a Decimal"""
+    epoch_sec = parse_date_time_from_str(segment_start_date_time).replace(tzinfo=timezone.utc).timestamp()
+    return convert_float_to_dec(epoch_sec)
+
+
+def find_expected_program_for_live_input(stream_id, segment_start_date_time, duration_sec, ddb_client=None,
+                                         cache=None):
     """
-    Look up the expected schedule to find the end timesteamp of the last program.
-    This is useful when the input is a looping input.
+    Find the expected program for the given video stream segment of a live input, from the absolute program windows
+    of the schedule (Start_Time and End_Time in epoch seconds). When programs overlap or the segment spans a program
+    boundary, the program covering most of the segment is expected.
     :param stream_id: stream identifier
+    :param segment_start_date_time: program date time of the segment, e.g. 2020-01-23T21:36:35.290000Z
+    :param duration_sec: duration of video segment in seconds
     :param ddb_client: optional. a ddb client can be provided to overwrite the default client.
-    :return:
+    :param cache: optional. ScheduleCache to look up the schedule from, the container's cache by default.
+    :return: same as find_expected_program_for_looping_input, except for Segment_Start_Time_In_Loop as a live input
+     doesn't loop: Segment_Start_Epoch_Sec holds the epoch seconds of the segment start instead
     """
-    query_params = {'ScanIndexForward': False,
-                    'KeyConditionExpression': Key('Stream_ID').eq(stream_id),
-                    'Limit': 1}
-    items = query_item_ddb(DDB_SCHEDULE_TABLE, ddb_client, **query_params)
-    latest_item = items[0]
-    loop_end_time = float(latest_item['End_Time'])
-    return loop_end_time
+    if cache is None:
+        cache = schedule_cache if ddb_client is None else ScheduleCache(ddb_client=ddb_client)
+
+    segment_start_time = segment_epoch_sec(segment_start_date_time)
+    segment_end_time = segment_start_time + convert_float_to_dec(duration_sec)
+    # only the programs around the segment are read
+    schedule = cache.get(stream_id, segment_start_time, segment_end_time)
+    expected_program = schedule.find_most_overlapping(segment_start_time, segment_end_time)
+    if expected_program is None:
+        logger.warning(f'No program scheduled for stream {stream_id} at {segment_start_date_time}')
+        return None
+    expected_program['Start_Time'] = float(expected_program['Start_Time'])
+    expected_program['End_Time'] = float(expected_program['End_Time'])
+    expected_program['Segment_Start_Epoch_Sec'] = float(segment_start_time)
+    logger.info(
+        f'Found program title={expected_program["Event_Title"]} '
+        f'({expected_program["Start_Time"]} - {expected_program["End_Time"]}) for video segment.')
+
+    return expected_program
 
 
 if __name__ == '__main__':
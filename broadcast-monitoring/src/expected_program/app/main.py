@@ -2,44 +2,39 @@
 # SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
 # Licensed under the Amazon Software License  http://aws.amazon.com/asl/
 
-import re
-import subprocess
 import os
 import sys
 from boto3.dynamodb.conditions import Key, Attr
 import logging
 
 try:
-    from .find_expected_program import find_expected_program_for_looping_input
+    from .find_expected_program import find_expected_program_for_looping_input, find_expected_program_for_live_input, \
+        segment_epoch_sec
 except ImportError:
-    from find_expected_program import find_expected_program_for_looping_input
+    from find_expected_program import find_expected_program_for_looping_input, find_expected_program_for_live_input, \
+        segment_epoch_sec
 
 # Conditionally add /opt to the PYTHON PATH for lambda layer
 if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
-from common.utils import download_file_from_s3, cleanup_dir, query_item_ddb, convert_float_to_dec, check_enabled
+from common.utils import query_item_ddb, convert_float_to_dec, check_enabled
+from common.mpegts import read_start_time_from_s3
 from common.config import (LOG_LEVEL, TEAM_CHECK_CONFIG_KEY, TEAM_LOGO_CHECK_CONFIG_KEY, DDB_FRAGMENT_TABLE,
-                           REUSE_DETECTION_CONFIG_KEY, SPORTS_CHECK_CONFIG_KEY)
+                           REUSE_DETECTION_CONFIG_KEY, SPORTS_CHECK_CONFIG_KEY, SCHEDULE_MODE)
 
 logging.basicConfig()
 logger = logging.getLogger('FindExpectedProgramMain')
 logger.setLevel(LOG_LEVEL)
 
-start_time_pattern = re.compile(r'start_time=(?P<start>[0-9]+(\.?[0-9]*))')
 
-
-def get_relative_start_sec(video_file):
-    o = subprocess.check_output(
-        ["ffprobe", "-show_entries", "format=start_time", "-of", "default=noprint_wrappers=1", video_file])
-    output = o.decode('utf-8')
-    start_time_re_match = start_time_pattern.search(output)
-    start_sec = float(start_time_re_match.group('start'))
-    logger.info(f'Found {video_file} relative start time: {start_sec}')
+def get_relative_start_sec(s3_bucket, segment_s3_key, segment_s3_version_id=None):
+    """Start time of the segment, read from the timestamps of its first packets"""
+    start_sec = read_start_time_from_s3(s3_bucket, segment_s3_key, segment_s3_version_id)
+    logger.info(f'Found {segment_s3_key} relative start time: {start_sec}')
     return start_sec
 
 
-@cleanup_dir()
 def lambda_handler(event, context):
     """
 
@@ -72,19 +67,37 @@ def lambda_handler(event, context):
     manifest_s3_bucket = event['s3Bucket']
     segment_s3_key = event['parsed']['lastSegment']['s3Key']
     stream_id = event['parsed']['streamId']
-    # the cleanup_dir decorator will ensure the tmp/ working directory gets cleaned up if lambda container is reused
-    segment_file = download_file_from_s3(manifest_s3_bucket, segment_s3_key)
-    start_time = get_relative_start_sec(segment_file)
     duration_sec = event['parsed']['lastSegment']['durationSec']
-    # TODO: add support for if the input stream is actual live video
-    #  (perhaps a slightly different lookup mechanism based on absolute timestamp)
-    expected_program = find_expected_program_for_looping_input(stream_id, start_time, duration_sec)
+    if SCHEDULE_MODE == 'live':
+        # programs are looked up by the program date time of the segment, no need to probe its relative start time
+        start_time = event.get('analysis', {}).get('startTimeRelative')
+        segment_start_date_time = event['parsed']['lastSegment']['startDateTime']
+        expected_program = find_expected_program_for_live_input(stream_id, segment_start_date_time, duration_sec)
+    else:
+        if event.get('analysis', {}).get('startTimeRelative') is not None:
+            # already probed by the single pass segment analysis
+            start_time = event['analysis']['startTimeRelative']
+        else:
+            start_time = get_relative_start_sec(manifest_s3_bucket, segment_s3_key,
+                                                event['parsed']['lastSegment'].get('versionId'))
+        expected_program = find_expected_program_for_looping_input(stream_id, start_time, duration_sec)
+    available_detection = None
+    if expected_program is None:
+        # no program to check the segment against: the frame checks skip a program without an expected station,
+        # teams or sport, and the team and sports checks are disabled below
+        if SCHEDULE_MODE == 'live':
+            expected_program = {'Segment_Start_Epoch_Sec': float(segment_epoch_sec(segment_start_date_time))}
+        else:
+            expected_program = {'Segment_Start_Time_In_Loop': start_time}
+    elif SCHEDULE_MODE != 'live':
+        # a live input never shows the same segment again
+        available_detection = check_available_detection(event, stream_id,
+                                                        expected_program['Segment_Start_Time_In_Loop'],
+                                                        event['parsed']['lastSegment']['startDateTime'],
+                                                        duration_sec)
     event['parsed']['lastSegment']['startTimeRelative'] = start_time
     event['parsed']['expectedProgram'] = expected_program
 
-    available_detection = check_available_detection(event, stream_id, expected_program['Segment_Start_Time_In_Loop'],
-                                                    event['parsed']['lastSegment']['startDateTime'],
-                                                    duration_sec)
     if available_detection:
         event['reuse'] = {
             'enabled': True,
@@ -96,11 +109,11 @@ def lambda_handler(event, context):
         }
 
     # disable team check when there's no expected team in program
-    if 'Team_Info' not in expected_program:
+    if not expected_program.get('Team_Info'):
         event['config'][TEAM_CHECK_CONFIG_KEY] = False
         event['config'][TEAM_LOGO_CHECK_CONFIG_KEY] = False
     # disable sports check when the program is not sports
-    if 'Sports_Type' not in expected_program:
+    if not expected_program.get('Sports_Type'):
         event['config'][SPORTS_CHECK_CONFIG_KEY] = False
 
     return event
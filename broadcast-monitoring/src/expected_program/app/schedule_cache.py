@@ -0,0 +1,210 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+from boto3.dynamodb.conditions import Key
+import hashlib
+import json
+import os
+import sys
+import time
+import logging
+
+# Conditionally add /opt to the PYTHON PATH for lambda layer
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
+
+from common.utils import dynamodb, query_item_ddb, DecimalEncoder
+from common.config import DDB_SCHEDULE_TABLE, SCHEDULE_CACHE_TTL_SEC, SCHEDULE_LIVE_LOOKBACK_SEC, \
+    SCHEDULE_LIVE_LOOKAHEAD_SEC, SCHEDULE_VERSION_START_TIME, LOG_LEVEL
+
+logger = logging.getLogger('ScheduleCache')
+logger.setLevel(LOG_LEVEL)
+
+
+class StreamSchedule(object):
+    """
+    Programs of a stream sorted by start time, indexed by an interval tree. The tree is implicit over the sorted
+    programs: the root is the middle program, and the left and right halves are its subtrees. max_ends holds the
+    latest end of the programs of each subtree, so a lookup skips the subtrees that end before the time range, and the
+    programs that start after it. Each program found costs O(log n), however long the programs before it run.
+    """
+
+    def __init__(self, programs, version=None, window=None, table_version=None):
+        self.programs = sorted(programs, key=lambda program: program['Start_Time'])
+        self.starts = [program['Start_Time'] for program in self.programs]
+        # max_ends[i] is the latest end of the programs in the subtree of the program i
+        self.max_ends = [None] * len(self.programs)
+        self._index(0, len(self.programs))
+        self.version = version
+        # (from, to) range of the start times of the programs read from the table, None when all of them were read
+        self.window = window
+        # Schedule_Version of the stream in the table when the programs were read, None when the table has none
+        self.table_version = table_version
+
+    def _index(self, lo, hi):
+        """Fill max_ends for the subtree of programs[lo:hi], rooted at its middle program, and return its latest end"""
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self.programs[mid]['End_Time']
+        for subtree_end in (self._index(lo, mid), self._index(mid + 1, hi)):
+            if subtree_end is not None and subtree_end > max_end:
+                max_end = subtree_end
+        self.max_ends[mid] = max_end
+        return max_end
+
+    def _overlapping(self, lo, hi, start_time, end_time, include_end):
+        """
+        Programs of the subtree of programs[lo:hi] ending after start_time and starting before end_time (or at
+        end_time when include_end), in start time order
+        """
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_ends[mid] <= start_time:
+            return
+        yield from self._overlapping(lo, mid, start_time, end_time, include_end)
+        if self.starts[mid] > end_time or (self.starts[mid] == end_time and not include_end):
+            # neither do the programs of the right subtree, they start later
+            return
+        if self.programs[mid]['End_Time'] > start_time:
+            yield self.programs[mid]
+        yield from self._overlapping(mid + 1, hi, start_time, end_time, include_end)
+
+    def __len__(self):
+        return len(self.programs)
+
+    @property
+    def loop_end_time(self):
+        """End time of the last program, None when there's no program"""
+        return self.programs[-1]['End_Time'] if self.programs else None
+
+    def find(self, start_time, end_time):
+        """
+        First program (by start time) overlapping [start_time, end_time]
+        :return: a copy of the program item, None when no program is scheduled then
+        """
+        program = next(self._overlapping(0, len(self.programs), start_time, end_time, True), None)
+        return dict(program) if program is not None else None
+
+    def overlapping(self, start_time, end_time):
+        """
+        Programs overlapping [start_time, end_time), in start time order. Back to back programs don't overlap: a
+        program ending at start_time or starting at end_time isn't returned.
+        :return: list of the program items, not copied
+        """
+        return list(self._overlapping(0, len(self.programs), start_time, end_time, False))
+
+    def find_most_overlapping(self, start_time, end_time):
+        """
+        Program covering most of [start_time, end_time). A segment spanning a program boundary belongs to the program
+        it shows the most of. Among programs covering it as much, the one starting last is the most specific, e.g. a
+        program scheduled within a longer one.
+        :return: a copy of the program item, None when no program is scheduled then
+        """
+        best, best_overlap = None, 0
+        for program in self.overlapping(start_time, end_time):
+            overlap = min(program['End_Time'], end_time) - max(program['Start_Time'], start_time)
+            if overlap >= best_overlap:
+                best, best_overlap = program, overlap
+        return dict(best) if best is not None else None
+
+
+def schedule_version(programs):
+    """Digest of the programs of a stream, changes when any of them is added, removed or modified"""
+    content = json.dumps(sorted(programs, key=lambda program: program['Start_Time']), sort_keys=True,
+                         cls=DecimalEncoder)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ScheduleCache(object):
+    """
+    Schedules of the streams read from the schedule table, kept by the container for ttl_sec. Once a stream's schedule
+    expires, its Schedule_Version item is read: the schedule is kept for another ttl_sec when the version is unchanged,
+    otherwise all its programs are read again with a query. Streams whose programs were loaded without a version item
+    are always queried again, and the existing schedule is kept when the digest of the programs is unchanged.
+    Streams without any program are cached too, as empty schedules.
+    Live lookups only read the programs starting from lookback_sec before the segment to lookahead_sec after it, so the
+    schedule of a live stream doesn't grow with its whole history. It's read again once a segment is out of the window.
+    """
+
+    def __init__(self, table_name=DDB_SCHEDULE_TABLE, ttl_sec=SCHEDULE_CACHE_TTL_SEC, ddb_client=None,
+                 clock=time.monotonic, lookback_sec=SCHEDULE_LIVE_LOOKBACK_SEC,
+                 lookahead_sec=SCHEDULE_LIVE_LOOKAHEAD_SEC):
+        self.table_name = table_name
+        self.ttl_sec = ttl_sec
+        self.ddb_client = ddb_client
+        self.clock = clock
+        self.lookback_sec = lookback_sec
+        self.lookahead_sec = lookahead_sec
+        self.schedules = {}  # map of stream id -> (StreamSchedule, load time)
+
+    def covers(self, schedule, start_time, end_time):
+        """Whether schedule has all the programs that may overlap [start_time, end_time)"""
+        if schedule.window is None:
+            return True
+        if start_time is None:
+            return False
+        return schedule.window[0] <= start_time - self.lookback_sec and end_time <= schedule.window[1]
+
+    def get(self, stream_id, start_time=None, end_time=None):
+        """
+        :param start_time: start of the time range looked up in a live schedule, in epoch seconds. When None, the
+         whole schedule of the stream is read.
+        :param end_time: end of the time range looked up in a live schedule
+        :return: StreamSchedule of the stream, read from the schedule table when not cached, changed since it expired
+         or when it doesn't cover the time range
+        """
+        cached = self.schedules.get(stream_id)
+        now = self.clock()
+        if cached is not None and self.covers(cached[0], start_time, end_time):
+            if now - cached[1] < self.ttl_sec:
+                return cached[0]
+            table_version = self.read_table_version(stream_id)
+            if table_version is not None and table_version == cached[0].table_version:
+                logger.info(f'Schedule version {table_version} of {stream_id} is unchanged')
+                self.schedules[stream_id] = (cached[0], now)
+                return cached[0]
+        else:
+            table_version = self.read_table_version(stream_id)
+
+        # the version item sorts before the programs
+        key_condition = Key('Stream_ID').eq(stream_id) & Key('Start_Time').gt(SCHEDULE_VERSION_START_TIME)
+        window = None
+        if start_time is not None:
+            # programs starting earlier than the lookback are assumed to be over. The window reaches back the
+            # lookahead further, so that segments processed out of order don't read the schedule again
+            window = (start_time - self.lookback_sec - self.lookahead_sec, end_time + self.lookahead_sec)
+            key_condition = Key('Stream_ID').eq(stream_id) & Key('Start_Time').between(*window)
+        programs = query_item_ddb(self.table_name, self.ddb_client, KeyConditionExpression=key_condition)
+        version = schedule_version(programs)
+        if cached is not None and cached[0].version == version:
+            logger.info(f'Schedule of {stream_id} is unchanged')
+            schedule = cached[0]
+            # same programs, they're all the programs of the new window
+            schedule.window = window
+            schedule.table_version = table_version
+        else:
+            schedule = StreamSchedule(programs, version, window, table_version)
+            logger.info(f'Loaded {len(schedule)} programs of {stream_id}')
+        self.schedules[stream_id] = (schedule, now)
+        return schedule
+
+    def read_table_version(self, stream_id):
+        """
+        Schedule_Version of the stream, read before its programs so that programs written after it are read again with
+        the next version. None when the stream has no version item
+        """
+        ddb = self.ddb_client if self.ddb_client is not None else dynamodb
+        response = ddb.Table(self.table_name).get_item(
+            Key={'Stream_ID': stream_id, 'Start_Time': SCHEDULE_VERSION_START_TIME},
+            ProjectionExpression='Schedule_Version')
+        return response.get('Item', {}).get('Schedule_Version')
+
+    def invalidate(self, stream_id=None):
+        """Read the schedule of the stream, or of every stream, again on the next lookup"""
+        if stream_id is None:
+            self.schedules.clear()
+        else:
+            self.schedules.pop(stream_id, None)
@@ -0,0 +1,76 @@
+import pytest
+from botocore.stub import Stubber, ANY
+
+from common.config import DDB_SCHEDULE_TABLE
+from common.utils import dynamodb
+from frame_checks.sports import SportsCheck
+from frame_checks.station_logo import StationLogoCheck
+from frame_checks.team_logo import TeamLogoCheck
+from frame_checks.team_text import TeamCheck
+from ..app import main
+from ..app.find_expected_program import schedule_cache
+from ..app.main import lambda_handler
+
+
+@pytest.fixture()
+def ddb_stub():
+    with Stubber(dynamodb.meta.client) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+    schedule_cache.invalidate()
+
+
+def unscheduled_segment_event():
+    return {
+        's3Bucket': 'aws-rnd-broadcast-maas-video-processing-dev',
+        'config': {
+            'station_logo_check_enabled': True,
+            'team_detect_check_enabled': True,
+            'team_logo_check_enabled': True,
+            'sports_detect_check_enabled': True
+        },
+        'parsed': {
+            'streamId': 'test_unscheduled',
+            'lastSegment': {
+                's3Key': 'live/test_video_single_pipeline/test_unscheduled_00039.ts',
+                'startDateTime': '2020-01-23T21:36:35.290000Z',
+                'durationSec': 6
+            }
+        },
+        'analysis': {'startTimeRelative': 10.0}
+    }
+
+
+def test_lambda_handler_outside_of_schedule(ddb_stub):
+    ddb_stub.add_response('get_item', {}, {'TableName': DDB_SCHEDULE_TABLE, 'Key': ANY, 'ProjectionExpression': ANY})
+    ddb_stub.add_response('query', {'Items': []}, {'TableName': DDB_SCHEDULE_TABLE, 'KeyConditionExpression': ANY})
+    event = lambda_handler(unscheduled_segment_event(), None)
+    expected_program = event['parsed']['expectedProgram']
+    assert expected_program == {'Segment_Start_Time_In_Loop': 10.0}
+    assert event['reuse'] == {'enabled': False}
+    assert event['config'] == {
+        'station_logo_check_enabled': True,
+        'team_detect_check_enabled': False,
+        'team_logo_check_enabled': False,
+        'sports_detect_check_enabled': False
+    }
+
+    # the frame checks give no result for the segment, even when enabled
+    detected_text = [{'DetectedText': 'AVL', 'Type': 'WORD', 'Confidence': 99.0,
+                      'Geometry': {'BoundingBox': {'Width': 0.1, 'Height': 0.1, 'Left': 0.1, 'Top': 0.1}}}]
+    detected_logos = [{'Name': 'amazon_prime_video', 'Confidence': 95.0}]
+    checks = [(TeamCheck(), detected_text), (StationLogoCheck(), detected_logos), (TeamLogoCheck(), detected_logos),
+              (SportsCheck(), [{'Name': 'soccer', 'Confidence': 90.0}])]
+    for check, detections in checks:
+        assert dict(check.execute(expected_program, detections) or {}) == {}
+
+
+def test_lambda_handler_live_outside_of_schedule(ddb_stub, monkeypatch):
+    monkeypatch.setattr(main, 'SCHEDULE_MODE', 'live')
+    ddb_stub.add_response('get_item', {}, {'TableName': DDB_SCHEDULE_TABLE, 'Key': ANY, 'ProjectionExpression': ANY})
+    ddb_stub.add_response('query', {'Items': []}, {'TableName': DDB_SCHEDULE_TABLE, 'KeyConditionExpression': ANY})
+    event = lambda_handler(unscheduled_segment_event(), None)
+
+    # the program date time of the segment, not a time in the loop of the input
+    assert event['parsed']['expectedProgram'] == {'Segment_Start_Epoch_Sec': 1579815395.29}
+    assert event['reuse'] == {'enabled': False}
@@ -0,0 +1,232 @@
+import random
+from decimal import Decimal
+
+import pytest
+from botocore.stub import Stubber, ANY
+
+from common.utils import dynamodb
+from ..app.find_expected_program import find_expected_program_for_looping_input, find_expected_program_for_live_input
+from ..app.schedule_cache import ScheduleCache, StreamSchedule
+
+TABLE_NAME = 'schedule'
+# same programs as tests/data/test-schedule.csv
+PROGRAMS = [
+    {'Stream_ID': 'test_1', 'Start_Time': Decimal(60), 'End_Time': Decimal(90), 'Event_ID': 'SIM-PROG2',
+     'Event_Title': 'Russia Today'},
+    {'Stream_ID': 'test_1', 'Start_Time': Decimal(0), 'End_Time': Decimal(60), 'Event_ID': 'SIM-PROG1',
+     'Event_Title': 'MAN V TOT', 'Team_Info': 'MAN V TOT'},
+    {'Stream_ID': 'test_1', 'Start_Time': Decimal(90), 'End_Time': Decimal(150), 'Event_ID': 'SIM-PROG3',
+     'Event_Title': 'Judge Judy'},
+]
+
+# 2020-01-23T21:00:00Z
+LIVE_START = 1579813200
+LIVE_PROGRAMS = [
+    {'Stream_ID': 'live_1', 'Start_Time': Decimal(LIVE_START), 'End_Time': Decimal(LIVE_START + 3600),
+     'Event_ID': 'NEWS', 'Event_Title': 'News'},
+    {'Stream_ID': 'live_1', 'Start_Time': Decimal(LIVE_START + 3600), 'End_Time': Decimal(LIVE_START + 9000),
+     'Event_ID': 'MATCH', 'Event_Title': 'MAN V TOT', 'Team_Info': 'MAN V TOT'},
+    # half time show during the match
+    {'Stream_ID': 'live_1', 'Start_Time': Decimal(LIVE_START + 6300), 'End_Time': Decimal(LIVE_START + 7200),
+     'Event_ID': 'HALF', 'Event_Title': 'Half time'},
+]
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def ddb_stub():
+    with Stubber(dynamodb.meta.client) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
+
+
+def add_version_response(ddb_stub, version=None):
+    item = {'Item': {'Schedule_Version': {'N': str(version)}}} if version is not None else {}
+    ddb_stub.add_response('get_item', item, {'TableName': TABLE_NAME, 'Key': ANY, 'ProjectionExpression': ANY})
+
+
+def add_load_responses(ddb_stub, programs, version=None):
+    """version item read, then the programs query"""
+    add_version_response(ddb_stub, version)
+    items = [{k: {'N': str(v)} if isinstance(v, Decimal) else {'S': v} for k, v in program.items()}
+             for program in programs]
+    ddb_stub.add_response('query', {'Items': items},
+                          {'TableName': TABLE_NAME, 'KeyConditionExpression': ANY})
+
+
+def test_stream_schedule_find():
+    schedule = StreamSchedule(PROGRAMS)
+    assert schedule.loop_end_time == 150
+    assert schedule.find(Decimal(0), Decimal(6))['Event_ID'] == 'SIM-PROG1'
+    # straddles the first two programs
+    assert schedule.find(Decimal(59), Decimal(65))['Event_ID'] == 'SIM-PROG1'
+    assert schedule.find(Decimal(60), Decimal(66))['Event_ID'] == 'SIM-PROG2'
+    assert schedule.find(Decimal(149), Decimal(155))['Event_ID'] == 'SIM-PROG3'
+    assert schedule.find(Decimal(150), Decimal(156)) is None
+
+    # gap between programs, and a program overlapping the next one
+    schedule = StreamSchedule([{'Start_Time': 0, 'End_Time': 100}, {'Start_Time': 10, 'End_Time': 20},
+                               {'Start_Time': 200, 'End_Time': 300}])
+    assert schedule.find(50, 56)['Start_Time'] == 0
+    assert schedule.find(120, 126) is None
+    assert schedule.find(195, 201)['Start_Time'] == 200
+    assert StreamSchedule([]).find(0, 6) is None
+
+
+def test_find_expected_program_for_looping_input(ddb_stub):
+    cache = ScheduleCache(table_name=TABLE_NAME)
+    add_load_responses(ddb_stub, PROGRAMS)
+    # segment start time, event id and start time of the expected program
+    for start_time, event_id, program_start_time in [(0, 'SIM-PROG1', 0), (59, 'SIM-PROG1', 0),
+                                                     (60, 'SIM-PROG2', 60), (80, 'SIM-PROG2', 60),
+                                                     (90, 'SIM-PROG3', 90), (150, 'SIM-PROG1', 0),
+                                                     (220, 'SIM-PROG2', 60), (330, 'SIM-PROG1', 0)]:
+        program = find_expected_program_for_looping_input('test_1', start_time, 6, cache=cache)
+        assert program['Event_ID'] == event_id
+        assert program['Start_Time'] == program_start_time
+    # the cached program isn't modified by the lookups
+    assert cache.get('test_1').find(Decimal(0), Decimal(6))['Start_Time'] == Decimal(0)
+
+
+def test_find_expected_program_without_schedule(ddb_stub):
+    cache = ScheduleCache(table_name=TABLE_NAME)
+    add_load_responses(ddb_stub, [])
+    assert find_expected_program_for_looping_input('test_2', 0, 6, cache=cache) is None
+    # the empty schedule is cached too
+    assert find_expected_program_for_looping_input('test_2', 6, 6, cache=cache) is None
+
+
+def test_schedule_cache_expiry(ddb_stub):
+    clock = FakeClock()
+    cache = ScheduleCache(table_name=TABLE_NAME, ttl_sec=60, clock=clock)
+    add_load_responses(ddb_stub, PROGRAMS)
+    schedule = cache.get('test_1')
+    clock.now = 30
+    assert cache.get('test_1') is schedule
+
+    # expired, but unchanged
+    clock.now = 90
+    add_load_responses(ddb_stub, list(reversed(PROGRAMS)))
+    assert cache.get('test_1') is schedule
+
+    clock.now = 160
+    add_load_responses(ddb_stub, PROGRAMS[:2])
+    assert cache.get('test_1').loop_end_time == 90
+
+    cache.invalidate('test_1')
+    add_load_responses(ddb_stub, PROGRAMS)
+    assert cache.get('test_1').loop_end_time == 150
+
+
+def test_schedule_cache_version(ddb_stub):
+    clock = FakeClock()
+    cache = ScheduleCache(table_name=TABLE_NAME, ttl_sec=60, clock=clock)
+    add_load_responses(ddb_stub, PROGRAMS, version=3)
+    schedule = cache.get('test_1')
+    assert schedule.table_version == 3
+
+    # expired, the version item alone tells the schedule is unchanged
+    clock.now = 90
+    add_version_response(ddb_stub, 3)
+    assert cache.get('test_1') is schedule
+    # and it's kept for another ttl
+    clock.now = 140
+    assert cache.get('test_1') is schedule
+
+    # new programs loaded, the version read when the schedule expired is kept
+    clock.now = 160
+    add_load_responses(ddb_stub, PROGRAMS[:2], version=4)
+    schedule = cache.get('test_1')
+    assert schedule.loop_end_time == 90
+    assert schedule.table_version == 4
+
+
+def test_stream_schedule_overlapping():
+    schedule = StreamSchedule(LIVE_PROGRAMS)
+    # back to back programs
+    assert [p['Event_ID'] for p in schedule.overlapping(LIVE_START + 3594, LIVE_START + 3600)] == ['NEWS']
+    assert [p['Event_ID'] for p in schedule.overlapping(LIVE_START + 3600, LIVE_START + 3606)] == ['MATCH']
+    assert [p['Event_ID'] for p in schedule.overlapping(LIVE_START + 3598, LIVE_START + 3604)] == ['NEWS', 'MATCH']
+    assert [p['Event_ID'] for p in schedule.overlapping(LIVE_START + 6400, LIVE_START + 6406)] == ['MATCH', 'HALF']
+    assert schedule.overlapping(LIVE_START - 6, LIVE_START) == []
+    assert schedule.overlapping(LIVE_START + 9000, LIVE_START + 9006) == []
+
+    # segment spanning a program boundary belongs to the program it shows the most of
+    assert schedule.find_most_overlapping(LIVE_START + 3598, LIVE_START + 3604)['Event_ID'] == 'MATCH'
+    assert schedule.find_most_overlapping(LIVE_START + 3596, LIVE_START + 3602)['Event_ID'] == 'NEWS'
+    # program within a longer one
+    assert schedule.find_most_overlapping(LIVE_START + 6400, LIVE_START + 6406)['Event_ID'] == 'HALF'
+    assert schedule.find_most_overlapping(LIVE_START + 7198, LIVE_START + 7204)['Event_ID'] == 'MATCH'
+
+
+def test_stream_schedule_overlapping_matches_scan():
+    rng = random.Random(0)
+    # a long program running behind many short ones, some of them overlapping
+    programs = [{'Start_Time': 0, 'End_Time': 100000}]
+    for _ in range(500):
+        start = rng.randrange(0, 100000)
+        programs.append({'Start_Time': start, 'End_Time': start + rng.randrange(1, 600)})
+    schedule = StreamSchedule(programs)
+    by_start = sorted(programs, key=lambda program: program['Start_Time'])
+
+    for _ in range(200):
+        start_time = rng.randrange(-100, 101000)
+        end_time = start_time + rng.randrange(0, 10)
+        assert schedule.overlapping(start_time, end_time) == [
+            p for p in by_start if p['End_Time'] > start_time and p['Start_Time'] < end_time]
+        assert schedule.find(start_time, end_time) == next(
+            (p for p in by_start if p['End_Time'] > start_time and p['Start_Time'] <= end_time), None)
+
+
+def test_schedule_cache_live_window(ddb_stub):
+    clock = FakeClock()
+    cache = ScheduleCache(table_name=TABLE_NAME, ttl_sec=300, clock=clock, lookback_sec=7200, lookahead_sec=600)
+    add_load_responses(ddb_stub, LIVE_PROGRAMS[:1])
+    schedule = cache.get('live_1', LIVE_START + 1800, LIVE_START + 1806)
+    assert schedule.window == (LIVE_START - 6000, LIVE_START + 2406)
+
+    # the following segments are within the window, and so is a segment processed a bit late
+    clock.now = 10
+    assert cache.get('live_1', LIVE_START + 1806, LIVE_START + 1812) is schedule
+    assert cache.get('live_1', LIVE_START + 2400, LIVE_START + 2406) is schedule
+    assert cache.get('live_1', LIVE_START + 1794, LIVE_START + 1800) is schedule
+
+    # past the lookahead, the programs of the next window are read
+    add_load_responses(ddb_stub, LIVE_PROGRAMS[:2])
+    schedule = cache.get('live_1', LIVE_START + 2406, LIVE_START + 2412)
+    assert schedule.window == (LIVE_START - 5394, LIVE_START + 3012)
+    assert len(schedule) == 2
+
+    # a much earlier segment needs programs before the window
+    add_load_responses(ddb_stub, LIVE_PROGRAMS[:2])
+    assert cache.get('live_1', LIVE_START + 600, LIVE_START + 606).window == (LIVE_START - 7200, LIVE_START + 1206)
+
+    # the whole schedule covers any lookup
+    cache.invalidate('live_1')
+    add_load_responses(ddb_stub, LIVE_PROGRAMS)
+    schedule = cache.get('live_1')
+    assert cache.get('live_1', LIVE_START + 9000, LIVE_START + 9006) is schedule
+
+
+def test_find_expected_program_for_live_input(ddb_stub):
+    cache = ScheduleCache(table_name=TABLE_NAME)
+    add_load_responses(ddb_stub, LIVE_PROGRAMS)
+
+    program = find_expected_program_for_live_input('live_1', '2020-01-23T22:00:01.500000Z', 6.006, cache=cache)
+    assert program['Event_ID'] == 'MATCH'
+    assert program['Start_Time'] == LIVE_START + 3600
+    assert program['Segment_Start_Epoch_Sec'] == LIVE_START + 3601.5
+    assert 'Segment_Start_Time_In_Loop' not in program
+
+    program = find_expected_program_for_live_input('live_1', '2020-01-23T21:59:56.000000Z', 6, cache=cache)
+    assert program['Event_ID'] == 'NEWS'
+    # two hours earlier, out of the cached window
+    add_load_responses(ddb_stub, LIVE_PROGRAMS[:1])
+    assert find_expected_program_for_live_input('live_1', '2020-01-23T20:00:00.000000Z', 6, cache=cache) is None
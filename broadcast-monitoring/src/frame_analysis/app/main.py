@@ -0,0 +1,292 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import copy
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Conditionally add /opt to the PYTHON PATH for lambda layer
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
+
+from common.config import (LOG_LEVEL, DDB_FRAME_TABLE, FRAME_ANALYSIS_WORKERS, FRAME_HASH_CACHE_TTL_SEC,
+                           TEAM_CHECK_CONFIG_KEY, STATION_LOGO_CHECK_CONFIG_KEY, TEAM_LOGO_CHECK_CONFIG_KEY,
+                           SPORTS_CHECK_CONFIG_KEY)
+from common.frame_hash import FrameDetectionCache, hamming_distance
+from common.utils import detect_text_from_image, convert_to_ddb, DDBBatchWriter, ThrottlingException, Timer
+from common.rate_limit import REKOGNITION_CLIENT_CONFIG, call_rekognition
+from frame_checks.sports import SportsCheck
+from frame_checks.station_logo import StationLogoCheck
+from frame_checks.team_logo import TeamLogoCheck
+from frame_checks.team_text import TeamCheck
+
+logging.basicConfig()
+logger = logging.getLogger('FrameAnalysis')
+logger.setLevel(LOG_LEVEL)
+
+rekognition = boto3.client('rekognition', config=REKOGNITION_CLIENT_CONFIG)
+dynamodb = boto3.resource('dynamodb')
+
+FRAME_CHECK_CONFIG_KEYS = [TEAM_CHECK_CONFIG_KEY, STATION_LOGO_CHECK_CONFIG_KEY, TEAM_LOGO_CHECK_CONFIG_KEY,
+                           SPORTS_CHECK_CONFIG_KEY]
+
+
+def detect_custom_labels(frame_info, model_arn, min_confidence):
+    img_data = {'S3Object': {'Bucket': frame_info['S3_Bucket'], 'Name': frame_info['S3_Key']}}
+    response = call_rekognition(
+        rekognition, 'detect_custom_labels',
+        Image=img_data, MinConfidence=min_confidence, ProjectVersionArn=model_arn
+    )
+    return response.get('CustomLabels', [])
+
+
+# rekognition detections each check needs
+TEXT_DETECTIONS = 'Text_Detections'
+LOGO_LABELS = 'Logo_Labels'
+SPORTS_LABELS = 'Sports_Labels'
+CHECK_DETECTIONS = {
+    TEAM_CHECK_CONFIG_KEY: TEXT_DETECTIONS,
+    STATION_LOGO_CHECK_CONFIG_KEY: LOGO_LABELS,
+    TEAM_LOGO_CHECK_CONFIG_KEY: LOGO_LABELS,
+    SPORTS_CHECK_CONFIG_KEY: SPORTS_LABELS
+}
+
+# attribute recording the failure of each logo check
+LOGO_CHECK_ERROR_ATTRS = {
+    StationLogoCheck.__name__: 'Logo_Detect_Error',
+    TeamLogoCheck.__name__: 'Team_Logo_Detect_Error'
+}
+
+
+def detect(frame_info, detection_names):
+    """
+    Call rekognition for each of the detections. A rekognition error only fails the detection it belongs to, like
+    the Catch of each branch in the state machine did.
+    Station and team logo checks share the labels of the same custom labels model, so it's called once for both.
+    :return: (detections by name, error attributes to write to the frame item)
+    """
+    logger.info('Detecting %s in frame: %s', sorted(detection_names),
+                os.path.join(frame_info['S3_Bucket'], frame_info['S3_Key']))
+    detections = {}
+    errors = {}
+    if TEXT_DETECTIONS in detection_names:
+        try:
+            detections[TEXT_DETECTIONS] = detect_text_from_image(frame_info['S3_Bucket'], frame_info['S3_Key'])
+        except ClientError as e:
+            logger.error('Text detection failed for frame: %s', frame_info['S3_Key'])
+            errors['Text_Detect_Error'] = e.response['Error']['Code']
+        except ThrottlingException:
+            logger.error('Text detection throttled for frame: %s', frame_info['S3_Key'])
+            errors['Text_Detect_Error'] = 'ThrottlingException'
+    if LOGO_LABELS in detection_names:
+        try:
+            detections[LOGO_LABELS] = detect_custom_labels(frame_info, os.getenv('LOGO_MODEL_ARN'),
+                                                           int(os.getenv('LOGO_MIN_CONFIDENCE', 60)))
+        except ClientError as e:
+            logger.error('Error calling detect_custom_labels for logos: %s', e)
+            errors['Logo_Detect_Error'] = e.response['Error']['Code']
+    if SPORTS_LABELS in detection_names:
+        try:
+            detections[SPORTS_LABELS] = detect_custom_labels(frame_info, os.getenv('SPORTS_MODEL_ARN'),
+                                                             int(os.getenv('SPORTS_MIN_CONFIDENCE', 60)))
+        except ClientError as e:
+            logger.error('Error calling detect_custom_labels for sports: %s', e)
+            errors['Sports_Detect_Error'] = e.response['Error']['Code']
+    return detections, errors
+
+
+def run_check(check_name, error_attr, check, *args):
+    """
+    Run a single check on the detections of a frame. A failing check only fails its own results, like the Catch of
+    each branch in the state machine did, and is recorded in error_attr of the frame item.
+    :return: dict of the attributes the check adds to the frame item
+    """
+    try:
+        return dict(check(*args) or {})
+    except Exception as e:
+        logger.error('%s failed', check_name, exc_info=True)
+        return {error_attr: type(e).__name__}
+
+
+def text_in_image(detected_text_response, expected_program):
+    """Detected lines and words of the frame, and the attributes of the team check"""
+    attrs = {
+        'Detected_Lines': [entry['DetectedText'] for entry in detected_text_response if entry['Type'] == 'LINE'],
+        'Detected_Words': [entry['DetectedText'] for entry in detected_text_response if entry['Type'] == 'WORD']
+    }
+    attrs.update(run_check('TeamCheck', 'Team_Detect_Error', TeamCheck().execute, expected_program,
+                           detected_text_response))
+    return attrs
+
+
+def logo_detection(detected_logos, expected_program, logo_checks):
+    """Attributes of the station and team logo checks"""
+    attrs = {}
+    for logo_check in logo_checks:
+        # the team logo check rewrites the detections it matches
+        check_name = type(logo_check).__name__
+        attrs.update(run_check(check_name, LOGO_CHECK_ERROR_ATTRS[check_name], logo_check.execute, expected_program,
+                               copy.deepcopy(detected_logos)))
+    return attrs
+
+
+def sports_detection(detected_sports, expected_program):
+    """Attributes of the sports check"""
+    return run_check('SportsCheck', 'Sports_Detect_Error', SportsCheck().execute, expected_program, detected_sports)
+
+
+def check_frame(detections, expected_program, enabled_checks, logo_checks):
+    """
+    Run the enabled checks on the detections of a single frame, each one failing independently of the others
+    :return: dict of the attributes to write to the frame item
+    """
+    attrs = {}
+    if TEAM_CHECK_CONFIG_KEY in enabled_checks and TEXT_DETECTIONS in detections:
+        attrs.update(text_in_image(detections[TEXT_DETECTIONS], expected_program))
+    if logo_checks and LOGO_LABELS in detections:
+        attrs.update(logo_detection(detections[LOGO_LABELS], expected_program, logo_checks))
+    if SPORTS_CHECK_CONFIG_KEY in enabled_checks and SPORTS_LABELS in detections:
+        attrs.update(sports_detection(detections[SPORTS_LABELS], expected_program))
+    return attrs
+
+
+def analyze_frame(frame_info, expected_program, enabled_checks, logo_checks):
+    """
+    Detect and run the enabled checks on a single frame
+    :return: (dict of the attributes to write to the frame item, detections by name)
+    """
+    detection_names = {CHECK_DETECTIONS[check] for check in enabled_checks}
+    detections, attrs = detect(frame_info, detection_names)
+    attrs.update(check_frame(detections, expected_program, enabled_checks, logo_checks))
+    return attrs, detections
+
+
+def reuse_detections(frame_info, cached, expected_program, enabled_checks, logo_checks):
+    """Run the enabled checks on the cached detections of a visually identical frame"""
+    logger.info('Reusing detections of frame %s for frame %s', cached['Frame_DateTime'], frame_info['DateTime'])
+    attrs = check_frame(cached['Detections'], expected_program, enabled_checks, logo_checks)
+    attrs['Detections_Reused_From'] = cached['Frame_DateTime']
+    return attrs
+
+
+def plan_frames(frames, cache, detection_names):
+    """
+    Sort the frames into the ones to analyze right away, the ones that can reuse cached detections, and the ones
+    that look like a frame analyzed right away, to be looked up again once its detections are cached.
+    :return: (frame indices to analyze, {frame index: cached entry}, frame indices to look up again)
+    """
+    to_analyze, cached, deferred = [], {}, []
+    leader_hashes = []
+    for i, frame_info in enumerate(frames):
+        frame_hash = frame_info.get('Frame_Hash')
+        if cache is None or frame_hash is None:
+            to_analyze.append(i)
+            continue
+        entry = cache.lookup(frame_hash, detection_names)
+        if entry is not None:
+            cached[i] = entry
+        elif any(hamming_distance(frame_hash, h) <= cache.max_distance for h in leader_hashes):
+            deferred.append(i)
+        else:
+            to_analyze.append(i)
+            leader_hashes.append(frame_hash)
+    return to_analyze, cached, deferred
+
+
+def lambda_handler(event, context):
+    """
+    Runs the enabled frame checks on all the frames of a segment, from a bounded pool of threads, and writes the
+    results to the frame table with batch writes.
+    Frames visually identical to a recent frame of the stream (see common.frame_hash) reuse its rekognition
+    detections instead of calling rekognition again.
+
+    :param event: e.g.
+    {
+      "parsed": {...
+      },
+      "config": {
+        "audio_check_enabled": true,
+        "station_logo_check_enabled": true,
+        "language_detect_check_enabled": false,
+        "team_detect_check_enabled": true,
+        "team_logo_check_enabled": false,
+        "sports_detect_check_enabled": true
+      },
+      "frames": [
+        {
+          "Stream_ID": "test_1",
+          "DateTime": "2020-02-22T22:14:53.375000Z",
+          ...
+          "S3_Bucket": "aws-rnd-broadcast-maas-video-processing-dev",
+          "S3_Key": "frames/test_video_single_pipeline/test_1/original/2020/02/22/22/14:53:375000.jpg"
+        },
+        ...
+      ]
+    }
+    :param context: lambda context object
+    :return: None. The frame items are written to DynamoDB
+    """
+    config = event['config']
+    enabled_checks = {key for key in FRAME_CHECK_CONFIG_KEYS if config.get(key)}
+    if not enabled_checks:
+        logger.info('No frame checks enabled')
+        return
+
+    logo_checks = []
+    if STATION_LOGO_CHECK_CONFIG_KEY in enabled_checks:
+        logo_checks.append(StationLogoCheck())
+    if TEAM_LOGO_CHECK_CONFIG_KEY in enabled_checks:
+        logo_checks.append(TeamLogoCheck())
+
+    frames = event['frames']
+    expected_program = event['parsed']['expectedProgram']
+    detection_names = {CHECK_DETECTIONS[check] for check in enabled_checks}
+    cache = None
+    if FRAME_HASH_CACHE_TTL_SEC > 0 and any('Frame_Hash' in frame_info for frame_info in frames):
+        cache = FrameDetectionCache(frames[0]['Stream_ID'], ddb_client=dynamodb).load()
+
+    timer = Timer(f'analyze {len(frames)} frames with checks {sorted(enabled_checks)}', logger_fn=logger.info)
+    timer.tic()
+    to_analyze, cached, deferred = plan_frames(frames, cache, detection_names)
+    results = {}
+    with ThreadPoolExecutor(max_workers=FRAME_ANALYSIS_WORKERS, thread_name_prefix='frame-analysis') as executor:
+        analyze = partial(analyze_frame, expected_program=expected_program, enabled_checks=enabled_checks,
+                          logo_checks=logo_checks)
+
+        def analyze_all(indices):
+            for i, (attrs, detections) in zip(indices, executor.map(analyze, [frames[i] for i in indices])):
+                results[i] = attrs
+                frame_hash = frames[i].get('Frame_Hash')
+                # only cache complete detections, a failed one is retried on the next similar frame
+                if cache is not None and frame_hash is not None and detection_names.issubset(detections):
+                    cache.add(frame_hash, frames[i]['DateTime'], detections)
+
+        analyze_all(to_analyze)
+        # frames similar to one analyzed above, unless its detections failed
+        still_to_analyze = []
+        for i in deferred:
+            entry = cache.lookup(frames[i]['Frame_Hash'], detection_names)
+            if entry is not None:
+                cached[i] = entry
+            else:
+                still_to_analyze.append(i)
+        analyze_all(still_to_analyze)
+
+    for i, entry in cached.items():
+        results[i] = reuse_detections(frames[i], entry, expected_program, enabled_checks, logo_checks)
+    timer.toc()
+    logger.info(f'Reused cached detections for {len(cached)} of {len(frames)} frames')
+
+    # the frame items were just written by the frame extractor, so they're put back whole with the check results
+    with DDBBatchWriter(DDB_FRAME_TABLE, ddb_client=dynamodb) as frame_writer:
+        for i, frame_info in enumerate(frames):
+            frame_writer.put_item(convert_to_ddb({**frame_info, **results[i]}))
+    if cache is not None:
+        cache.save()
@@ -0,0 +1,217 @@
+from decimal import Decimal
+
+import pytest
+from botocore.stub import Stubber, ANY
+
+from common.config import DDB_FRAME_HASH_TABLE
+from common.utils import rekognition as text_rekognition
+
+from ..app import main
+from ..app.main import rekognition, dynamodb, lambda_handler, analyze_frame
+
+
+@pytest.fixture(autouse=True)
+def env_setup(monkeypatch):
+    monkeypatch.setenv('LOGO_MIN_CONFIDENCE', '60')
+    monkeypatch.setenv('LOGO_MODEL_ARN', 'arn:aws:rekognition:us-east-1:206038983416:logo')
+    monkeypatch.setenv('SPORTS_MIN_CONFIDENCE', '70')
+    monkeypatch.setenv('SPORTS_MODEL_ARN', 'arn:aws:rekognition:us-east-1:206038983416:sports')
+    # a single worker analyzes the frames in order, to match the order of the stubbed responses
+    monkeypatch.setattr(main, 'FRAME_ANALYSIS_WORKERS', 1)
+
+
+def frame(n):
+    return {
+        'Stream_ID': 'test_1',
+        'DateTime': f'2020-01-23T21:36:3{n}.290000Z',
+        'Segment_Millis': 1000.5 * n,
+        'S3_Bucket': 'aws-rnd-broadcast-maas-video-processing-dev',
+        'S3_Key': f'frames/test_{n}.jpg'
+    }
+
+
+@pytest.fixture
+def inbound_step_event():
+    return {
+        'parsed': {
+            'expectedProgram': {'Station_Logo': 'Prime Video', 'Sports_Type': 'soccer'},
+        },
+        'config': {
+            'station_logo_check_enabled': True,
+            'team_detect_check_enabled': False,
+            'sports_detect_check_enabled': True
+        },
+        'frames': [frame(0), frame(1)]
+    }
+
+
+@pytest.fixture
+def rekognition_stub():
+    with Stubber(rekognition) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def ddb_stub():
+    with Stubber(dynamodb.meta.client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def custom_labels_params(n, model, min_confidence):
+    return {
+        'MinConfidence': min_confidence,
+        'ProjectVersionArn': f'arn:aws:rekognition:us-east-1:206038983416:{model}',
+        'Image': {'S3Object': {'Bucket': 'aws-rnd-broadcast-maas-video-processing-dev', 'Name': f'frames/test_{n}.jpg'}}
+    }
+
+
+def test_lambda_handler(rekognition_stub, ddb_stub, inbound_step_event):
+    logo = {'Name': 'amazon_prime_video', 'Confidence': 71.5}
+    rekognition_stub.add_response('detect_custom_labels', {'CustomLabels': [logo]},
+                                  custom_labels_params(0, 'logo', 60))
+    rekognition_stub.add_response('detect_custom_labels', {'CustomLabels': [{'Name': 'soccer', 'Confidence': 90.0}]},
+                                  custom_labels_params(0, 'sports', 70))
+    rekognition_stub.add_client_error('detect_custom_labels', 'ResourceNotReadyException',
+                                      expected_params=custom_labels_params(1, 'logo', 60))
+    rekognition_stub.add_response('detect_custom_labels', {'CustomLabels': []}, custom_labels_params(1, 'sports', 70))
+
+    expected_items = [
+        {
+            'Stream_ID': 'test_1',
+            'DateTime': '2020-01-23T21:36:30.290000Z',
+            'Segment_Millis': Decimal('0.0'),
+            'S3_Bucket': 'aws-rnd-broadcast-maas-video-processing-dev',
+            'S3_Key': 'frames/test_0.jpg',
+            'Detected_Station_Logos': [{'Name': 'amazon_prime_video', 'Confidence': Decimal('71.5')}],
+            'Detected_Logo': 'Prime Video',
+            'Detected_Logo_Confidence': Decimal('71.5'),
+            'Expected_Logo': 'Prime Video',
+            'Is_Expected_Logo': True,
+            'Sports_Expected': 'soccer',
+            'Sports_Detected': 'soccer',
+            'Sports_Detected_Confidence': Decimal('90.0'),
+            'Sports_Status': True
+        },
+        {
+            'Stream_ID': 'test_1',
+            'DateTime': '2020-01-23T21:36:31.290000Z',
+            'Segment_Millis': Decimal('1000.5'),
+            'S3_Bucket': 'aws-rnd-broadcast-maas-video-processing-dev',
+            'S3_Key': 'frames/test_1.jpg',
+            'Logo_Detect_Error': 'ResourceNotReadyException',
+            'Sports_Expected': 'soccer',
+            'Sports_Status': False
+        }
+    ]
+    ddb_stub.add_response(
+        'batch_write_item', {'UnprocessedItems': {}},
+        {'RequestItems': {main.DDB_FRAME_TABLE: [{'PutRequest': {'Item': item}} for item in expected_items]}}
+    )
+
+    lambda_handler(inbound_step_event, None)
+
+
+def test_lambda_handler_no_checks_enabled(inbound_step_event):
+    inbound_step_event['config'] = {'station_logo_check_enabled': False, 'audio_check_enabled': True}
+    # nothing to call: the stubs would fail on any request
+    with Stubber(rekognition), Stubber(dynamodb.meta.client):
+        assert lambda_handler(inbound_step_event, None) is None
+
+
+def test_analyze_frame_logo_checks_share_detections(rekognition_stub):
+    detected_logos = {'CustomLabels': [{'Name': 'amazon_prime_video', 'Confidence': 95.0},
+                                       {'Name': 'aston_villa', 'Confidence': 88.0}]}
+    rekognition_stub.add_response('detect_custom_labels', detected_logos, custom_labels_params(0, 'logo', 60))
+    logo_checks = [main.StationLogoCheck(), main.TeamLogoCheck()]
+    attrs, detections = analyze_frame(frame(0), {'Station_Logo': 'Prime Video', 'Team_Info': 'AVL V NOR'},
+                                      {'station_logo_check_enabled', 'team_logo_check_enabled'}, logo_checks)
+
+    # the team logo check renames the detections it matches, which must not leak into the station logo results
+    assert attrs['Detected_Station_Logos'] == detected_logos['CustomLabels']
+    assert attrs['Is_Expected_Logo'] is True
+    assert attrs['Team1_Logo_Detected'] == [{'Confidence': 88.0, 'name': 'Aston Villa', 'id': 'aston_villa'}]
+    assert attrs['Team1_Logo_Status'] is True
+    assert detections == {'Logo_Labels': detected_logos['CustomLabels']}
+
+
+def test_lambda_handler_reuses_similar_frames(rekognition_stub, ddb_stub, inbound_step_event):
+    inbound_step_event['config'] = {'sports_detect_check_enabled': True}
+    frames = [frame(0), frame(1), frame(2)]
+    frames[0]['Frame_Hash'] = '9959309156a15c2b'
+    # 1 bit away from the first frame
+    frames[1]['Frame_Hash'] = '9959309156a15c2a'
+    # 2 bits away from a frame cached by an earlier segment
+    frames[2]['Frame_Hash'] = '00000000000000ff'
+    inbound_step_event['frames'] = frames
+
+    ddb_stub.add_response('query', {'Items': [{
+        'Stream_ID': {'S': 'test_1'},
+        'Frame_Hash': {'S': '00000000000000fc'},
+        'Frame_DateTime': {'S': '2020-01-23T21:35:00.000000Z'},
+        'Detections': {'M': {'Sports_Labels': {'L': [{'M': {'Name': {'S': 'tennis'}, 'Confidence': {'N': '80'}}}]}}},
+        'ExpireTTL': {'N': '1893456000'}
+    }]})
+    rekognition_stub.add_response('detect_custom_labels', {'CustomLabels': [{'Name': 'soccer', 'Confidence': 90.0}]},
+                                  custom_labels_params(0, 'sports', 70))
+
+    def frame_item(n, **attrs):
+        item = main.convert_to_ddb(frames[n])
+        item.update({'Sports_Expected': 'soccer'}, **attrs)
+        return {'PutRequest': {'Item': item}}
+
+    ddb_stub.add_response('batch_write_item', {'UnprocessedItems': {}}, {'RequestItems': {main.DDB_FRAME_TABLE: [
+        frame_item(0, Sports_Detected='soccer', Sports_Detected_Confidence=Decimal('90.0'), Sports_Status=True),
+        frame_item(1, Sports_Detected='soccer', Sports_Detected_Confidence=Decimal('90.0'), Sports_Status=True,
+                   Detections_Reused_From='2020-01-23T21:36:30.290000Z'),
+        frame_item(2, Sports_Detected='tennis', Sports_Detected_Confidence=80.0, Sports_Status=False,
+                   Detections_Reused_From='2020-01-23T21:35:00.000000Z'),
+    ]}})
+    ddb_stub.add_response('batch_write_item', {'UnprocessedItems': {}}, {'RequestItems': {DDB_FRAME_HASH_TABLE: [
+        {'PutRequest': {'Item': {
+            'Stream_ID': 'test_1',
+            'Frame_Hash': '9959309156a15c2b',
+            'Frame_DateTime': '2020-01-23T21:36:30.290000Z',
+            'Detections': {'Sports_Labels': [{'Name': 'soccer', 'Confidence': Decimal('90.0')}]},
+            'ExpireTTL': ANY
+        }}}
+    ]}})
+
+    lambda_handler(inbound_step_event, None)
+
+
+def test_check_frame_without_expected_teams_or_sport():
+    # e.g. a news program, or a segment outside of the schedule
+    detections = {'Text_Detections': [], 'Logo_Labels': [{'Name': 'amazon_prime_video', 'Confidence': 95.0}],
+                  'Sports_Labels': []}
+    attrs = main.check_frame(detections, {'Station_Logo': 'Prime Video', 'Segment_Start_Time_In_Loop': 10.0},
+                             {'team_detect_check_enabled', 'station_logo_check_enabled', 'sports_detect_check_enabled'},
+                             [main.StationLogoCheck()])
+
+    # the team and sports checks have nothing to compare against
+    assert attrs == {'Detected_Lines': [], 'Detected_Words': [], 'Detected_Station_Logos': detections['Logo_Labels'],
+                     'Detected_Logo': 'Prime Video', 'Detected_Logo_Confidence': 95.0, 'Expected_Logo': 'Prime Video',
+                     'Is_Expected_Logo': True}
+
+
+def test_check_frame_failing_check(monkeypatch):
+    def fail(self, expected_program, detected):
+        raise KeyError('Sports_Type')
+
+    monkeypatch.setattr(main.SportsCheck, 'execute', fail)
+    detections = {'Logo_Labels': [{'Name': 'amazon_prime_video', 'Confidence': 95.0}], 'Sports_Labels': []}
+    attrs = main.check_frame(detections, {'Station_Logo': 'Prime Video', 'Sports_Type': 'soccer'},
+                             {'station_logo_check_enabled', 'sports_detect_check_enabled'}, [main.StationLogoCheck()])
+
+    # the failing check doesn't prevent the station logo results from being written
+    assert attrs['Is_Expected_Logo'] is True
+    assert attrs['Sports_Detect_Error'] == 'KeyError'
+
+
+def test_analyze_frame_text_detection_error():
+    with Stubber(text_rekognition) as text_stub:
+        text_stub.add_client_error('detect_text', 'InvalidImageFormatException')
+        attrs, detections = analyze_frame(frame(0), {'Team_Info': 'AVL V NOR'}, {'team_detect_check_enabled'}, [])
+    assert attrs == {'Text_Detect_Error': 'InvalidImageFormatException'}
+    assert detections == {}
@@ -7,18 +7,96 @@ import sys
 sys.path.append('/opt')
 
 import cv2
+import numpy as np
 from common.config import LOG_LEVEL, FRAME_RESIZE_WIDTH, FRAME_RESIZE_HEIGHT, STORE_FRAMES, \
-    DDB_FRAME_TABLE, UTC_TIME_FMT
-from common.utils import upload_to_s3, put_item_ddb
+    DDB_FRAME_TABLE, UTC_TIME_FMT, FRAME_UPLOAD_WORKERS, FRAME_UPLOAD_MAX_PENDING
+from common.segment_analysis import analyze_segment, SELECT_TOLERANCE_SEC
+from common.utils import S3UploadPool, DDBBatchWriter, convert_to_ddb
 
 logger = logging.getLogger('FrameExtractor')
 logger.setLevel(LOG_LEVEL)
 
 S3_KEY_DATE_FMT = "%Y/%m/%d/%H/%M:%S:%f"
+SCENE_SAMPLE_MODE = 'scene'
 
 
 def extract_frames(stream_id, segment_s3_key, video_chunk, video_start_datetime, s3_bucket, frame_s3_prefix,
-                   sample_fps=1):
+                   sample_fps=1, sample_mode='grab', scene_sampling=None):
+    """
+    :param scene_sampling: SceneSampling (see common.segment_analysis) of the scene sample mode
+    """
+    if sample_mode not in SAMPLE_MODES and sample_mode != SCENE_SAMPLE_MODE:
+        valid_modes = ", ".join(list(SAMPLE_MODES) + [SCENE_SAMPLE_MODE])
+        raise ValueError(f'Invalid frame sample mode: {sample_mode} (Valid: {valid_modes})')
+
+    cap = cv2.VideoCapture(video_chunk)
+    try:
+        video_metadata = extract_video_metadata(cap)
+
+        if sample_mode == SCENE_SAMPLE_MODE:
+            logger.info(f'Extracting frames on scene changes: {scene_sampling}')
+            sampled_frames = SceneChangeSampler(*scene_sampling).sample(cap)
+        else:
+            hop = round(video_metadata['fps'] / sample_fps)
+            if hop == 0:
+                hop = 1  # if sample_fps is invalid extract every frame
+            logger.info(f'Extracting every {hop} frame. Sample mode: {sample_mode}')
+            sampled_frames = ((frame_num, frame_timestamp_millis, frame, {})
+                              for frame_num, frame_timestamp_millis, frame in SAMPLE_MODES[sample_mode](cap, hop))
+
+        frames = ((frame_num, frame_timestamp_millis, frame, video_metadata['original_frame_width'],
+                   video_metadata['original_frame_height'], sample_metadata)
+                  for frame_num, frame_timestamp_millis, frame, sample_metadata in sampled_frames)
+        extracted_frames_metadata = store_frames(stream_id, frames, video_start_datetime, s3_bucket, frame_s3_prefix)
+        logger.info(f'Extracted {len(extracted_frames_metadata)} frames from {video_chunk}')
+        return extracted_frames_metadata
+    finally:
+        cv2.destroyAllWindows()
+        cap.release()
+
+
+def extract_frames_from_stream(stream_id, segment_stream, video_start_datetime, s3_bucket, frame_s3_prefix,
+                               sample_fps=1, scene_sampling=None):
+    """
+    Sample frames while the video segment is piped into ffmpeg, e.g. straight from the s3 StreamingBody.
+    OpenCV can only decode from a file, so frames are decoded and sampled by ffmpeg (see common.segment_analysis)
+    :return: A list of extracted frames metadata, same as extract_frames
+    """
+    analysis = analyze_segment(None, sample_fps=sample_fps, audio=False, input_stream=segment_stream,
+                               scene_sampling=scene_sampling)
+    extracted_frames_metadata = store_analyzed_frames(stream_id, analysis.frames, video_start_datetime, s3_bucket,
+                                                      frame_s3_prefix, scene_sampling)
+    logger.info(f'Extracted {len(extracted_frames_metadata)} frames from the segment stream')
+    return extracted_frames_metadata
+
+
+def store_analyzed_frames(stream_id, raw_frames, video_start_datetime, s3_bucket, frame_s3_prefix,
+                          scene_sampling=None):
+    """
+    Store the frames sampled by the single pass segment analysis (see common.segment_analysis)
+    :param raw_frames: list of RawFrame holding bgr24 pixel data
+    :param scene_sampling: SceneSampling of the scene sample mode. raw_frames are then the candidate frames, 1/max_fps
+     seconds apart, and the frames to store are chosen among them by a SceneChangeSampler
+    :return: A list of stored frames metadata, same as extract_frames
+    """
+    frames = ((raw_frame.frame_num, raw_frame.millis,
+               np.frombuffer(raw_frame.data, dtype=np.uint8).reshape((raw_frame.height, raw_frame.width, 3)),
+               raw_frame.width, raw_frame.height)
+              for raw_frame in raw_frames)
+    if scene_sampling:
+        sampled_frames = SceneChangeSampler(*scene_sampling).sample_frames(frames)
+    else:
+        sampled_frames = (frame + ({},) for frame in frames)
+    return store_frames(stream_id, sampled_frames, video_start_datetime, s3_bucket, frame_s3_prefix)
+
+
+def store_frames(stream_id, frames, video_start_datetime, s3_bucket, frame_s3_prefix):
+    """
+    Upload frame images to s3 and persist the metadata of the frames that were uploaded
+    :param frames: iterable of (frame number, timestamp in millis relative to start of video, frame, width, height,
+     metadata of the sampling decision to store with the frame)
+    :return: A list of stored frames metadata
+    """
     if STORE_FRAMES not in ["all", "original", "resized"]:
         raise ValueError(f'Invalid STORE_FRAMES option: {STORE_FRAMES} (Valid: all, original, resized)')
 
@@ -26,70 +104,225 @@ def extract_frames(stream_id, segment_s3_key, video_chunk, video_start_datetime,
     store_resized_frames = STORE_FRAMES in ["all", "resized"]
     logger.info(f'Store original sized frame? {store_original_frames}, Store resized frames? {store_resized_frames}')
 
-    cap = cv2.VideoCapture(video_chunk)
-    extracted_frames_metadata = []
+    frame_writer = DDBBatchWriter(DDB_FRAME_TABLE)
+    stored_frames_metadata = []
+    # (frame metadata, s3 upload futures) for each sampled frame
+    frame_uploads = []
     try:
-        video_metadata = extract_video_metadata(cap)
+        segment_id = f'{stream_id}:{video_start_datetime.strftime(UTC_TIME_FMT)}'
+        # uploads run in the background while decoding continues. exiting the pool waits for all of them to finish
+        with S3UploadPool(max_workers=FRAME_UPLOAD_WORKERS, max_pending=FRAME_UPLOAD_MAX_PENDING) as upload_pool:
+            for frame_num, frame_timestamp_millis, frame, frame_width, frame_height, sampling in frames:
+                # absolute timestamp of the frame
+                frame_datetime = video_start_datetime + timedelta(milliseconds=frame_timestamp_millis)
+                frame_metadata = {'Stream_ID': stream_id,
+                                  'DateTime': frame_datetime.strftime(UTC_TIME_FMT),
+                                  'Segment': segment_id,
+                                  'Segment_Millis': int(frame_timestamp_millis),
+                                  'Segment_Frame_Num': frame_num,
+                                  'S3_Bucket': s3_bucket,
+                                  'Frame_Hash': frame_hash(frame),
+                                  **sampling}
+                uploads = upload_frame_images(upload_pool, frame, frame_datetime, frame_metadata, frame_width,
+                                              frame_height, s3_bucket, frame_s3_prefix, store_original_frames,
+                                              store_resized_frames)
+                frame_uploads.append((frame_metadata, uploads))
 
-        hop = round(video_metadata['fps'] / sample_fps)
-        if hop == 0:
-            hop = 1  # if sample_fps is invalid extract every frame
-        logger.info(f'Extracting every {hop} frame.')
+        # only keep frames whose images all landed in s3
+        for frame_metadata, uploads in frame_uploads:
+            upload_errors = [upload.exception() for upload in uploads if upload.exception() is not None]
+            if upload_errors:
+                logger.error(f'Dropping frame {frame_metadata["DateTime"]}: failed to upload to s3: {upload_errors}')
+                continue
+            # buffer frame metadata to persist in database in batches
+            frame_writer.put_item(convert_to_ddb(frame_metadata))
+            stored_frames_metadata.append(frame_metadata)
+        logger.info(f'Stored {len(stored_frames_metadata)} frames '
+                    f'({len(frame_uploads) - len(stored_frames_metadata)} failed to upload)')
+        return stored_frames_metadata
+    finally:
+        frame_writer.flush()
+
+
+def decode_all_frames(cap, hop):
+    """
+    Decode every frame of the video with read() and keep every hop-th one.
+    :return: generator of (frame number, timestamp in millis relative to start of video, frame)
+    """
+    frame_count = 0
+    while cap.isOpened():
+        success, frame = cap.read()
+        if not success:
+            break
+        if frame_count % hop == 0:
+            yield frame_count, cap.get(cv2.CAP_PROP_POS_MSEC), frame
+        frame_count += 1
+    logger.info(f'Decoded {frame_count} frames')
 
+
+def grab_sampled_frames(cap, hop):
+    """
+    Advance over skipped frames with grab(), and only retrieve() (convert into an image) every hop-th frame.
+    Yields the same frames and timestamps as decode_all_frames without paying for the conversion of discarded frames.
+    :return: generator of (frame number, timestamp in millis relative to start of video, frame)
+    """
+    frame_count = 0
+    while cap.isOpened():
+        if not cap.grab():
+            break
+        if frame_count % hop == 0:
+            success, frame = cap.retrieve()
+            if not success:
+                break
+            yield frame_count, cap.get(cv2.CAP_PROP_POS_MSEC), frame
+        frame_count += 1
+    logger.info(f'Grabbed {frame_count} frames')
+
+
+SAMPLE_MODES = {
+    'decode': decode_all_frames,
+    'grab': grab_sampled_frames
+}
+
+
+def sample_metadata(scene_score, first, threshold):
+    """Why a frame was sampled in the scene sample mode, stored with the frame"""
+    if first:
+        reason = 'first'
+    elif scene_score > threshold:
+        reason = 'scene_change'
+    else:
+        reason = 'interval'
+    return {'Scene_Score': round(scene_score, 4), 'Sample_Reason': reason}
+
+
+class SceneChangeSampler(object):
+    """
+    Samples a frame when the picture changed by more than threshold since the last sampled frame, no more than
+    max_fps frames per second, and at least one frame every 1/min_fps seconds when nothing changes.
+    The change is the mean absolute difference of downscaled grayscale pictures, from 0 (identical) to 1. Comparing
+    with the last sampled frame rather than the previous one also catches gradual changes, like a graphic fading in.
+    Frames within 1/max_fps seconds of the last sampled frame are not looked at: from a VideoCapture they are only
+    grabbed, not converted.
+    """
+
+    def __init__(self, threshold, min_fps, max_fps, size=(64, 36)):
+        self.threshold = threshold
+        self.min_interval_sec = 1.0 / max_fps - SELECT_TOLERANCE_SEC
+        self.max_interval_sec = 1.0 / min_fps - SELECT_TOLERANCE_SEC
+        self.size = size
+        self.last_sampled_sec = None
+        self.last_thumbnail = None
+
+    def thumbnail(self, frame):
+        return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def scene_score(thumbnail, last_thumbnail):
+        return float(cv2.absdiff(thumbnail, last_thumbnail).mean()) / 255
+
+    def is_due(self, frame_sec):
+        """Whether the frame is at least 1/max_fps seconds after the last sampled frame, so it may be sampled"""
+        return self.last_sampled_sec is None or frame_sec - self.last_sampled_sec >= self.min_interval_sec
+
+    def offer(self, frame_sec, frame):
+        """
+        Decide whether to sample a frame that is due
+        :return: the sample metadata of the frame if it's sampled, None otherwise
+        """
+        thumbnail = self.thumbnail(frame)
+        first = self.last_sampled_sec is None
+        score = 0.0 if first else self.scene_score(thumbnail, self.last_thumbnail)
+        if first or score > self.threshold or frame_sec - self.last_sampled_sec >= self.max_interval_sec:
+            self.last_sampled_sec = frame_sec
+            self.last_thumbnail = thumbnail
+            return sample_metadata(score, first, self.threshold)
+        return None
+
+    def sample(self, cap):
+        """
+        :return: generator of (frame number, timestamp in millis relative to start of video, frame, sample metadata)
+        """
         frame_count = 0
-        extracted_frames = 0
+        sampled_count = 0
         while cap.isOpened():
-            success, frame = cap.read()
-            if success:
-                if frame_count % hop == 0:
-                    # timestamp relative to start of video
-                    frame_timestamp_millis = cap.get(cv2.CAP_PROP_POS_MSEC)
-                    # absolute timestamp of the frame
-                    frame_datetime = video_start_datetime + timedelta(milliseconds=frame_timestamp_millis)
-                    segment_id = f'{stream_id}:{video_start_datetime.strftime(UTC_TIME_FMT)}'
-                    frame_metadata = {'Stream_ID': stream_id,
-                                      'DateTime': frame_datetime.strftime(UTC_TIME_FMT),
-                                      'Segment': segment_id,
-                                      'Segment_Millis': int(frame_timestamp_millis),
-                                      'Segment_Frame_Num': frame_count,
-                                      'S3_Bucket': s3_bucket}
-                    if store_original_frames:
-                        jpg = cv2.imencode(".jpg", frame)[1]
-                        # use absolute timestamps for s3 key. might be easier to reason about.
-                        frame_key = os.path.join(frame_s3_prefix, 'original',
-                                                 f'{frame_datetime.strftime(S3_KEY_DATE_FMT)}.jpg')
-                        # TODO: Should we also store the frame metadata in the s3 object?
-                        s3_object_metadata = {'ContentType': 'image/jpeg'}
-                        upload_to_s3(s3_bucket, frame_key, bytearray(jpg), **s3_object_metadata)
-                        frame_metadata['S3_Key'] = frame_key
-                        frame_metadata['Frame_Width'] = int(video_metadata['original_frame_width'])
-                        frame_metadata['Frame_Height'] = int(video_metadata['original_frame_height'])
-                    if store_resized_frames:
-                        resized_frame = cv2.resize(frame, (FRAME_RESIZE_WIDTH, FRAME_RESIZE_HEIGHT))
-                        resized_jpg = cv2.imencode(".jpg", resized_frame)[1]
-                        # use absolute timestamps for s3 key. might be easier to reason about.
-                        resized_frame_key = os.path.join(frame_s3_prefix, 'resized',
-                                                         f'{frame_datetime.strftime(S3_KEY_DATE_FMT)}.jpg')
-                        s3_object_metadata = {'ContentType': 'image/jpeg'}
-                        upload_to_s3(s3_bucket, resized_frame_key, bytearray(resized_jpg), **s3_object_metadata)
-                        if 'S3_Key' in frame_metadata:
-                            frame_metadata['Resized_S3_Key'] = resized_frame_key
-                        else:
-                            frame_metadata['S3_Key'] = frame_key
-                            frame_metadata['Frame_Width'] = FRAME_RESIZE_WIDTH
-                            frame_metadata['Frame_Height'] = FRAME_RESIZE_HEIGHT
-                    # persist frame metadata in database
-                    put_item_ddb(DDB_FRAME_TABLE, frame_metadata)
-                    extracted_frames_metadata.append(frame_metadata)
-                    extracted_frames += 1
-                frame_count += 1
-            else:
+            if not cap.grab():
                 break
-        logger.info(f'Extracted {extracted_frames} out of {frame_count} frames from {video_chunk}')
-        return extracted_frames_metadata
-    finally:
-        cv2.destroyAllWindows()
-        cap.release()
+            frame_millis = cap.get(cv2.CAP_PROP_POS_MSEC)
+            if self.is_due(frame_millis / 1000):
+                success, frame = cap.retrieve()
+                if not success:
+                    break
+                sampling = self.offer(frame_millis / 1000, frame)
+                if sampling is not None:
+                    yield frame_count, frame_millis, frame, sampling
+                    sampled_count += 1
+            frame_count += 1
+        logger.info(f'Sampled {sampled_count} out of {frame_count} frames on scene changes')
+
+    def sample_frames(self, frames):
+        """
+        Same as sample, from frames already decoded, e.g. the candidate frames of the segment analysis
+        :param frames: iterable of (frame number, timestamp in millis relative to start of video, frame, width,
+         height), in order
+        :return: generator of (frame number, timestamp in millis, frame, width, height, sample metadata)
+        """
+        frame_count = 0
+        sampled_count = 0
+        for frame_num, frame_millis, frame, width, height in frames:
+            frame_count += 1
+            if self.is_due(frame_millis / 1000):
+                sampling = self.offer(frame_millis / 1000, frame)
+                if sampling is not None:
+                    yield frame_num, frame_millis, frame, width, height, sampling
+                    sampled_count += 1
+        logger.info(f'Sampled {sampled_count} out of {frame_count} candidate frames on scene changes')
+
+
+def frame_hash(frame, hash_size=8):
+    """
+    Perceptual difference hash (dHash) of the frame: shrink it to (hash_size + 1) x hash_size grayscale pixels, and
+    set a bit for every pixel brighter than its right neighbour. Visually identical frames get hashes a few bits apart
+    despite encoding noise.
+    :return: the hash as a hex string, 16 characters for the default 64 bits
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] < small[:, :-1]).flatten()
+    return f'{int("".join("1" if bit else "0" for bit in bits), 2):0{hash_size * hash_size // 4}x}'
+
+
+def upload_frame_images(upload_pool, frame, frame_datetime, frame_metadata, frame_width, frame_height, s3_bucket,
+                        frame_s3_prefix, store_original_frames, store_resized_frames):
+    """
+    Encode the frame (original and/or resized) as jpg and queue the s3 uploads.
+    The s3 keys and frame dimensions are added to frame_metadata.
+    :return: the upload futures for the frame
+    """
+    uploads = []
+    s3_object_metadata = {'ContentType': 'image/jpeg'}
+    # use absolute timestamps for s3 key. might be easier to reason about.
+    frame_file_name = f'{frame_datetime.strftime(S3_KEY_DATE_FMT)}.jpg'
+    if store_original_frames:
+        jpg = cv2.imencode(".jpg", frame)[1]
+        frame_key = os.path.join(frame_s3_prefix, 'original', frame_file_name)
+        # TODO: Should we also store the frame metadata in the s3 object?
+        uploads.append(upload_pool.submit(s3_bucket, frame_key, bytearray(jpg), **s3_object_metadata))
+        frame_metadata['S3_Key'] = frame_key
+        frame_metadata['Frame_Width'] = int(frame_width)
+        frame_metadata['Frame_Height'] = int(frame_height)
+    if store_resized_frames:
+        resized_frame = cv2.resize(frame, (FRAME_RESIZE_WIDTH, FRAME_RESIZE_HEIGHT))
+        resized_jpg = cv2.imencode(".jpg", resized_frame)[1]
+        resized_frame_key = os.path.join(frame_s3_prefix, 'resized', frame_file_name)
+        uploads.append(upload_pool.submit(s3_bucket, resized_frame_key, bytearray(resized_jpg), **s3_object_metadata))
+        if 'S3_Key' in frame_metadata:
+            frame_metadata['Resized_S3_Key'] = resized_frame_key
+        else:
+            frame_metadata['S3_Key'] = resized_frame_key
+            frame_metadata['Frame_Width'] = FRAME_RESIZE_WIDTH
+            frame_metadata['Frame_Height'] = FRAME_RESIZE_HEIGHT
+    return uploads
 
 
 def extract_video_metadata(cap):
@@ -6,15 +6,25 @@ import sys
 
 sys.path.append('/opt')
 
-from common.utils import download_file_from_s3, parse_date_time_from_str, cleanup_dir
-from common.config import LOG_LEVEL, S3_BUCKET, FRAME_SAMPLE_FPS
+from common.utils import download_file_from_s3, open_s3_stream, parse_date_time_from_str, cleanup_dir
+from common.config import LOG_LEVEL, S3_BUCKET, FRAME_SAMPLE_FPS, FRAME_SAMPLE_MODE, SILENCE_THRESHOLD, \
+    SILENCE_DURATION, SILENCE_EDGE_DURATION, SEGMENT_INPUT_MODE, AUDIO_ENGINE, FRAME_SCENE_THRESHOLD, \
+    FRAME_SAMPLE_MIN_FPS, FRAME_SAMPLE_MAX_FPS
+from common.segment_analysis import analyze_segment, convert_audio_results, SceneSampling
 
-from frame_extractor import extract_frames
+from frame_extractor import extract_frames, extract_frames_from_stream, store_analyzed_frames, SCENE_SAMPLE_MODE
 
 logging.basicConfig()
 logger = logging.getLogger('FrameExtractor')
 logger.setLevel(LOG_LEVEL)
 
+# the sample mode also applies to frames sampled by ffmpeg, which only has the fixed rate and scene modes
+SCENE_SAMPLING = (SceneSampling(FRAME_SCENE_THRESHOLD, FRAME_SAMPLE_MIN_FPS, FRAME_SAMPLE_MAX_FPS)
+                  if FRAME_SAMPLE_MODE == SCENE_SAMPLE_MODE else None)
+if SEGMENT_INPUT_MODE == 'stream' and SCENE_SAMPLING is None:
+    logger.warning(f'Frames are sampled by ffmpeg at a fixed rate in the stream input mode, '
+                   f'FRAME_SAMPLE_MODE={FRAME_SAMPLE_MODE} only applies to the download input mode')
+
 
 @cleanup_dir()
 def lambda_handler(event, context):
@@ -56,16 +66,86 @@ def lambda_handler(event, context):
     ]
     """
     logger.info('Received event: %s', json.dumps(event, indent=2))
+    # the single pass segment analysis already sampled and stored the frames
+    if event.get('analysis', {}).get('frames') is not None:
+        logger.info('Using frames extracted by the segment analysis')
+        return event['analysis']['frames']
+
     manifest_s3_key = event['s3Key']
     manifest_s3_bucket = event['s3Bucket']
     segment_s3_key = event['parsed']['lastSegment']['s3Key']
     starting_time_str = event['parsed']['lastSegment']['startDateTime']
     starting_time = parse_date_time_from_str(starting_time_str)
     stream_id = event['parsed']['streamId']
-    # the cleanup_dir decorator will ensure the tmp/ working directory gets cleaned up if lambda container is reused
-    segment_file = download_file_from_s3(manifest_s3_bucket, segment_s3_key)
     frame_s3_prefix = os.path.splitext(manifest_s3_key.replace('live', 'frames'))[0]
     logger.info(f'S3 prefix for extracted frames: {frame_s3_prefix}')
+    if SEGMENT_INPUT_MODE == 'stream':
+        segment_stream = open_s3_stream(manifest_s3_bucket, segment_s3_key)
+        return extract_frames_from_stream(stream_id, segment_stream, starting_time, S3_BUCKET, frame_s3_prefix,
+                                          FRAME_SAMPLE_FPS, SCENE_SAMPLING)
+
+    # the cleanup_dir decorator will ensure the tmp/ working directory gets cleaned up if lambda container is reused
+    segment_file = download_file_from_s3(manifest_s3_bucket, segment_s3_key)
     frames = extract_frames(stream_id, segment_s3_key, segment_file, starting_time, S3_BUCKET, frame_s3_prefix,
-                            FRAME_SAMPLE_FPS)
+                            FRAME_SAMPLE_FPS, FRAME_SAMPLE_MODE, SCENE_SAMPLING)
     return frames
+
+
+@cleanup_dir()
+def segment_analysis_lambda_handler(event, context):
+    """
+    Download the video segment once and analyze it with a single ffmpeg pass: container start time, audio volume
+    and silence, and sampled frames. The sampled frames are uploaded and their metadata stored the same way as
+    lambda_handler does. Find Expected Program, Audio Detection and Extract Frames reuse these results
+    instead of each downloading and decoding the segment again.
+    :param event: same as lambda_handler
+    :param context: lambda context object https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
+    :return: e.g.
+    {
+      "startTimeRelative": 137.435,
+      "audio": {                    # null if the audio check is disabled or uses the numpy audio engine
+        "volume": {
+          "mean": -22.0,
+          "max": -4.3
+        },
+        "silence_chunks": [
+          { "start": 1.33494, "end": 1.84523 }
+        ]
+      },
+      "frames": [                   # same as the return value of lambda_handler
+        ...
+      ]
+    }
+    """
+    logger.info('Received event: %s', json.dumps(event, indent=2))
+    manifest_s3_key = event['s3Key']
+    manifest_s3_bucket = event['s3Bucket']
+    segment_s3_key = event['parsed']['lastSegment']['s3Key']
+    starting_time = parse_date_time_from_str(event['parsed']['lastSegment']['startDateTime'])
+    stream_id = event['parsed']['streamId']
+    # the numpy audio engine decodes the audio on its own in the Audio Detection function
+    analyze_audio = event.get('config', {}).get('audio_check_enabled', False) and AUDIO_ENGINE == 'ffmpeg'
+
+    if SEGMENT_INPUT_MODE == 'stream':
+        analysis = analyze_segment(None, sample_fps=FRAME_SAMPLE_FPS, audio=analyze_audio,
+                                   threshold=SILENCE_THRESHOLD, duration=SILENCE_DURATION,
+                                   edge_duration=SILENCE_EDGE_DURATION, scene_sampling=SCENE_SAMPLING,
+                                   input_stream=open_s3_stream(manifest_s3_bucket, segment_s3_key))
+    else:
+        segment_file = download_file_from_s3(manifest_s3_bucket, segment_s3_key)
+        analysis = analyze_segment(segment_file, sample_fps=FRAME_SAMPLE_FPS, audio=analyze_audio,
+                                   threshold=SILENCE_THRESHOLD, duration=SILENCE_DURATION,
+                                   edge_duration=SILENCE_EDGE_DURATION, scene_sampling=SCENE_SAMPLING)
+
+    frame_s3_prefix = os.path.splitext(manifest_s3_key.replace('live', 'frames'))[0]
+    logger.info(f'S3 prefix for extracted frames: {frame_s3_prefix}')
+    frames = store_analyzed_frames(stream_id, analysis.frames, starting_time, S3_BUCKET, frame_s3_prefix,
+                                   SCENE_SAMPLING)
+
+    return {
+        'startTimeRelative': analysis.start_time,
+        'audio': convert_audio_results(analysis.volume, analysis.silence_chunks, analysis.channel_volumes,
+                                       analysis.loudness,
+                                       edge_silence_chunks=analysis.edge_silence_chunks) if analyze_audio else None,
+        'frames': frames
+    }
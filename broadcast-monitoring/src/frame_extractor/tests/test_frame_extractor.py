@@ -0,0 +1,78 @@
+import numpy as np
+
+from ..frame_extractor import SceneChangeSampler, sample_metadata
+
+FPS = 10
+
+
+def gray_frame(level):
+    return np.full((36, 64, 3), level, dtype=np.uint8)
+
+
+def frame_level(n):
+    """Black, cut to white at 0.3s, fading out from 1s to 3s, then still"""
+    if n < 3:
+        return 0
+    if n < 10:
+        return 255
+    return max(55, 255 - 10 * (n - 9))
+
+
+FRAMES = [(n, n * 1000 / FPS, gray_frame(frame_level(n))) for n in range(100)]
+
+
+class FakeCapture(object):
+    """The VideoCapture calls of SceneChangeSampler.sample, over FRAMES"""
+
+    def __init__(self):
+        self.position = -1
+        self.retrieved = 0
+
+    def isOpened(self):
+        return True
+
+    def grab(self):
+        self.position += 1
+        return self.position < len(FRAMES)
+
+    def retrieve(self):
+        self.retrieved += 1
+        return True, FRAMES[self.position][2]
+
+    def get(self, prop):
+        return FRAMES[self.position][1]
+
+
+def sampler():
+    return SceneChangeSampler(threshold=0.1, min_fps=0.2, max_fps=2)
+
+
+def test_sample_metadata():
+    assert sample_metadata(0.0, True, 0.1) == {'Scene_Score': 0.0, 'Sample_Reason': 'first'}
+    assert sample_metadata(0.123456, False, 0.1) == {'Scene_Score': 0.1235, 'Sample_Reason': 'scene_change'}
+    assert sample_metadata(0.05, False, 0.1) == {'Scene_Score': 0.05, 'Sample_Reason': 'interval'}
+
+
+def test_scene_change_sampler():
+    cap = FakeCapture()
+    sampled = [(frame_num, sampling['Sample_Reason']) for frame_num, _, _, sampling in sampler().sample(cap)]
+    assert sampled == [
+        (0, 'first'),
+        # the cut 0.3s after the first frame, as soon as the max rate allows
+        (5, 'scene_change'),
+        # the fade, compared with the last sampled frame although consecutive frames barely change
+        (12, 'scene_change'), (17, 'scene_change'), (22, 'scene_change'), (27, 'scene_change'),
+        # nothing changes anymore, one frame every 5 seconds
+        (77, 'interval')
+    ]
+    # the 4 frames within 1/max_fps seconds after each sampled frame are not converted
+    assert cap.retrieved == len(FRAMES) - 4 * len(sampled)
+
+
+def test_scene_change_sampler_from_candidate_frames():
+    # candidate frames of the segment analysis, 1/max_fps seconds apart
+    candidates = [(n, millis, frame, 64, 36) for n, millis, frame in FRAMES[::5]]
+    sampled = [(frame_num, sampling['Sample_Reason']) for frame_num, _, _, _, _, sampling
+               in sampler().sample_frames(candidates)]
+    assert sampled == [(0, 'first'), (5, 'scene_change'), (15, 'scene_change'), (20, 'scene_change'),
+                       (25, 'scene_change'), (30, 'scene_change'), (80, 'interval')]
@@ -5,19 +5,27 @@
 import logging
 import json
 import os
+import boto3
 # layers
 import sys
 
 sys.path.append('/opt')
-from common.config import LOG_LEVEL, DDB_FRAGMENT_TABLE
-from common.manifest_parser import is_master_manifest, get_last_segment_and_start_timestamp
+from common.config import LOG_LEVEL, DDB_FRAGMENT_TABLE, MANIFEST_TAIL_BYTES, SEGMENT_BACKFILL_MAX
+from common.manifest_parser import parse_manifest_tail, parse_playlist
 from common.utils import get_s3_object_latest_version_id, read_file_from_s3_w_versionid, parse_date_time_to_str, \
-    put_item_ddb, convert_float_to_dec
+    put_item_ddb, convert_float_to_dec, read_file_tail_from_s3, parse_date_time_from_str
 
 logging.basicConfig()
 logger = logging.getLogger('ManifestParser')
 logger.setLevel(LOG_LEVEL)
 
+try:
+    from .watermark import StreamWatermark
+except ImportError:
+    from watermark import StreamWatermark
+
+sfn_client = boto3.client('stepfunctions')
+
 
 def lambda_handler(event, context):
     """
@@ -29,13 +37,16 @@ def lambda_handler(event, context):
         "Input": {
           "s3Bucket": "aws-rnd-broadcast-maas-video-processing-dev",
           "s3Key": "live/test_video_single_pipeline/test_1.m3u8",
-          "s3VersionId": "T.Lfm.fslzaZa5lkV_bJrI.MmrQG7mE_"
+          "s3VersionId": "T.Lfm.fslzaZa5lkV_bJrI.MmrQG7mE_",
+          "segmentStartDateTime": "2020-01-23T21:36:35.290000Z" # only in executions started to backfill a
+           segment, see process_new_segments
         }
     }
     :param context: lambda context object https://docs.aws.amazon.com/lambda/latest/dg/python-context-object.html
     :return: whether this is a master manifest. If it's child manifest, find the latest segment and starting date time.
     {
         "isMasterManifest": false,
+        "hasNewSegment": true, # false when the segment was already processed by another execution
         "streamId": "test_1",
         "lastSegment": { # only if isMasterManifest = false
             "s3Key": "live/test_video_single_pipeline/test_1_00039.ts",
@@ -45,43 +56,173 @@ def lambda_handler(event, context):
     }
     """
     logger.info('Received event: %s', json.dumps(event, indent=2))
+    if SEGMENT_BACKFILL_MAX > 0:
+        return process_new_segments(event)
+
     s3_bucket = event['Input']['s3Bucket']
     manifest_s3_key = event['Input']['s3Key']
     manifest_s3_version_id = event['Input']['s3VersionId']
 
-    manifest_content = read_file_from_s3_w_versionid(s3_bucket, manifest_s3_key, manifest_s3_version_id)
-    if is_master_manifest(manifest_content):
+    manifest = read_manifest_tail(s3_bucket, manifest_s3_key, manifest_s3_version_id)
+    if manifest.is_master:
         logger.info('Is master manifest. Skip processing')
         return {'isMasterManifest': True}
+    result = record_segment(event, manifest.segment, manifest.start_time, manifest.duration_sec)
+    logger.info('Response : %s', json.dumps(result, indent=2))
+    return result
+
+
+def process_new_segments(event):
+    """
+    Parse the end of the manifest and claim its last segment in the stream watermark table. The segments appended
+    since the previously claimed one, up to SEGMENT_BACKFILL_MAX, are each processed by an execution of their own,
+    started here with the start time of the segment in its input. Such an execution processes that segment without
+    claiming. This covers segments missed when notifications of the manifest race or are dropped; a segment is claimed
+    before it's analyzed, so one whose execution fails later isn't processed again.
+    The manifest is only read whole when the previously claimed segment isn't in its last MANIFEST_TAIL_BYTES.
+    :return: same as lambda_handler, with hasNewSegment false when there's nothing left for this execution to process
+    """
+    s3_bucket = event['Input']['s3Bucket']
+    manifest_s3_key = event['Input']['s3Key']
+    manifest_s3_version_id = event['Input']['s3VersionId']
+    stream_id = get_stream_id(manifest_s3_key)
+
+    playlist = read_playlist(s3_bucket, manifest_s3_key, manifest_s3_version_id)
+    if playlist.is_master:
+        logger.info('Is master manifest. Skip processing')
+        return {'isMasterManifest': True}
+
+    if 'segmentStartDateTime' in event['Input']:
+        start_time = parse_date_time_from_str(event['Input']['segmentStartDateTime'])
+        segment = playlist.segment_at(start_time)
+        if segment is None and playlist.partial:
+            playlist = read_playlist(s3_bucket, manifest_s3_key, manifest_s3_version_id, tail=False)
+            segment = playlist.segment_at(start_time)
+        if segment is None:
+            logger.warning(f'Segment starting at {event["Input"]["segmentStartDateTime"]} is no longer in '
+                           f'{manifest_s3_key}')
+            return {'isMasterManifest': False, 'hasNewSegment': False}
     else:
-        last_segment, starting_time, duration_sec = get_last_segment_and_start_timestamp(manifest_content)
-        segment_s3_key = os.path.join(os.path.dirname(manifest_s3_key), last_segment)
-        segment_s3_version_id = get_s3_object_latest_version_id(s3_bucket, segment_s3_key)
-        stream_id = os.path.splitext(os.path.basename(manifest_s3_key))[0]
-        starting_time_str = parse_date_time_to_str(starting_time)
-
-        fragment_ddb_entry = {
-            'SFNArn': event['Execution'],
-            'Stream_ID': stream_id,
-            'Start_DateTime': starting_time_str,
-            'S3_Key': segment_s3_key,
-            'S3_VersionID': segment_s3_version_id,
-            'Duration_Sec': convert_float_to_dec(duration_sec)
-        }
-        put_item_ddb(DDB_FRAGMENT_TABLE, fragment_ddb_entry)
-
-        result = {'isMasterManifest': False,
-                  'streamId': stream_id,
-                  'lastSegment': {
-                      's3Key': segment_s3_key,
-                      'versionId': segment_s3_version_id,
-                      'durationSec': duration_sec,
-                      "startDateTime": starting_time_str}
-                  }
-        logger.info('Response : %s', json.dumps(result, indent=2))
+        segment = playlist.last_segment
+        if segment is not None and segment.program_date_time is None and playlist.partial:
+            logger.info('No program date time for the last segment in the last %d bytes, reading the whole manifest',
+                        MANIFEST_TAIL_BYTES)
+            playlist = read_playlist(s3_bucket, manifest_s3_key, manifest_s3_version_id, tail=False)
+            segment = playlist.last_segment
+        if segment is None:
+            logger.info(f'No segment in {manifest_s3_key}')
+            return {'isMasterManifest': False, 'hasNewSegment': False}
+        if segment.program_date_time is None:
+            raise ValueError(f'No program date time for segment {segment.uri} in {manifest_s3_key}')
+        claimed, previous_start_time = StreamWatermark(stream_id).claim(segment)
+        if not claimed:
+            return {'isMasterManifest': False, 'hasNewSegment': False}
+        if previous_start_time is not None:
+            if playlist.partial and not playlist.starts_by(previous_start_time):
+                logger.info(f'Segments since {previous_start_time} are not all in the last {MANIFEST_TAIL_BYTES} '
+                            f'bytes, reading the whole manifest')
+                playlist = read_playlist(s3_bucket, manifest_s3_key, manifest_s3_version_id, tail=False)
+            start_backfill_executions(event, playlist, previous_start_time, segment.program_date_time)
+
+    result = record_segment(event, segment.uri, segment.program_date_time, segment.duration_sec)
+    logger.info('Response : %s', json.dumps(result, indent=2))
     return result
 
 
+def start_backfill_executions(event, playlist, previous_start_time, last_start_time):
+    """
+    Start an execution for each segment of the playlist starting between previous_start_time and last_start_time,
+    the most recent SEGMENT_BACKFILL_MAX of them
+    """
+    missed = playlist.segments_between(previous_start_time, last_start_time)
+    if not playlist.starts_by(previous_start_time):
+        logger.warning(f'Some segments after {previous_start_time} are no longer in the manifest')
+    if len(missed) > SEGMENT_BACKFILL_MAX:
+        logger.warning(f'Skipping {len(missed) - SEGMENT_BACKFILL_MAX} segments after {previous_start_time}, '
+                       f'only backfilling the last {SEGMENT_BACKFILL_MAX}')
+        missed = missed[-SEGMENT_BACKFILL_MAX:]
+
+    state_machine_arn = get_state_machine_arn(event['Execution'])
+    for segment in missed:
+        start_date_time = parse_date_time_to_str(segment.program_date_time)
+        state_machine_input = dict(event['Input'], segmentStartDateTime=start_date_time)
+        response = sfn_client.start_execution(stateMachineArn=state_machine_arn, input=json.dumps(state_machine_input))
+        logger.info(f'Started SFN execution for segment {segment.uri}: {response["executionArn"]}')
+
+
+def get_state_machine_arn(execution_arn):
+    """
+    arn:aws:states:<region>:<account>:execution:<state machine>:<execution>
+     -> arn:aws:states:<region>:<account>:stateMachine:<state machine>
+    """
+    arn_parts = execution_arn.split(':')
+    arn_parts[5] = 'stateMachine'
+    return ':'.join(arn_parts[:7])
+
+
+def get_stream_id(manifest_s3_key):
+    return os.path.splitext(os.path.basename(manifest_s3_key))[0]
+
+
+def record_segment(event, segment, starting_time, duration_sec):
+    """
+    Save the segment to process in the segment table
+    :return: the result of lambda_handler for the segment
+    """
+    s3_bucket = event['Input']['s3Bucket']
+    manifest_s3_key = event['Input']['s3Key']
+    segment_s3_key = os.path.join(os.path.dirname(manifest_s3_key), segment)
+    segment_s3_version_id = get_s3_object_latest_version_id(s3_bucket, segment_s3_key)
+    stream_id = get_stream_id(manifest_s3_key)
+    starting_time_str = parse_date_time_to_str(starting_time)
+
+    fragment_ddb_entry = {
+        'SFNArn': event['Execution'],
+        'Stream_ID': stream_id,
+        'Start_DateTime': starting_time_str,
+        'S3_Key': segment_s3_key,
+        'S3_VersionID': segment_s3_version_id,
+        'Duration_Sec': convert_float_to_dec(duration_sec)
+    }
+    put_item_ddb(DDB_FRAGMENT_TABLE, fragment_ddb_entry)
+
+    return {'isMasterManifest': False,
+            'hasNewSegment': True,
+            'streamId': stream_id,
+            'lastSegment': {
+                's3Key': segment_s3_key,
+                'versionId': segment_s3_version_id,
+                'durationSec': duration_sec,
+                "startDateTime": starting_time_str}
+            }
+
+
+def read_playlist(s3_bucket, s3_key, s3_version_id, tail=True):
+    """
+    Parse the manifest into a MediaPlaylist, from only its last MANIFEST_TAIL_BYTES when tail is True
+    """
+    if tail and MANIFEST_TAIL_BYTES > 0:
+        manifest_content, partial = read_file_tail_from_s3(s3_bucket, s3_key, s3_version_id, MANIFEST_TAIL_BYTES)
+        return parse_playlist(manifest_content, partial=partial)
+    return parse_playlist(read_file_from_s3_w_versionid(s3_bucket, s3_key, s3_version_id))
+
+
+def read_manifest_tail(s3_bucket, s3_key, s3_version_id):
+    """
+    Parse the end of the manifest, from only its last MANIFEST_TAIL_BYTES when they hold all the info needed
+    :return: ManifestTail
+    """
+    if MANIFEST_TAIL_BYTES > 0:
+        manifest_content, partial = read_file_tail_from_s3(s3_bucket, s3_key, s3_version_id, MANIFEST_TAIL_BYTES)
+        manifest = parse_manifest_tail(manifest_content, partial=partial)
+        if manifest.complete:
+            return manifest
+        logger.info('No program date time for the last segment in the last %d bytes, reading the whole manifest',
+                    MANIFEST_TAIL_BYTES)
+    manifest_content = read_file_from_s3_w_versionid(s3_bucket, s3_key, s3_version_id)
+    return parse_manifest_tail(manifest_content)
+
+
 if __name__ == '__main__':
     data = {
         "s3Bucket": "aws-rnd-broadcast-maas-video-processing-dev",
@@ -0,0 +1,173 @@
+import io
+import json
+from datetime import datetime
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from common.manifest_parser import PlaylistSegment
+from common.utils import s3, dynamodb
+from .. import main
+from ..main import lambda_handler, sfn_client, get_state_machine_arn
+from ..watermark import StreamWatermark
+
+EXECUTION_ARN = 'arn:aws:states:us-east-1:123456789012:execution:test:exec-1'
+MANIFEST_HEADER = b'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:7\n#EXT-X-MEDIA-SEQUENCE:10\n'
+# a program date time for every segment, 6 seconds apart from 2020-01-21T16:57:47.922Z
+MANIFEST = MANIFEST_HEADER + b''.join(b'#EXT-X-PROGRAM-DATE-TIME:2020-01-21T16:%02d:%02d.922Z\n#EXTINF:6.0,\n'
+                                      b'test_1_%05d.ts\n' % (57 + (47 + 6 * i) // 60, (47 + 6 * i) % 60, 10 + i)
+                                      for i in range(10))
+# the last 3 segments
+TAIL_BYTES = len(MANIFEST) - MANIFEST.index(b'test_1_00016.ts\n')
+SEGMENT = PlaylistSegment('test_1_00019.ts', 19, 0, 6.0, datetime(2020, 1, 21, 16, 58, 41, 922000), False)
+
+
+@pytest.fixture()
+def stubs():
+    with Stubber(s3) as s3_stub, Stubber(dynamodb.meta.client) as ddb_stub, Stubber(sfn_client) as sfn_stub:
+        yield s3_stub, ddb_stub, sfn_stub
+        s3_stub.assert_no_pending_responses()
+        ddb_stub.assert_no_pending_responses()
+        sfn_stub.assert_no_pending_responses()
+
+
+def event(**extra_input):
+    return {'Execution': EXECUTION_ARN,
+            'Input': dict({'s3Bucket': 'test-bucket', 's3Key': 'live/test_1.m3u8', 's3VersionId': 'v1'},
+                          **extra_input)}
+
+
+def add_manifest_response(s3_stub):
+    s3_stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(MANIFEST), len(MANIFEST))},
+                         {'Bucket': 'test-bucket', 'Key': 'live/test_1.m3u8', 'VersionId': 'v1'})
+
+
+def add_manifest_tail_response(s3_stub):
+    tail = MANIFEST[-TAIL_BYTES:]
+    s3_stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(tail), len(tail)),
+                                        'ContentRange': f'bytes {len(MANIFEST) - TAIL_BYTES}-{len(MANIFEST) - 1}/'
+                                                        f'{len(MANIFEST)}'},
+                         {'Bucket': 'test-bucket', 'Key': 'live/test_1.m3u8', 'VersionId': 'v1',
+                          'Range': f'bytes=-{TAIL_BYTES}'})
+
+
+def add_claim_response(ddb_stub, previous_start):
+    ddb_stub.add_response('update_item', {'Attributes': {'Start_DateTime': {'S': previous_start}}},
+                          {'TableName': ANY, 'Key': {'Stream_ID': 'test_1'}, 'UpdateExpression': ANY,
+                           'ConditionExpression': ANY, 'ReturnValues': 'UPDATED_OLD',
+                           'ExpressionAttributeValues': ANY})
+
+
+def add_backfill_responses(sfn_stub, start_date_times):
+    for start_date_time in start_date_times:
+        sfn_stub.add_response('start_execution', {'executionArn': f'{EXECUTION_ARN}-{start_date_time}',
+                                                  'startDate': datetime(2020, 1, 21)},
+                              {'stateMachineArn': get_state_machine_arn(EXECUTION_ARN),
+                               'input': json.dumps(event(segmentStartDateTime=start_date_time)['Input'])})
+
+
+def test_get_state_machine_arn():
+    assert get_state_machine_arn(EXECUTION_ARN) == 'arn:aws:states:us-east-1:123456789012:stateMachine:test'
+
+
+def test_claim_returns_previous_start_time(stubs):
+    _, ddb_stub, _ = stubs
+    ddb_stub.add_response('update_item', {'Attributes': {'Start_DateTime': {'S': '2020-01-21T16:58:17.922000Z'}}},
+                          {'TableName': 'watermark', 'Key': {'Stream_ID': 'test_1'}, 'UpdateExpression': ANY,
+                           'ConditionExpression': ANY, 'ReturnValues': 'UPDATED_OLD',
+                           'ExpressionAttributeValues': {':start': '2020-01-21T16:58:41.922000Z',
+                                                         ':uri': 'test_1_00019.ts'}})
+    ddb_stub.add_response('update_item', {}, {'TableName': 'watermark', 'Key': {'Stream_ID': 'test_1'},
+                                              'UpdateExpression': ANY, 'ConditionExpression': ANY,
+                                              'ReturnValues': 'UPDATED_OLD', 'ExpressionAttributeValues': ANY})
+
+    watermark = StreamWatermark('test_1', table_name='watermark')
+    assert watermark.claim(SEGMENT) == (True, datetime(2020, 1, 21, 16, 58, 17, 922000))
+    # first segment of the stream
+    assert watermark.claim(SEGMENT) == (True, None)
+
+
+def test_claim_fails_for_claimed_segment(stubs):
+    _, ddb_stub, _ = stubs
+    ddb_stub.add_client_error('update_item', service_error_code='ConditionalCheckFailedException')
+
+    assert StreamWatermark('test_1', table_name='watermark').claim(SEGMENT) == (False, None)
+
+
+def test_lambda_handler_backfills_missed_segments(stubs, monkeypatch):
+    s3_stub, ddb_stub, sfn_stub = stubs
+    monkeypatch.setattr(main, 'SEGMENT_BACKFILL_MAX', 2)
+    monkeypatch.setattr(main, 'get_s3_object_latest_version_id', lambda bucket, key: 'segment-v1')
+    add_manifest_response(s3_stub)
+    # segment 15
+    add_claim_response(ddb_stub, '2020-01-21T16:58:17.922000Z')
+    # 16 is skipped, only the last 2 missed segments are backfilled
+    add_backfill_responses(sfn_stub, ['2020-01-21T16:58:29.922000Z', '2020-01-21T16:58:35.922000Z'])
+    ddb_stub.add_response('put_item', {}, {'TableName': ANY, 'Item': ANY})
+
+    result = lambda_handler(event(), None)
+    assert result['hasNewSegment'] is True
+    assert result['lastSegment']['s3Key'] == 'live/test_1_00019.ts'
+    assert result['lastSegment']['startDateTime'] == '2020-01-21T16:58:41.922000Z'
+
+
+def test_lambda_handler_backfills_from_manifest_tail(stubs, monkeypatch):
+    s3_stub, ddb_stub, sfn_stub = stubs
+    monkeypatch.setattr(main, 'SEGMENT_BACKFILL_MAX', 2)
+    monkeypatch.setattr(main, 'MANIFEST_TAIL_BYTES', TAIL_BYTES)
+    monkeypatch.setattr(main, 'get_s3_object_latest_version_id', lambda bucket, key: 'segment-v1')
+    add_manifest_tail_response(s3_stub)
+    # segment 17, in the tail: the whole manifest isn't read
+    add_claim_response(ddb_stub, '2020-01-21T16:58:29.922000Z')
+    add_backfill_responses(sfn_stub, ['2020-01-21T16:58:35.922000Z'])
+    ddb_stub.add_response('put_item', {}, {'TableName': ANY, 'Item': ANY})
+
+    result = lambda_handler(event(), None)
+    assert result['lastSegment']['s3Key'] == 'live/test_1_00019.ts'
+
+
+def test_lambda_handler_backfills_beyond_manifest_tail(stubs, monkeypatch):
+    s3_stub, ddb_stub, sfn_stub = stubs
+    monkeypatch.setattr(main, 'SEGMENT_BACKFILL_MAX', 5)
+    monkeypatch.setattr(main, 'MANIFEST_TAIL_BYTES', TAIL_BYTES)
+    monkeypatch.setattr(main, 'get_s3_object_latest_version_id', lambda bucket, key: 'segment-v1')
+    add_manifest_tail_response(s3_stub)
+    # segment 14, before the tail
+    add_claim_response(ddb_stub, '2020-01-21T16:58:11.922000Z')
+    add_manifest_response(s3_stub)
+    add_backfill_responses(sfn_stub, ['2020-01-21T16:58:17.922000Z', '2020-01-21T16:58:23.922000Z',
+                                      '2020-01-21T16:58:29.922000Z', '2020-01-21T16:58:35.922000Z'])
+    ddb_stub.add_response('put_item', {}, {'TableName': ANY, 'Item': ANY})
+
+    result = lambda_handler(event(), None)
+    assert result['lastSegment']['s3Key'] == 'live/test_1_00019.ts'
+
+
+def test_lambda_handler_skips_claimed_segment(stubs, monkeypatch):
+    s3_stub, ddb_stub, _ = stubs
+    monkeypatch.setattr(main, 'SEGMENT_BACKFILL_MAX', 2)
+    add_manifest_response(s3_stub)
+    ddb_stub.add_client_error('update_item', service_error_code='ConditionalCheckFailedException')
+
+    assert lambda_handler(event(), None) == {'isMasterManifest': False, 'hasNewSegment': False}
+
+
+def test_lambda_handler_processes_backfilled_segment(stubs, monkeypatch):
+    s3_stub, ddb_stub, _ = stubs
+    monkeypatch.setattr(main, 'SEGMENT_BACKFILL_MAX', 2)
+    monkeypatch.setattr(main, 'MANIFEST_TAIL_BYTES', TAIL_BYTES)
+    monkeypatch.setattr(main, 'get_s3_object_latest_version_id', lambda bucket, key: 'segment-v1')
+    # in the tail
+    add_manifest_tail_response(s3_stub)
+    # no longer in the tail, found in the whole manifest
+    add_manifest_tail_response(s3_stub)
+    add_manifest_response(s3_stub)
+    ddb_stub.add_response('put_item', {}, {'TableName': ANY, 'Item': ANY})
+    ddb_stub.add_response('put_item', {}, {'TableName': ANY, 'Item': ANY})
+
+    result = lambda_handler(event(segmentStartDateTime='2020-01-21T16:58:35.922000Z'), None)
+    assert result['lastSegment']['s3Key'] == 'live/test_1_00018.ts'
+    result = lambda_handler(event(segmentStartDateTime='2020-01-21T16:57:59.922000Z'), None)
+    assert result['lastSegment']['s3Key'] == 'live/test_1_00012.ts'
+    assert result['lastSegment']['startDateTime'] == '2020-01-21T16:57:59.922000Z'
@@ -0,0 +1,59 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import os
+import sys
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+# Conditionally add /opt to the PYTHON PATH for lambda layer
+if os.getenv('AWS_EXECUTION_ENV') is not None:
+    sys.path.append('/opt')
+
+from common.config import LOG_LEVEL, DDB_STREAM_WATERMARK_TABLE, UTC_TIME_FMT
+from common.utils import dynamodb
+
+logger = logging.getLogger('StreamWatermark')
+logger.setLevel(LOG_LEVEL)
+
+
+class StreamWatermark(object):
+    """
+    Per stream high-water mark: the start time (program date time) of the last segment an execution took on.
+    Executions of the same stream may overlap, so claiming a segment only succeeds when it starts after the mark,
+    which makes every segment claimed once. The start time is known from the end of the manifest alone, unlike the
+    media sequence, and it keeps increasing when the encoder restarts and the media sequence goes back.
+    """
+
+    def __init__(self, stream_id, table_name=DDB_STREAM_WATERMARK_TABLE, ddb_client=None):
+        self.stream_id = stream_id
+        self.table_name = table_name
+        self.table = (ddb_client or dynamodb).Table(table_name)
+
+    def claim(self, segment):
+        """
+        Move the mark to segment, a PlaylistSegment with a program date time
+        :return: (claimed, previous start time). claimed is False when the mark is already at or after segment.
+         The previous start time is None for the first segment of the stream
+        """
+        try:
+            response = self.table.update_item(
+                Key={'Stream_ID': self.stream_id},
+                UpdateExpression='set Start_DateTime = :start, S3_Key = :uri',
+                ConditionExpression='attribute_not_exists(Stream_ID) OR Start_DateTime < :start',
+                ExpressionAttributeValues={':start': segment.program_date_time.strftime(UTC_TIME_FMT),
+                                           ':uri': segment.uri},
+                ReturnValues='UPDATED_OLD'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info(f'Segment {segment.uri} of {self.stream_id} was already claimed')
+                return False, None
+            logger.error(f'Error claiming segment of {self.stream_id} in {self.table_name}', exc_info=True)
+            raise e
+
+        previous = response.get('Attributes', {}).get('Start_DateTime')
+        return True, datetime.strptime(previous, UTC_TIME_FMT) if previous is not None else None
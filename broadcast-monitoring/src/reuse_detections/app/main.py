@@ -16,7 +16,7 @@ if os.getenv('AWS_EXECUTION_ENV') is not None:
     sys.path.append('/opt')
 
 from common.config import DDB_FRAME_TABLE, DDB_FRAGMENT_TABLE, LOG_LEVEL, UTC_TIME_FMT
-from common.utils import get_item_ddb, DDBUpdateBuilder, query_item_ddb, put_item_ddb
+from common.utils import get_item_ddb, DDBUpdateBuilder, query_item_ddb, DDBBatchWriter
 
 logging.basicConfig()
 logger = logging.getLogger('reuseDetections')
@@ -59,14 +59,15 @@ def reuse_frames(stream_id, reuse_segment_start_dt_str, segment_start_dt_str, ex
     segment_id = f'{stream_id}:{segment_start_dt_str}'
 
     first_frame_thumbnail_key = None
-    for frame_detection in frame_detections_to_reuse:
-        frame_to_write = copy.deepcopy(frame_detection)
-        frame_dt = datetime.strptime(segment_start_dt_str, UTC_TIME_FMT) + timedelta(
-            milliseconds=float(frame_detection['Segment_Millis']))
-        frame_to_write['DateTime'] = frame_dt.strftime(UTC_TIME_FMT)
-        frame_to_write['Segment'] = segment_id
-        frame_to_write['ExpireTTL'] = expire_ttl
-        put_item_ddb(DDB_FRAME_TABLE, frame_to_write)
+    with DDBBatchWriter(DDB_FRAME_TABLE) as frame_writer:
+        for frame_detection in frame_detections_to_reuse:
+            frame_to_write = copy.deepcopy(frame_detection)
+            frame_dt = datetime.strptime(segment_start_dt_str, UTC_TIME_FMT) + timedelta(
+                milliseconds=float(frame_detection['Segment_Millis']))
+            frame_to_write['DateTime'] = frame_dt.strftime(UTC_TIME_FMT)
+            frame_to_write['Segment'] = segment_id
+            frame_to_write['ExpireTTL'] = expire_ttl
+            frame_writer.put_item(frame_to_write)
     if frame_detections_to_reuse:
         first_frame_thumbnail_key = frame_detections_to_reuse[0].get('Resized_S3_Key',
                                                                      frame_detections_to_reuse[0].get('S3_Key', None))
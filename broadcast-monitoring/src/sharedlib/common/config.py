@@ -7,6 +7,24 @@ import os
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 S3_BUCKET = os.getenv('S3_BUCKET', 'aws-rnd-broadcast-maas-video-processing-dev')
 WORKING_DIR = os.getenv('WORKING_DIR', '/tmp/')
+# download (default): save video segments to WORKING_DIR before decoding them. Frames are sampled with OpenCV, in the
+#  FRAME_SAMPLE_MODE.
+# stream: pipe the s3 object into ffmpeg's stdin, so decoding overlaps with the download and doesn't use
+#  /tmp. OpenCV can't read from a pipe, so ffmpeg samples the frames: its select filter only converts the sampled
+#  frames, like the grab mode. The grab and decode modes of FRAME_SAMPLE_MODE only apply to the download mode, the scene
+#  mode applies to both.
+SEGMENT_INPUT_MODE = os.getenv('SEGMENT_INPUT_MODE', 'download')
+S3_STREAM_CHUNK_SIZE = int(os.getenv('S3_STREAM_CHUNK_SIZE', 256 * 1024))
+# bytes read from the end of a manifest to find its last segment, and the segments to backfill. The whole manifest is
+# read when 0, or when the end doesn't hold a program date time for the last segment or all the segments to backfill
+MANIFEST_TAIL_BYTES = int(os.getenv('MANIFEST_TAIL_BYTES', 0))
+# segments appended since the last processed one that get their own execution, at most. When > 0, every execution
+# claims the last segment of its manifest in the per stream watermark table. Segments whose execution failed later
+# on aren't processed again
+SEGMENT_BACKFILL_MAX = int(os.getenv('SEGMENT_BACKFILL_MAX', 0))
+# bytes read from the start of a segment to find the first timestamp of each of its streams, the whole segment is read
+# when a stream doesn't start in them
+TS_PROBE_BYTES = int(os.getenv('TS_PROBE_BYTES', 64 * 1024))
 
 #################################
 # Check feature flags
@@ -27,9 +45,68 @@ FRAME_RESIZE_WIDTH = int(os.getenv("FRAME_RESIZE_WIDTH", 256))
 FRAME_RESIZE_HEIGHT = int(os.getenv("FRAME_RESIZE_HEIGHT", 144))
 # consider make this a dynamic configuration based on the program
 FRAME_SAMPLE_FPS = float(os.getenv("FRAME_SAMPLE_FPS", 1))
+# decode: read() and convert every frame. grab: skip unsampled frames with grab(), only convert sampled frames.
+# Both only apply to the download SEGMENT_INPUT_MODE
+# scene: sample a frame when the picture changed by more than FRAME_SCENE_THRESHOLD since the last sampled frame,
+# between the min and max fps. With the stream input mode, ffmpeg decodes candidate frames at the max fps and the
+# same comparison samples among them
+FRAME_SAMPLE_MODE = os.getenv("FRAME_SAMPLE_MODE", "grab")
+FRAME_SCENE_THRESHOLD = float(os.getenv("FRAME_SCENE_THRESHOLD", 0.1))
+FRAME_SAMPLE_MIN_FPS = float(os.getenv("FRAME_SAMPLE_MIN_FPS", 0.2))
+FRAME_SAMPLE_MAX_FPS = float(os.getenv("FRAME_SAMPLE_MAX_FPS", 2))
+# number of threads uploading extracted frames to s3, and how many uploads may be queued before decoding blocks
+FRAME_UPLOAD_WORKERS = int(os.getenv("FRAME_UPLOAD_WORKERS", 8))
+FRAME_UPLOAD_MAX_PENDING = int(os.getenv("FRAME_UPLOAD_MAX_PENDING", 16))
 DDB_FRAME_TABLE = os.getenv('DDB_FRAME_TABLE', 'video-processing-dev-VideoFrames')
 DDB_FRAGMENT_TABLE = os.getenv('DDB_FRAGMENT_TABLE', 'video-processing-dev-Segments')
 DDB_SCHEDULE_TABLE = os.getenv('DDB_SCHEDULE_TABLE', 'video-processing-dev-Schedule')
+DDB_AUDIO_STATE_TABLE = os.getenv('DDB_AUDIO_STATE_TABLE', 'video-processing-dev-AudioState')
+DDB_FRAME_HASH_TABLE = os.getenv('DDB_FRAME_HASH_TABLE', 'video-processing-dev-FrameHashCache')
+DDB_STREAM_WATERMARK_TABLE = os.getenv('DDB_STREAM_WATERMARK_TABLE', 'video-processing-dev-StreamWatermark')
+
+#################################
+# Frame analysis configurations
+#################################
+# number of frames of a segment analyzed concurrently by the batched frame analysis, each frame makes one rekognition
+# call per enabled check
+FRAME_ANALYSIS_WORKERS = int(os.getenv('FRAME_ANALYSIS_WORKERS', 8))
+# frames whose perceptual hashes differ by at most this many bits (out of 64) share their rekognition detections.
+# cached detections expire after the ttl, 0 disables the cache
+FRAME_HASH_MAX_DISTANCE = int(os.getenv('FRAME_HASH_MAX_DISTANCE', 4))
+FRAME_HASH_CACHE_TTL_SEC = int(os.getenv('FRAME_HASH_CACHE_TTL_SEC', 300))
+# longest side in pixels of the images cropped from frames, e.g. station logos. 0 keeps the resolution of the frame.
+# frames are decoded at a reduced scale when the crops don't need the full resolution
+CROP_MAX_SIZE = int(os.getenv('CROP_MAX_SIZE', 0))
+
+#################################
+# Rekognition rate limits
+#################################
+# calls per second allowed for each API, the rate never goes above it. Set to the account TPS limit of the API
+REKOGNITION_MAX_TPS = {
+    'detect_text': float(os.getenv('REKOGNITION_DETECT_TEXT_MAX_TPS', 5)),
+    'detect_custom_labels': float(os.getenv('REKOGNITION_DETECT_CUSTOM_LABELS_MAX_TPS', 5)),
+}
+REKOGNITION_MIN_TPS = float(os.getenv('REKOGNITION_MIN_TPS', 0.5))
+# the rate grows by this many calls per second each second without throttling, and is multiplied by the decrease
+# factor on every throttled call
+REKOGNITION_TPS_INCREASE = float(os.getenv('REKOGNITION_TPS_INCREASE', 0.5))
+REKOGNITION_TPS_DECREASE_FACTOR = float(os.getenv('REKOGNITION_TPS_DECREASE_FACTOR', 0.5))
+# retries of a call that's throttled or fails with a transient error (5xx, dropped connection)
+REKOGNITION_THROTTLE_RETRIES = int(os.getenv('REKOGNITION_THROTTLE_RETRIES', 4))
+REKOGNITION_BACKOFF_BASE_SEC = float(os.getenv('REKOGNITION_BACKOFF_BASE_SEC', 0.1))
+
+#################################
+# Audio detection configurations
+#################################
+# For more info on the silencedetect filter see https://www.ffmpeg.org/ffmpeg-filters.html#silencedetect
+SILENCE_THRESHOLD = os.getenv('SILENCE_THRESHOLD', '-60dB')
+SILENCE_DURATION = os.getenv('SILENCE_DURATION', 1)
+# the ffmpeg audio engine also detects silence this short (in seconds) at the start and end of a segment, which may
+# continue across the boundary with the previous or next segment. 0 only detects silence of SILENCE_DURATION
+SILENCE_EDGE_DURATION = float(os.getenv('SILENCE_EDGE_DURATION', 0.1))
+# ffmpeg: volumedetect/silencedetect/astats/ebur128 filters, parsed from the ffmpeg log.
+# numpy: decode the audio to PCM and compute the same measures in process
+AUDIO_ENGINE = os.getenv('AUDIO_ENGINE', 'ffmpeg')
 
 #################################
 # Frame extraction configurations
@@ -38,6 +115,31 @@ STATION_LOGO_THRESHOLD = float(os.getenv('STATION_LOGO_THRESHOLD', 75))
 TEAM_TEXT_SEGMENT_THRESHOLD = float(os.getenv('TEAM_TEXT_SEGMENT_THRESHOLD', 75))
 SPORTS_TYPE_SEGMENT_THRESHOLD = float(os.getenv('SPORTS_TYPE_SEGMENT_THRESHOLD', 50))
 
+#################################
+# Team text matching
+#################################
+# edits allowed between a detected word and a team name, 0 to only match exactly
+TEAM_NAME_MAX_EDIT_DISTANCE = int(os.getenv('TEAM_NAME_MAX_EDIT_DISTANCE', 1))
+# shorter words are only matched exactly
+TEAM_NAME_FUZZY_MIN_LENGTH = int(os.getenv('TEAM_NAME_FUZZY_MIN_LENGTH', 5))
+
+#################################
+# Expected program lookup
+#################################
+# seconds the schedule of a stream is cached by a lambda container before it's read again from the schedule table
+SCHEDULE_CACHE_TTL_SEC = float(os.getenv('SCHEDULE_CACHE_TTL_SEC', 300))
+# Start_Time of the item holding the Schedule_Version of a stream in the schedule table, bumped whenever its programs
+# are loaded. An expired schedule is only read again when its version changed
+SCHEDULE_VERSION_START_TIME = -1
+# loop: the input loops over the schedule, programs are looked up by the relative start time of the segment modulo the
+# end of the last program. live: Start_Time and End_Time of the programs are epoch seconds, looked up by the program
+# date time of the segment
+SCHEDULE_MODE = os.getenv('SCHEDULE_MODE', 'loop')
+# live schedules are read from this many seconds before a segment, which must be longer than the longest program, up to
+# this many seconds after it. The cached schedule serves the following segments until they're past the lookahead
+SCHEDULE_LIVE_LOOKBACK_SEC = int(os.getenv('SCHEDULE_LIVE_LOOKBACK_SEC', 24 * 3600))
+SCHEDULE_LIVE_LOOKAHEAD_SEC = int(os.getenv('SCHEDULE_LIVE_LOOKAHEAD_SEC', 3600))
+
 #################################
 # Timestamp
 #################################
@@ -46,9 +148,21 @@ UTC_TIME_FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
 #################################
 # Result Evaluation
 #################################
+# audio status is evaluated over the segments that started this many seconds before the current one, plus the
+# current one, the same 30 seconds the ConsolidateFunction sets in video_processing.yaml. 0 evaluates each segment on
+# its own
+AUDIO_STATUS_WINDOW_SEC = float(os.getenv('AUDIO_STATUS_WINDOW_SEC', 30))
+# max gap between the end of a segment and the start of the next for silence to carry over
+SEGMENT_GAP_TOLERANCE_SEC = float(os.getenv('SEGMENT_GAP_TOLERANCE_SEC', 0.5))
 
 #################################
 # Appsync notifications
 #################################
 APPSYNC_API_KEY = os.getenv('APPSYNC_API_KEY')
 APPSYNC_API_ENDPOINT_URL = os.getenv('APPSYNC_API_ENDPOINT_URL')
+APPSYNC_CONNECT_TIMEOUT_SEC = float(os.getenv('APPSYNC_CONNECT_TIMEOUT_SEC', 3))
+APPSYNC_READ_TIMEOUT_SEC = float(os.getenv('APPSYNC_READ_TIMEOUT_SEC', 10))
+# when set, notifications are queued and pushed in batches by the batch handler instead of one request per segment
+APPSYNC_NOTIFY_QUEUE_URL = os.getenv('APPSYNC_NOTIFY_QUEUE_URL', '')
+# segment summaries pushed in one aliased mutation
+APPSYNC_BATCH_MAX_SIZE = int(os.getenv('APPSYNC_BATCH_MAX_SIZE', 20))
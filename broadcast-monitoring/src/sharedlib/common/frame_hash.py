@@ -0,0 +1,87 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import time
+
+from boto3.dynamodb.conditions import Key, Attr
+
+from .config import LOG_LEVEL, DDB_FRAME_HASH_TABLE, FRAME_HASH_CACHE_TTL_SEC, FRAME_HASH_MAX_DISTANCE
+from .utils import query_item_ddb, convert_to_ddb, convert_from_ddb, DDBBatchWriter
+
+logger = logging.getLogger('FrameHash')
+logger.setLevel(LOG_LEVEL)
+
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two perceptual hashes, as hex strings"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+class FrameDetectionCache(object):
+    """
+    Per stream cache of the rekognition detections of recent frames, keyed by the perceptual hash the frame extractor
+    stores as Frame_Hash. A frame whose hash is within max_distance bits of a cached one reuses its detections instead
+    of calling rekognition. The raw detections are cached rather than the check results, so the checks still run
+    against the current expected program.
+    Entries expire after ttl_sec. The whole stream is loaded at once: the ttl keeps it to the frames of the last few
+    minutes that didn't match an earlier one.
+    """
+
+    def __init__(self, stream_id, ttl_sec=FRAME_HASH_CACHE_TTL_SEC, max_distance=FRAME_HASH_MAX_DISTANCE,
+                 table_name=DDB_FRAME_HASH_TABLE, ddb_client=None):
+        self.stream_id = stream_id
+        self.ttl_sec = ttl_sec
+        self.max_distance = max_distance
+        self.table_name = table_name
+        self.ddb_client = ddb_client
+        self.entries = {}
+        self.new_entries = {}
+
+    def load(self, now=None):
+        now = int(now if now is not None else time.time())
+        items = query_item_ddb(
+            self.table_name, ddb_client=self.ddb_client,
+            KeyConditionExpression=Key('Stream_ID').eq(self.stream_id),
+            # ddb deletes expired items lazily
+            FilterExpression=Attr('ExpireTTL').gt(now)
+        )
+        self.entries = {item['Frame_Hash']: convert_from_ddb(item) for item in items}
+        logger.info(f'Loaded {len(self.entries)} cached frame detections of {self.stream_id}')
+        return self
+
+    def lookup(self, frame_hash, detection_names):
+        """
+        The closest cached entry holding all of detection_names, or None if there isn't one within max_distance
+        """
+        best = None
+        best_distance = self.max_distance + 1
+        for cached_hash, entry in self.entries.items():
+            if not all(name in entry['Detections'] for name in detection_names):
+                continue
+            distance = hamming_distance(frame_hash, cached_hash)
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def add(self, frame_hash, frame_datetime, detections, now=None):
+        now = int(now if now is not None else time.time())
+        entry = {
+            'Stream_ID': self.stream_id,
+            'Frame_Hash': frame_hash,
+            'Frame_DateTime': frame_datetime,
+            'Detections': detections,
+            'ExpireTTL': now + self.ttl_sec
+        }
+        self.entries[frame_hash] = entry
+        self.new_entries[frame_hash] = entry
+
+    def save(self):
+        """Write the entries added since load"""
+        if not self.new_entries:
+            return
+        with DDBBatchWriter(self.table_name, ddb_client=self.ddb_client) as writer:
+            for entry in self.new_entries.values():
+                writer.put_item(convert_to_ddb(entry))
+        self.new_entries = {}
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
 # Licensed under the Amazon Software License  http://aws.amazon.com/asl/
 
+from collections import namedtuple
 from datetime import datetime, timedelta
 import logging
 
@@ -30,6 +31,77 @@ UTC_TIME_FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
 PROGRAM_TIME_KEYWORD = '#EXT-X-PROGRAM-DATE-TIME:'
 DURATION_KEYWORD = 'EXTINF:'
 SEGMENT_SUFFIX = '.ts'
+MEDIA_SEQUENCE_KEYWORD = '#EXT-X-MEDIA-SEQUENCE:'
+DISCONTINUITY_SEQUENCE_KEYWORD = '#EXT-X-DISCONTINUITY-SEQUENCE:'
+DISCONTINUITY_KEYWORD = '#EXT-X-DISCONTINUITY'
+TARGET_DURATION_KEYWORD = '#EXT-X-TARGETDURATION:'
+
+# segment of a media playlist. program_date_time is extrapolated from the last EXT-X-PROGRAM-DATE-TIME of the
+# playlist when the segment doesn't have its own, and None when there's a discontinuity in between
+PlaylistSegment = namedtuple('PlaylistSegment', ['uri', 'media_sequence', 'discontinuity_sequence', 'duration_sec',
+                                                 'program_date_time', 'discontinuity'])
+
+
+# result of parsing a manifest from its end. complete is False when a partial manifest didn't hold all the info
+ManifestTail = namedtuple('ManifestTail', ['is_master', 'segment', 'start_time', 'duration_sec', 'complete'])
+
+
+def reversed_lines(content):
+    """
+    Lines of content from the last to the first, without splitting the whole content
+    :return: generator of (line, is_first_line)
+    """
+    end = len(content)
+    while end > 0:
+        start = content.rfind('\n', 0, end)
+        yield content[start + 1:end].strip(), start == -1
+        end = start
+
+
+def parse_extinf_duration(line):
+    return float(line.split(DURATION_KEYWORD)[-1].split(',')[0])
+
+
+def parse_manifest_tail(manifest_content, partial=False):
+    """
+    Parse a m3u8 manifest backwards from its end, in a single pass that stops as soon as it found the last segment,
+    its duration and its start time, i.e. at the nearest EXT-X-PROGRAM-DATE-TIME above it plus the durations of the
+    segments in between. The first URI found tells whether it's the master manifest.
+    :param manifest_content: content of the m3u8 manifest, or only its end when partial is True
+    :param partial: whether manifest_content starts in the middle of the manifest. Its first line is then ignored as
+     it may be truncated, and the result is incomplete when there's no EXT-X-PROGRAM-DATE-TIME above the last segment
+    :return: ManifestTail
+    """
+    segment = None
+    duration_sec = None
+    start_time = None
+    # durations of the segments between the last segment and the nearest program date time above it
+    elapsed_sec = 0.0
+    for line, is_first_line in reversed_lines(manifest_content):
+        if not line or (partial and is_first_line):
+            continue
+        if segment is None:
+            if line.startswith('#EXT-X-STREAM-INF') or '.m3u' in line:
+                return ManifestTail(True, None, None, None, True)
+            if line.endswith(SEGMENT_SUFFIX):
+                segment = line
+        elif PROGRAM_TIME_KEYWORD in line:
+            date_time_str = line.split(PROGRAM_TIME_KEYWORD)[-1]
+            start_time = datetime.strptime(date_time_str, UTC_TIME_FMT) + timedelta(seconds=elapsed_sec)
+            if duration_sec is not None:
+                break
+        elif DURATION_KEYWORD in line:
+            if duration_sec is None:
+                duration_sec = parse_extinf_duration(line)
+                # the program date time was between the EXTINF and the URI of the last segment
+                if start_time is not None:
+                    break
+            else:
+                elapsed_sec += parse_extinf_duration(line)
+    else:
+        # reached the beginning without finding a program date time: a partial manifest may have one further up
+        return ManifestTail(False, segment, start_time, duration_sec, not partial)
+    return ManifestTail(False, segment, start_time, duration_sec, True)
 
 
 def get_last_segment_and_start_timestamp(manifest_content):
@@ -42,28 +114,8 @@ def get_last_segment_and_start_timestamp(manifest_content):
          the last segment
         duration_sec: duration of the last segments in seconds
     """
-    manifest_lines = manifest_content.split('\n')
-    latest_segment_duration = timedelta()
-    segment_date_time = None
-    segment = None
-    for line in manifest_lines:
-        if PROGRAM_TIME_KEYWORD in line:
-            date_time_str = line.split(PROGRAM_TIME_KEYWORD)[-1]
-            segment_date_time = datetime.strptime(date_time_str, UTC_TIME_FMT)
-        if DURATION_KEYWORD in line:
-            duration_sec = float(line.split(DURATION_KEYWORD)[-1].split(',')[0])
-            latest_segment_duration = timedelta(seconds=duration_sec)
-            if segment_date_time is not None:
-                segment_date_time += latest_segment_duration
-        if line.endswith(SEGMENT_SUFFIX):
-            segment = line
-
-    if segment_date_time is not None:
-        # the segment duration occurs before the segment name, subtract the last segment duration to get the start time
-        latest_segment_start_time = segment_date_time - latest_segment_duration
-        return segment, latest_segment_start_time, duration_sec
-    else:
-        return segment, None, duration_sec
+    tail = parse_manifest_tail(manifest_content)
+    return tail.segment, tail.start_time, tail.duration_sec
 
 
 def is_master_manifest(manifest_content):
@@ -77,3 +129,116 @@ def is_master_manifest(manifest_content):
         if ".m3u" in line:
             return True
     return False
+
+
+def is_master_manifest_head(manifest_head):
+    """
+    Decide from the first bytes of a manifest whether it's the master manifest, without reading all of it.
+    :param manifest_head: beginning of the manifest content
+    :return: True if it's the master manifest, False if it's a child manifest, None if the head doesn't tell
+    """
+    if '#EXT-X-STREAM-INF' in manifest_head or is_master_manifest(manifest_head):
+        return True
+    if '#EXTINF' in manifest_head or '#EXT-X-TARGETDURATION' in manifest_head:
+        return False
+    return None
+
+
+class MediaPlaylist(object):
+    """
+    Segments of a media playlist with their media sequence number, duration, program date time and discontinuities.
+    A partial playlist only has the segments at the end of the manifest, their media sequence is then None.
+    """
+
+    def __init__(self, segments, media_sequence=0, discontinuity_sequence=0, target_duration=None, is_master=False,
+                 partial=False):
+        self.segments = segments
+        self.media_sequence = media_sequence
+        self.discontinuity_sequence = discontinuity_sequence
+        self.target_duration = target_duration
+        self.is_master = is_master
+        self.partial = partial
+
+    @property
+    def last_segment(self):
+        return self.segments[-1] if self.segments else None
+
+    def segment(self, media_sequence):
+        """The segment with media_sequence, None if it's no longer (or not yet) in the playlist"""
+        index = media_sequence - self.media_sequence
+        return self.segments[index] if 0 <= index < len(self.segments) else None
+
+    def segments_after(self, media_sequence):
+        """The segments after media_sequence, in order"""
+        return self.segments[max(0, media_sequence + 1 - self.media_sequence):]
+
+    def segment_at(self, program_date_time):
+        """The segment starting at program_date_time, None if it's not in the playlist"""
+        return next((segment for segment in self.segments if segment.program_date_time == program_date_time), None)
+
+    def segments_between(self, start_time, end_time):
+        """The segments starting strictly between start_time and end_time, in order"""
+        return [segment for segment in self.segments
+                if segment.program_date_time is not None and start_time < segment.program_date_time < end_time]
+
+    def starts_by(self, program_date_time):
+        """Whether the playlist has every segment starting after program_date_time, i.e. it starts by then"""
+        first_start = next((segment.program_date_time for segment in self.segments
+                            if segment.program_date_time is not None), None)
+        return first_start is not None and first_start <= program_date_time
+
+
+def parse_playlist(manifest_content, partial=False):
+    """
+    Parse a m3u8 manifest into a MediaPlaylist, an empty one with is_master set for a master manifest
+    :param partial: whether manifest_content is only the end of the manifest, e.g. read with
+     common.utils.read_file_tail_from_s3. Its first line is then ignored as it may be truncated, and the segments
+     don't have a media sequence unless the content has the EXT-X-MEDIA-SEQUENCE header.
+    """
+    media_sequence = None if partial else 0
+    discontinuity_sequence = 0
+    target_duration = None
+    segments = []
+
+    sequence = None
+    discontinuities = 0
+    duration_sec = None
+    program_date_time = None
+    discontinuity = False
+    # program date time of the next segment, extrapolated from the previous one
+    next_date_time = None
+    lines = manifest_content.split('\n')
+    for line in lines[1:] if partial else lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF') or '.m3u' in line:
+            return MediaPlaylist([], is_master=True)
+        if line.startswith(MEDIA_SEQUENCE_KEYWORD):
+            media_sequence = int(line[len(MEDIA_SEQUENCE_KEYWORD):])
+        elif line.startswith(DISCONTINUITY_SEQUENCE_KEYWORD):
+            discontinuity_sequence = int(line[len(DISCONTINUITY_SEQUENCE_KEYWORD):])
+        elif line.startswith(TARGET_DURATION_KEYWORD):
+            target_duration = int(line[len(TARGET_DURATION_KEYWORD):])
+        elif line.startswith(PROGRAM_TIME_KEYWORD):
+            program_date_time = datetime.strptime(line[len(PROGRAM_TIME_KEYWORD):], UTC_TIME_FMT)
+        elif line.startswith(DISCONTINUITY_KEYWORD):
+            discontinuity = True
+            discontinuities += 1
+            next_date_time = None
+        elif DURATION_KEYWORD in line:
+            duration_sec = parse_extinf_duration(line)
+        elif not line.startswith('#'):
+            if not segments:
+                sequence = media_sequence
+            date_time = program_date_time or next_date_time
+            segments.append(PlaylistSegment(line, sequence, discontinuity_sequence + discontinuities, duration_sec,
+                                            date_time, discontinuity))
+            if date_time is not None and duration_sec is not None:
+                next_date_time = date_time + timedelta(seconds=duration_sec)
+            if sequence is not None:
+                sequence += 1
+            duration_sec = None
+            program_date_time = None
+            discontinuity = False
+    return MediaPlaylist(segments, media_sequence, discontinuity_sequence, target_duration, partial=partial)
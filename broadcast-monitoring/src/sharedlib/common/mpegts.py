@@ -0,0 +1,168 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+
+from .config import LOG_LEVEL, TS_PROBE_BYTES
+from .utils import read_bytes_from_s3
+
+"""
+Minimal MPEG-TS reader finding the start time of a segment from its first packets, the same value as
+`ffprobe -show_entries format=start_time`: the earliest presentation timestamp (PTS) of the first PES packet of each
+audio and video elementary stream listed in the program map table.
+"""
+
+logger = logging.getLogger('MpegTs')
+logger.setLevel(LOG_LEVEL)
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0
+PTS_CLOCK_HZ = 90000
+# 33 bit PTS wrap around every 26.5 hours
+PTS_WRAP = 2 ** 33
+PES_START_CODE = b'\x00\x00\x01'
+# stream types of the program map table carrying video or audio: MPEG-1/2 video, MPEG-1/2 audio, AAC (ADTS), AAC
+# (LATM), MPEG-4 video, H.264, HEVC, AC-3 and E-AC-3
+AV_STREAM_TYPES = {0x01, 0x02, 0x03, 0x04, 0x0f, 0x11, 0x10, 0x1b, 0x24, 0x81, 0x87}
+
+
+def find_sync_offset(data):
+    """Offset of the first packet: a sync byte followed by another one a packet later, None if not found"""
+    for offset in range(min(TS_PACKET_SIZE, len(data))):
+        if data[offset] == TS_SYNC_BYTE and \
+                (offset + TS_PACKET_SIZE >= len(data) or data[offset + TS_PACKET_SIZE] == TS_SYNC_BYTE):
+            return offset
+    return None
+
+
+def iter_packets(data):
+    """
+    :return: generator of (pid, payload_unit_start, payload) of the complete packets in data
+    """
+    offset = find_sync_offset(data)
+    if offset is None:
+        return
+    for start in range(offset, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[start:start + TS_PACKET_SIZE]
+        if packet[0] != TS_SYNC_BYTE:
+            logger.warning(f'Lost sync at byte {start}')
+            return
+        payload_unit_start = bool(packet[1] & 0x40)
+        pid = ((packet[1] & 0x1f) << 8) | packet[2]
+        adaptation_field_control = (packet[3] >> 4) & 0x3
+        if not adaptation_field_control & 0x1:
+            # adaptation field only
+            continue
+        payload_offset = 4
+        if adaptation_field_control & 0x2:
+            payload_offset += 1 + packet[4]
+        if payload_offset < TS_PACKET_SIZE:
+            yield pid, payload_unit_start, packet[payload_offset:]
+
+
+def psi_section(payload):
+    """Section of a PSI payload starting a section, without the pointer field and the trailing CRC"""
+    section = payload[1 + payload[0]:]
+    section_length = ((section[1] & 0x0f) << 8) | section[2]
+    return section[:3 + section_length - 4]
+
+
+def parse_pat(payload):
+    """:return: pids of the program map tables listed in a program association table"""
+    section = psi_section(payload)
+    pmt_pids = []
+    for i in range(8, len(section) - 3, 4):
+        program_number = (section[i] << 8) | section[i + 1]
+        # program 0 is the network information table
+        if program_number != 0:
+            pmt_pids.append(((section[i + 2] & 0x1f) << 8) | section[i + 3])
+    return pmt_pids
+
+
+def parse_pmt(payload):
+    """
+    :return: pids of the audio and video elementary streams listed in a program map table. Other streams, e.g.
+     SCTE-35 splice info or ID3 timed metadata, may never carry a PTS
+    """
+    section = psi_section(payload)
+    program_info_length = ((section[10] & 0x0f) << 8) | section[11]
+    es_pids = []
+    i = 12 + program_info_length
+    while i + 5 <= len(section):
+        if section[i] in AV_STREAM_TYPES:
+            es_pids.append(((section[i + 1] & 0x1f) << 8) | section[i + 2])
+        i += 5 + (((section[i + 3] & 0x0f) << 8) | section[i + 4])
+    return es_pids
+
+
+def parse_pes_pts(payload):
+    """:return: PTS of a PES packet header, None when it doesn't have one"""
+    if len(payload) < 14 or payload[:3] != PES_START_CODE or not payload[7] & 0x80:
+        return None
+    # 33 bits split over 5 bytes, each part followed by a marker bit
+    high = ((payload[9] >> 1) & 0x07) << 30
+    middle = payload[10] << 22 | (payload[11] >> 1) << 15
+    return high | middle | payload[12] << 7 | payload[13] >> 1
+
+
+def earliest_pts(timestamps):
+    """
+    Earliest of PTS less than half the wrap period apart, e.g. the first PTS of the streams of a segment. A PTS that
+    wrapped around past 2**33 is later than the PTS that didn't yet.
+    """
+    reference = timestamps[0]
+    half_wrap = PTS_WRAP // 2
+    return min(reference + (pts - reference + half_wrap) % PTS_WRAP - half_wrap for pts in timestamps) % PTS_WRAP
+
+
+def read_start_time(data):
+    """
+    Start time of a segment from its first bytes
+    :param data: bytes from the start of a MPEG-TS segment, or the whole segment
+    :return: (start time in seconds, complete). start time is None when no stream starts in data, complete is False
+     when some audio or video streams of the program map table don't, as they may start earlier than the ones found.
+    """
+    pmt_pids = set()
+    es_pids = None
+    first_pts = {}
+    for pid, payload_unit_start, payload in iter_packets(data):
+        if not payload_unit_start:
+            continue
+        if pid == PAT_PID:
+            pmt_pids.update(parse_pat(payload))
+        elif pid in pmt_pids:
+            if es_pids is None:
+                es_pids = set(parse_pmt(payload))
+        elif pid not in first_pts and (es_pids is None or pid in es_pids):
+            pts = parse_pes_pts(payload)
+            if pts is not None:
+                first_pts[pid] = pts
+        if es_pids is not None and es_pids.issubset(first_pts):
+            break
+
+    if es_pids is not None:
+        # PES of pids announced before the program map table aren't elementary streams of the program
+        first_pts = {pid: pts for pid, pts in first_pts.items() if pid in es_pids}
+    complete = es_pids is not None and es_pids.issubset(first_pts)
+    if not first_pts:
+        return None, complete
+    return earliest_pts(list(first_pts.values())) / PTS_CLOCK_HZ, complete
+
+
+def read_start_time_from_s3(s3_bucket, s3_key, versionid=None, num_bytes=TS_PROBE_BYTES):
+    """
+    Start time of a segment in s3, from its first num_bytes when all its streams start in them, else from the whole
+    segment
+    :return: start time in seconds
+    """
+    data = read_bytes_from_s3(s3_bucket, s3_key, versionid, num_bytes)
+    start_time, complete = read_start_time(data)
+    if not complete and len(data) >= num_bytes:
+        logger.info(f'Not every stream of s3://{s3_bucket}/{s3_key} starts in the first {num_bytes} bytes, '
+                    f'reading the whole segment')
+        start_time, complete = read_start_time(read_bytes_from_s3(s3_bucket, s3_key, versionid))
+    if start_time is None:
+        raise ValueError(f'No presentation timestamp found in s3://{s3_bucket}/{s3_key}')
+    return start_time
@@ -0,0 +1,136 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import random
+import threading
+import time
+
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from .config import (LOG_LEVEL, REKOGNITION_MAX_TPS, REKOGNITION_MIN_TPS, REKOGNITION_TPS_INCREASE,
+                     REKOGNITION_TPS_DECREASE_FACTOR, REKOGNITION_THROTTLE_RETRIES, REKOGNITION_BACKOFF_BASE_SEC)
+
+logger = logging.getLogger('RateLimit')
+logger.setLevel(LOG_LEVEL)
+
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'ProvisionedThroughputExceededException', 'LimitExceededException'}
+TRANSIENT_ERROR_CODES = {'InternalServerError', 'InternalFailure', 'ServiceUnavailable', 'ServiceUnavailableException',
+                         'RequestTimeout', 'RequestTimeoutException'}
+
+# the rate limiters retry throttled and transient errors themselves: let the clients fail fast so every throttle
+# adjusts the rate
+REKOGNITION_CLIENT_CONFIG = Config(retries={'mode': 'standard', 'max_attempts': 1})
+
+
+def is_throttling_error(e):
+    return isinstance(e, ClientError) and e.response['Error']['Code'] in THROTTLING_ERROR_CODES
+
+
+def is_transient_error(e):
+    """Server side errors and dropped connections, which the standard retry mode of botocore retries too"""
+    if isinstance(e, (ConnectionError, HTTPClientError)):
+        return True
+    if not isinstance(e, ClientError):
+        return False
+    status_code = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return e.response['Error']['Code'] in TRANSIENT_ERROR_CODES or status_code >= 500
+
+
+class AdaptiveRateLimiter(object):
+    """
+    Token bucket paced at a rate adjusted with AIMD (additive increase, multiplicative decrease): every successful
+    call raises the rate so that it grows by about `increase` calls per second each second, every throttled call
+    multiplies it by `decrease_factor`. The bucket holds up to a second worth of tokens, so short bursts go through.
+    Throttled calls, and calls failing with a transient error, are retried after an exponential backoff with full
+    jitter. Only throttles lower the rate.
+    The limiter is thread safe and meant to be shared by every caller of an API within the process.
+    """
+
+    def __init__(self, name, max_rate, min_rate=0.5, increase=0.5, decrease_factor=0.5, max_retries=4,
+                 backoff_base_sec=0.1, clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.clock = clock
+        self.sleep = sleep
+        self.rate = max_rate
+        self.tokens = 1.0
+        self.last_refill = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        capacity = max(1.0, self.rate)
+        self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """Block until a call is allowed at the current rate"""
+        while True:
+            with self.lock:
+                self._refill(self.clock())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_sec = (1 - self.tokens) / self.rate
+            self.sleep(wait_sec)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0.0)
+            logger.info(f'{self.name} throttled, rate lowered to {self.rate:.2f} calls/sec')
+
+    def backoff_sec(self, attempt):
+        return random.uniform(0, self.backoff_base_sec * (2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Call fn once a token is available, retrying when it's throttled or fails with a transient error.
+        The error of the last attempt is raised once max_retries is exhausted.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                response = fn(*args, **kwargs)
+            except (ClientError, ConnectionError, HTTPClientError) as e:
+                if is_throttling_error(e):
+                    self.on_throttle()
+                elif not is_transient_error(e):
+                    raise e
+                if attempt >= self.max_retries:
+                    logger.error(f'{self.name} still failing after {attempt} retries: {e}')
+                    raise e
+                logger.info(f'{self.name} retrying after {e}')
+                self.sleep(self.backoff_sec(attempt))
+                attempt += 1
+            else:
+                self.on_success()
+                return response
+
+
+rekognition_limiters = {
+    api: AdaptiveRateLimiter(
+        f'rekognition.{api}', max_rate, min_rate=REKOGNITION_MIN_TPS, increase=REKOGNITION_TPS_INCREASE,
+        decrease_factor=REKOGNITION_TPS_DECREASE_FACTOR, max_retries=REKOGNITION_THROTTLE_RETRIES,
+        backoff_base_sec=REKOGNITION_BACKOFF_BASE_SEC
+    ) for api, max_rate in REKOGNITION_MAX_TPS.items()
+}
+
+
+def call_rekognition(client, api, **kwargs):
+    """
+    Call a rekognition API through its rate limiter, e.g. call_rekognition(rekognition, 'detect_text', Image=...)
+    """
+    return rekognition_limiters[api].call(getattr(client, api), **kwargs)
@@ -0,0 +1,342 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+import re
+import subprocess
+from collections import namedtuple
+
+from .config import LOG_LEVEL
+from .utils import Timer, stream_to_process
+
+"""
+Single pass analysis of a video segment. One ffmpeg invocation reads the segment and emits:
+  * the container start time (same value as `ffprobe -show_entries format=start_time`)
+  * volumedetect / silencedetect / astats (per channel) / ebur128 (loudness) stats of the first audio stream
+  * sampled raw frames (bgr24) of the first video stream, with their timestamps from the showinfo filter
+
+The stats are parsed from ffmpeg's log output (stderr), the frames are read from stdout.
+"""
+
+logger = logging.getLogger('SegmentAnalysis')
+logger.setLevel(LOG_LEVEL)
+
+silence_start_re = re.compile(r' silence_start: (?P<start>[0-9]+(\.?[0-9]*))')
+silence_end_re = re.compile(r' silence_end: (?P<end>[0-9]+(\.?[0-9]*))')
+silence_duration_re = re.compile(r' silence_duration: (?P<duration>[0-9]+(\.?[0-9]*))')
+
+mean_volume_re = re.compile(r' mean_volume: (?P<mean>-?[0-9]+(\.?[0-9]*))')
+max_volume_re = re.compile(r' max_volume: (?P<max>-?[0-9]+(\.?[0-9]*))')
+
+astats_channel_re = re.compile(r'\] Channel: (?P<channel>[0-9]+)')
+astats_overall_re = re.compile(r'\] Overall')
+astats_peak_re = re.compile(r' Peak level dB: (?P<peak>-?(inf|[0-9]+(\.?[0-9]*)))')
+astats_rms_re = re.compile(r' RMS level dB: (?P<rms>-?(inf|[0-9]+(\.?[0-9]*)))')
+
+# the ebur128 summary is printed without the filter prefix, frame lines start with it
+ebur128_integrated_re = re.compile(r'^\s+I:\s+(?P<integrated>-?[0-9]+(\.?[0-9]*)) LUFS')
+ebur128_short_term_re = re.compile(r'\] t: .* S:\s*(?P<short_term>-?[0-9]+(\.?[0-9]*))')
+
+start_time_re = re.compile(r'Duration: .*, start: (?P<start>-?[0-9]+(\.?[0-9]*))')
+video_fps_re = re.compile(r'Stream #0:.*Video: .*, (?P<fps>[0-9]+(\.?[0-9]*)) fps')
+showinfo_re = re.compile(
+    r'\[Parsed_showinfo.*\] n:\s*(?P<n>[0-9]+) pts:\s*-?[0-9]+ pts_time:(?P<pts_time>-?[0-9]+(\.?[0-9]*)).*'
+    r' s:(?P<width>[0-9]+)x(?P<height>[0-9]+)')
+
+# the select filter keeps a frame once this much less than the sampling interval has passed since the last one,
+# so that rounding of frame timestamps does not skip a frame that is exactly one interval apart.
+SELECT_TOLERANCE_SEC = 0.001
+# level of a single LSB of 16 bit audio. digital silence is reported at this level instead of -inf
+SILENT_DB = -90.3
+FRAME_CHANNELS = 3  # bgr24
+
+SegmentAnalysis = namedtuple('SegmentAnalysis', ['start_time', 'volume', 'silence_chunks', 'channel_volumes',
+                                                 'loudness', 'frames', 'edge_silence_chunks'])
+RawFrame = namedtuple('RawFrame', ['frame_num', 'millis', 'width', 'height', 'data'])
+# sample a frame when the picture changed by more than threshold since the last sampled frame, at most max_fps and at
+# least min_fps frames per second. ffmpeg only keeps the candidate frames, see build_select_filter
+SceneSampling = namedtuple('SceneSampling', ['threshold', 'min_fps', 'max_fps'])
+
+
+def parse_volume_output(lines):
+    """Parses the output of ffmpeg for volume data"""
+
+    max_volume = None
+    mean_volume = None
+
+    for line in lines:
+        max_result = max_volume_re.search(line)
+        mean_result = mean_volume_re.search(line)
+
+        if max_result:
+            max_volume = float(max_result.group('max'))
+
+        elif mean_result:
+            mean_volume = float(mean_result.group('mean'))
+
+    if max_volume is not None and mean_volume is not None:
+        return mean_volume, max_volume
+
+
+def parse_silence_output(lines):
+    """Parses the output of ffmpeg for chunks of silence section denoted by a start, end tuples"""
+
+    chunk_starts = []
+    chunk_ends = []
+
+    for line in lines:
+        silence_start = silence_start_re.search(line)
+        silence_end = silence_end_re.search(line)
+
+        if silence_start:
+            chunk_starts.append(float(silence_start.group('start')))
+        elif silence_end:
+            chunk_ends.append(float(silence_end.group('end')))
+
+    return list(zip(chunk_starts, chunk_ends))
+
+
+def silencedetect_duration(duration, edge_duration=None):
+    """silencedetect duration detecting the edge silence too, see split_edge_silence"""
+    return edge_duration if edge_duration and edge_duration < float(duration) else duration
+
+
+def split_edge_silence(silence_chunks, duration):
+    """
+    Split the chunks found by silencedetect with the shorter edge duration into the chunks of at least duration, the
+    same silencedetect with duration finds, and the shorter first and last chunks. Those may be the end or the start of
+    a silence spanning the boundary with the previous or next segment.
+    :return: (silence chunks, edge silence chunks)
+    """
+    duration = float(duration)
+    long_chunks = [chunk for chunk in silence_chunks if chunk[1] - chunk[0] >= duration]
+    edge_chunks = [chunk for i, chunk in enumerate(silence_chunks)
+                   if chunk[1] - chunk[0] < duration and i in (0, len(silence_chunks) - 1)]
+    return long_chunks, edge_chunks
+
+
+def parse_level_db(value):
+    return SILENT_DB if value == '-inf' else max(float(value), SILENT_DB)
+
+
+def parse_astats_output(lines):
+    """Parses the output of the ffmpeg astats filter into (RMS dB, peak dB) tuples, one for each channel"""
+    channels = {}
+    channel = None
+    for line in lines:
+        channel_result = astats_channel_re.search(line)
+        if channel_result:
+            channel = int(channel_result.group('channel'))
+            channels[channel] = [None, None]
+            continue
+        if astats_overall_re.search(line):
+            channel = None
+            continue
+        if channel is None:
+            continue
+        rms_result = astats_rms_re.search(line)
+        peak_result = astats_peak_re.search(line)
+        if rms_result:
+            channels[channel][0] = parse_level_db(rms_result.group('rms'))
+        elif peak_result:
+            channels[channel][1] = parse_level_db(peak_result.group('peak'))
+
+    return [tuple(channels[channel]) for channel in sorted(channels)]
+
+
+def parse_ebur128_output(lines):
+    """Parses the output of the ffmpeg ebur128 filter for (integrated loudness, max short-term loudness) in LUFS"""
+    integrated = None
+    short_term_max = None
+    for line in lines:
+        integrated_result = ebur128_integrated_re.search(line)
+        short_term_result = ebur128_short_term_re.search(line)
+        if integrated_result:
+            integrated = float(integrated_result.group('integrated'))
+        elif short_term_result:
+            short_term = float(short_term_result.group('short_term'))
+            short_term_max = short_term if short_term_max is None else max(short_term_max, short_term)
+
+    if integrated is not None:
+        return integrated, short_term_max
+
+
+def parse_start_time_output(lines):
+    """Parses the start time of the input container from the ffmpeg input summary"""
+    for line in lines:
+        start_time = start_time_re.search(line)
+        if start_time:
+            return float(start_time.group('start'))
+    return None
+
+
+def parse_video_fps_output(lines):
+    """Parses the frame rate of the first video stream of the input"""
+    for line in lines:
+        fps = video_fps_re.search(line)
+        if fps:
+            return float(fps.group('fps'))
+    return None
+
+
+def parse_showinfo_output(lines):
+    """Parses the showinfo filter output into (pts_time, width, height) tuples, one for each frame"""
+    frames = []
+    for line in lines:
+        frame_info = showinfo_re.search(line)
+        if frame_info:
+            frames.append((float(frame_info.group('pts_time')),
+                           int(frame_info.group('width')),
+                           int(frame_info.group('height'))))
+    return frames
+
+
+def split_raw_frames(raw_video, frames_info, fps=None):
+    """
+    Split the concatenated bgr24 frames read from ffmpeg's stdout into RawFrame.
+    Timestamps are made relative to the first decoded video frame, the same reference OpenCV uses for
+    CAP_PROP_POS_MSEC, and frame numbers are derived from the timestamp and the stream frame rate.
+    """
+    raw_video = memoryview(raw_video)
+    frames = []
+    offset = 0
+    first_pts_time = frames_info[0][0] if frames_info else 0
+    for i, (pts_time, width, height) in enumerate(frames_info):
+        frame_size = width * height * FRAME_CHANNELS
+        if offset + frame_size > len(raw_video):
+            logger.warning(f'ffmpeg output ended after {i} out of {len(frames_info)} frames')
+            break
+        relative_sec = pts_time - first_pts_time
+        frame_num = round(relative_sec * fps) if fps else i
+        frames.append(RawFrame(frame_num, relative_sec * 1000, width, height, raw_video[offset:offset + frame_size]))
+        offset += frame_size
+    return frames
+
+
+def convert_volume_to_dict(vol):
+    mean_vol, max_vol = vol
+    return {'mean': mean_vol, 'max': max_vol}
+
+
+def convert_silence_to_dict(silence):
+    start, end = silence
+    return {'start': start, 'end': end}
+
+
+def convert_loudness_to_dict(loudness):
+    integrated, short_term_max = loudness
+    return {'integrated': integrated, 'short_term_max': short_term_max}
+
+
+def convert_audio_results(volume, silence_chunks, channel_volumes=None, loudness=None, edge_silence=None,
+                          edge_silence_chunks=None):
+    """
+    Convert the parsed volumedetect, silencedetect, astats and ebur128 output into the audio detection result
+    :param volume: (mean, max) in dB
+    :param silence_chunks: list of (start, end)
+    :param channel_volumes: list of (RMS, peak) in dB, one for each channel
+    :param loudness: (integrated, max short-term) in LUFS
+    :param edge_silence: (leading, trailing) silence in seconds, including silence shorter than silence chunks
+    :param edge_silence_chunks: list of (start, end) of the silence at the edges shorter than silence chunks
+    """
+    results = {
+        'silence_chunks': [convert_silence_to_dict(seg) for seg in silence_chunks]
+    }
+    if edge_silence:
+        leading, trailing = edge_silence
+        results['edge_silence'] = {'leading': leading, 'trailing': trailing}
+    if edge_silence_chunks:
+        results['edge_silence_chunks'] = [convert_silence_to_dict(seg) for seg in edge_silence_chunks]
+    if volume is not None:
+        results['volume'] = convert_volume_to_dict(volume)
+        if channel_volumes:
+            results['volume']['channels'] = [convert_volume_to_dict(vol) for vol in channel_volumes]
+        if loudness:
+            results['volume']['loudness'] = convert_loudness_to_dict(loudness)
+    return results
+
+
+def build_select_filter(sample_fps, scene_sampling=None):
+    """
+    select filter keeping one frame every 1/sample_fps seconds. With scene_sampling, it keeps the candidate frames of
+    the scene sample mode instead, one every 1/max_fps seconds: ffmpeg's scene score compares a frame with the
+    previous decoded frame, while scene changes are measured against the last sampled frame, which also catches
+    gradual changes. The frame extractor's SceneChangeSampler samples among the candidates, like it does from OpenCV.
+    """
+    interval = 1.0 / (scene_sampling.max_fps if scene_sampling else sample_fps) - SELECT_TOLERANCE_SEC
+    return f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{interval:.6f})'"
+
+
+def build_ffmpeg_command(input_file, sample_fps=None, audio=True, threshold='-60dB', duration=2, ffmpeg_cmd='ffmpeg',
+                         scene_sampling=None, edge_duration=None):
+    """
+    Build the ffmpeg command line for the single pass analysis.
+    Audio stats go to a null output, sampled video frames are written to stdout as raw bgr24.
+    """
+    command = [ffmpeg_cmd, '-nostdin', '-hide_banner', '-i', input_file]
+    if audio:
+        silence_duration = silencedetect_duration(duration, edge_duration)
+        audio_filters = f'volumedetect,silencedetect=n={threshold}:d={silence_duration},astats,ebur128=framelog=info'
+        command += ['-map', '0:a:0', '-af', audio_filters, '-f', 'null', '-']
+    if sample_fps or scene_sampling:
+        select = build_select_filter(sample_fps, scene_sampling)
+        command += ['-map', '0:v:0', '-vf', f'{select},showinfo', '-vsync', '0',
+                    '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+    else:
+        # nothing to sample, but the input still needs an output to be read
+        command += ['-map', '0:v:0', '-f', 'null', '-']
+    return command
+
+
+def analyze_segment(input_file, sample_fps=None, audio=True, threshold='-60dB', duration=2, ffmpeg_cmd='ffmpeg',
+                    input_stream=None, scene_sampling=None, edge_duration=None):
+    """
+    Run the single pass analysis over a video segment
+    :param input_file: path of the video segment. Ignored if input_stream is given
+    :param sample_fps: how many frames to sample per second of video. None to skip frame sampling
+    :param audio: whether to compute volume and silence stats
+    :param threshold: silencedetect noise threshold
+    :param duration: silencedetect minimum duration of silence in seconds
+    :param input_stream: file-like object to pipe into ffmpeg instead of reading input_file, e.g. a s3 StreamingBody
+    :param scene_sampling: SceneSampling to keep the candidate frames of the scene sample mode instead of sampling at a
+     fixed sample_fps
+    :param edge_duration: shortest silence detected at the start and end of the segment, see split_edge_silence
+    :return: SegmentAnalysis. volume is a (mean, max) tuple, silence_chunks a list of (start, end) tuples,
+     channel_volumes a list of (RMS, peak) tuples, loudness a (integrated, max short-term) tuple,
+     frames a list of RawFrame and edge_silence_chunks a list of (start, end) tuples
+    """
+    if input_stream is not None:
+        input_file = 'pipe:0'
+    command = build_ffmpeg_command(input_file, sample_fps, audio, threshold, duration, ffmpeg_cmd, scene_sampling,
+                                   edge_duration)
+    logger.info(f'ffmpeg command: {command}')
+    timer = Timer(f'single pass analysis of {input_file}', logger_fn=logger.info)
+    timer.tic()
+    if input_stream is not None:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = stream_to_process(process, input_stream)
+    else:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.stdout, process.stderr
+    timer.toc()
+    output_lines = stderr.decode('utf-8', errors='replace').splitlines()
+    if process.returncode:
+        logger.error('ffmpeg failed: %s', '\n'.join(output_lines[-20:]))
+        raise RuntimeError(f'ffmpeg exited with code {process.returncode}')
+
+    frames = []
+    if sample_fps or scene_sampling:
+        frames = split_raw_frames(stdout, parse_showinfo_output(output_lines), parse_video_fps_output(output_lines))
+    silence_chunks = edge_silence_chunks = None
+    if audio:
+        silence_chunks, edge_silence_chunks = split_edge_silence(parse_silence_output(output_lines), duration)
+    return SegmentAnalysis(
+        start_time=parse_start_time_output(output_lines),
+        volume=parse_volume_output(output_lines) if audio else None,
+        silence_chunks=silence_chunks,
+        channel_volumes=parse_astats_output(output_lines) if audio else None,
+        loudness=parse_ebur128_output(output_lines) if audio else None,
+        frames=frames,
+        edge_silence_chunks=edge_silence_chunks
+    )
@@ -6,24 +6,30 @@ import csv
 import json
 import logging
 import os
+import random
 import re
 import time
+import threading
 import shutil
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
 from functools import wraps
 
 import boto3
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError, ParamValidationError
 
-from .config import LOG_LEVEL, UTC_TIME_FMT, WORKING_DIR
+from .config import LOG_LEVEL, UTC_TIME_FMT, WORKING_DIR, S3_STREAM_CHUNK_SIZE, SCHEDULE_VERSION_START_TIME
+from .rate_limit import REKOGNITION_CLIENT_CONFIG, call_rekognition
 
 logger = logging.getLogger('Utils')
 logger.setLevel(LOG_LEVEL)
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
-rekognition = boto3.client('rekognition')
+rekognition = boto3.client('rekognition', config=REKOGNITION_CLIENT_CONFIG)
 secretsmanager = boto3.client('secretsmanager')
 
 
@@ -48,6 +54,55 @@ def read_file_from_s3_w_versionid(s3_bucket, s3_key, versionid):
     return s3object
 
 
+def read_file_head_from_s3(s3_bucket, s3_key, versionid, num_bytes):
+    """Read the first num_bytes of an s3 object, with a ranged get"""
+    try:
+        response = s3.get_object(Bucket=s3_bucket, Key=s3_key, VersionId=versionid, Range=f'bytes=0-{num_bytes - 1}')
+        logger.info(f'Buffered the first {num_bytes} bytes of s3://{s3_bucket}/{s3_key}?VersionId={versionid}')
+        # the range may end in the middle of a multi byte character
+        s3object = response['Body'].read().decode('utf-8', errors='ignore')
+    except ClientError as e:
+        logger.error(f'Error downloading from s3://{s3_bucket}/{s3_key}?VersionId={versionid}', exc_info=True)
+        raise e
+    return s3object
+
+
+def read_bytes_from_s3(s3_bucket, s3_key, versionid=None, num_bytes=None):
+    """Read an s3 object as bytes, only its first num_bytes with a ranged get when given"""
+    params = {'Bucket': s3_bucket, 'Key': s3_key}
+    if versionid is not None:
+        params['VersionId'] = versionid
+    if num_bytes is not None:
+        params['Range'] = f'bytes=0-{num_bytes - 1}'
+    try:
+        response = s3.get_object(**params)
+        content = response['Body'].read()
+        logger.info(f'Buffered {len(content)} bytes of s3://{s3_bucket}/{s3_key}?VersionId={versionid}')
+    except ClientError as e:
+        logger.error(f'Error downloading from s3://{s3_bucket}/{s3_key}?VersionId={versionid}', exc_info=True)
+        raise e
+    return content
+
+
+def read_file_tail_from_s3(s3_bucket, s3_key, versionid, num_bytes):
+    """
+    Read the last num_bytes of an s3 object, with a ranged get
+    :return: (content, partial), partial is True when the object is longer than num_bytes
+    """
+    try:
+        response = s3.get_object(Bucket=s3_bucket, Key=s3_key, VersionId=versionid, Range=f'bytes=-{num_bytes}')
+        logger.info(f'Buffered the last {num_bytes} bytes of s3://{s3_bucket}/{s3_key}?VersionId={versionid}')
+        # the range may start in the middle of a multi byte character
+        s3object = response['Body'].read().decode('utf-8', errors='ignore')
+    except ClientError as e:
+        logger.error(f'Error downloading from s3://{s3_bucket}/{s3_key}?VersionId={versionid}', exc_info=True)
+        raise e
+    # e.g. bytes 3072-4095/4096
+    content_range = response.get('ContentRange', '')
+    partial = bool(content_range) and not content_range.startswith('bytes 0-')
+    return s3object, partial
+
+
 def from_s3_object(s3_bucket, s3_key, buf):
     timer = Timer(f'download s3://{s3_bucket}/{s3_key} to memory', logger_fn=logger.info)
     try:
@@ -76,6 +131,62 @@ def download_file_from_s3(s3_bucket, s3_key, dest_file=None):
     return dest_file
 
 
+def open_s3_stream(s3_bucket, s3_key):
+    """
+    Open the s3 object for reading without saving it to disk
+    :return: the StreamingBody of the object
+    """
+    try:
+        return s3.get_object(Bucket=s3_bucket, Key=s3_key)['Body']
+    except ClientError as e:
+        logger.error(f'Error opening s3://{s3_bucket}/{s3_key}', exc_info=True)
+        raise e
+
+
+def stream_to_process(process, input_stream, chunk_size=S3_STREAM_CHUNK_SIZE):
+    """
+    Feed input_stream into the stdin of a process started with stdin, stdout and stderr pipes while collecting its
+    output, so the process works on the first chunks while the rest is still being read.
+    :param process: subprocess.Popen
+    :param input_stream: file-like object, e.g. the StreamingBody from open_s3_stream
+    :return: (stdout bytes, stderr bytes). Check process.returncode for the exit status
+    """
+    errors = []
+    stderr = []
+
+    def feed():
+        try:
+            for chunk in iter(lambda: input_stream.read(chunk_size), b''):
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # the process stopped reading. its exit status tells whether it's an error
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, name='stdin-feeder', daemon=True)
+    stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), name='stderr-reader',
+                                     daemon=True)
+    timer = Timer(f'stream input into {process.args[0]}', logger_fn=logger.info)
+    timer.tic()
+    feeder.start()
+    stderr_reader.start()
+    stdout = process.stdout.read()
+    feeder.join()
+    stderr_reader.join()
+    process.wait()
+    timer.toc()
+    if errors:
+        # e.g. the s3 connection dropped. the process output is incomplete
+        raise errors[0]
+    return stdout, stderr[0] if stderr else b''
+
+
 def upload_to_s3(s3_bucket, s3_key, body_bytes, **kwargs):
     timer = Timer(f'upload {len(body_bytes)} bytes to s3://{s3_bucket}/{s3_key}', logger_fn=logger.info)
     try:
@@ -87,6 +198,43 @@ def upload_to_s3(s3_bucket, s3_key, body_bytes, **kwargs):
         raise e
 
 
+class S3UploadPool(object):
+    """
+    Uploads objects to S3 from a bounded pool of worker threads so the caller can keep working while uploads are in
+    flight. submit() blocks once max_pending uploads are queued or running, which applies back-pressure to the
+    producer instead of holding an unbounded number of payloads in memory.
+    """
+
+    def __init__(self, max_workers=8, max_pending=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-upload')
+        self.pending_slots = threading.BoundedSemaphore(max_pending if max_pending else max_workers * 2)
+
+    def submit(self, s3_bucket, s3_key, body_bytes, **kwargs):
+        """
+        Queue an upload. Returns a future that resolves when the object is in S3, or raises the upload error.
+        """
+        self.pending_slots.acquire()
+        try:
+            future = self.executor.submit(upload_to_s3, s3_bucket, s3_key, body_bytes, **kwargs)
+        except Exception as e:
+            self.pending_slots.release()
+            raise e
+        future.add_done_callback(lambda f: self.pending_slots.release())
+        return future
+
+    def shutdown(self):
+        """
+        Wait for every queued upload to complete or fail.
+        """
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
 def upload_file_to_s3(s3_bucket, s3_key, filename, **kwargs):
     timer = Timer(f'upload {filename} bytes to s3://{s3_bucket}/{s3_key}', logger_fn=logger.info)
     try:
@@ -168,40 +316,268 @@ def get_item_ddb(table_name, ddb_client=None, **kwargs):
         return item
 
 
-def convert_csv_to_ddb(csv_file_path, table_name, delimiter=',', ddb_client=None):
-    if ddb_client is not None:
-        table = ddb_client.Table(table_name)
-    else:
-        table = dynamodb.Table(table_name)
+# BatchGetItem limit
+DDB_BATCH_GET_MAX_KEYS = 100
+
 
-    # each entry in header row should be in the format of "<ColumnName> (Type)"
-    # e.g. "Stream_ID (S)" or "Duration_Sec (N)"
-    pattern = re.compile(r'([a-zA-Z0-9_\s]+) \(([A-Z]+)\)')
-
-    def _parse_column_schema(col_header, pattern):
-        m = re.search(pattern, col_header)
-        return m.group(1), m.group(2)
-
-    def _get_csv_data(file, csv_delimiter):
-        dr = csv.DictReader(file, delimiter=csv_delimiter)
-        for d in dr:
-            row_data = {}
-            for field_name in dr.fieldnames:
-                ddb_column_name, ddb_column_type = _parse_column_schema(field_name, pattern)
-                if d[field_name]:
-                    if ddb_column_type == 'N':
-                        row_data[ddb_column_name] = float(d[field_name])
-                    elif ddb_column_type == 'BOOL':
-                        row_data[ddb_column_name] = bool(d[field_name])
-                    else:
-                        row_data[ddb_column_name] = d[field_name]
-            yield row_data
-
-    with open(csv_file_path) as csv_file:
-        for data in _get_csv_data(csv_file, delimiter):
-            item = convert_dict_float_to_dec(data)
-            logger.info(f'going to put {item} to DDB table: {table.name}')
-            table.put_item(Item=item)
+class DDBBatchGetError(Exception):
+    pass
+
+
+def batch_get_items_ddb(table_name, keys, ddb_client=None, projection_attrs=None, max_retries=8,
+                        backoff_base_sec=0.05):
+    """
+    Gets the items of keys with BatchGetItem, up to 100 keys per request. Keys DDB reports back as unprocessed are
+    retried with exponential backoff and jitter.
+
+    :param keys: list of primary keys, e.g. [{'Stream_ID': 'test_1', 'DateTime': '2020-02-19T22:45:14.938250Z'}]
+    :param projection_attrs: attributes to get, the key attributes are always included. All attributes if None
+    :return: the items found, in the order of keys. Keys without an item are skipped
+    """
+    ddb = ddb_client if ddb_client is not None else dynamodb
+    if not keys:
+        return []
+    key_attrs = list(keys[0].keys())
+
+    def item_key(item):
+        return tuple(item[attr] for attr in key_attrs)
+
+    request = {}
+    if projection_attrs is not None:
+        attrs = key_attrs + [attr for attr in projection_attrs if attr not in key_attrs]
+        request['ProjectionExpression'] = ', '.join(f'#a{i}' for i in range(len(attrs)))
+        request['ExpressionAttributeNames'] = {f'#a{i}': attr for i, attr in enumerate(attrs)}
+
+    timer = Timer(f'batch get {len(keys)} items from {table_name}', logger_fn=logger.info)
+    timer.tic()
+    items = {}
+    for start in range(0, len(keys), DDB_BATCH_GET_MAX_KEYS):
+        pending = keys[start:start + DDB_BATCH_GET_MAX_KEYS]
+        attempt = 0
+        while pending:
+            try:
+                response = ddb.batch_get_item(RequestItems={table_name: {'Keys': pending, **request}})
+            except ClientError as e:
+                logger.error(f'Error batch getting items from ddb: {table_name}', exc_info=True)
+                raise e
+            for item in response['Responses'].get(table_name, []):
+                items[item_key(item)] = item
+            pending = response.get('UnprocessedKeys', {}).get(table_name, {}).get('Keys', [])
+            if pending:
+                if attempt >= max_retries:
+                    raise DDBBatchGetError(
+                        f'{len(pending)} keys still unprocessed by {table_name} after {attempt} retries')
+                backoff_sec = backoff_base_sec * (2 ** attempt)
+                backoff_sec += random.uniform(0, backoff_sec)
+                logger.info(f'{len(pending)} unprocessed keys for {table_name}. Retry in {backoff_sec:0.3f}s')
+                time.sleep(backoff_sec)
+                attempt += 1
+    timer.toc()
+
+    found = [items[item_key(key)] for key in keys if item_key(key) in items]
+    if len(found) < len(keys):
+        logger.warning(f'{len(keys) - len(found)} of {len(keys)} items not found in {table_name}')
+    return found
+
+
+def convert_str_to_bool(string):
+    return string.lower() == 'true'
+
+
+# each entry in the header row of a csv file loaded to DDB should be in the format of "<ColumnName> (Type)"
+# e.g. "Stream_ID (S)" or "Duration_Sec (N)"
+CSV_HEADER_PATTERN = re.compile(r'([a-zA-Z0-9_\s]+) \(([A-Z]+)\)')
+# value conversion by column type, other types are loaded as strings. BOOL cells are true or false, in any case
+CSV_COLUMN_CONVERTERS = {'N': Decimal, 'BOOL': convert_str_to_bool}
+
+CsvColumn = namedtuple('CsvColumn', ['name', 'convert'])
+
+
+def parse_csv_schema(header):
+    """
+    :param header: the header row of a csv file, with the DDB attribute name and type of each column
+    :return: list of CsvColumn
+    """
+    columns = []
+    for field_name in header:
+        m = CSV_HEADER_PATTERN.search(field_name)
+        if m is None:
+            raise ValueError(f'Column header "{field_name}" is not in the format "<ColumnName> (Type)"')
+        columns.append(CsvColumn(m.group(1), CSV_COLUMN_CONVERTERS.get(m.group(2), str)))
+    return columns
+
+
+def read_csv_items(csv_file, delimiter=','):
+    """
+    Stream the rows of a csv file as DDB items. The header is parsed once, empty cells are left out of the items.
+    :param csv_file: file object of the csv file
+    :return: generator of items
+    """
+    reader = csv.reader(csv_file, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = parse_csv_schema(header)
+    for row in reader:
+        if row:
+            yield {column.name: column.convert(value) for column, value in zip(columns, row) if value}
+
+
+def write_items_ddb(table_name, items, ddb_client=None):
+    """Write items with a DDBBatchWriter, :return: the number of items written"""
+    with DDBBatchWriter(table_name, ddb_client=ddb_client) as batch_writer:
+        for item in items:
+            batch_writer.put_item(item)
+    return batch_writer.written_count
+
+
+def convert_csv_to_ddb(csv_file_path, table_name, delimiter=',', ddb_client=None, workers=8, diff=False):
+    """
+    Load a csv file into a DDB table, e.g. the schedule. Rows are streamed from the file and written in batches of
+    DDBBatchWriter.MAX_BATCH_SIZE by up to `workers` concurrent threads. Loading the same file again writes the same
+    items; when a key appears in several rows, the last row wins. Only the keys of the batches not written yet are
+    kept in memory, however large the file.
+    :param diff: only write the rows that differ from the item in the table. The current items are read with one query
+     per partition key found in the file, and kept until the file is loaded.
+    :return: dict with the number of rows read, items written and unchanged items skipped
+    """
+    ddb = ddb_client if ddb_client is not None else dynamodb
+    table = ddb.Table(table_name)
+    key_names = [key['AttributeName'] for key in sorted(table.key_schema, key=lambda key: key['KeyType'])]
+    hash_key_name = key_names[0]
+    current_items = {}  # map of partition key -> {item key -> item} of the table, in diff mode
+
+    def _current_items(partition_key):
+        if partition_key not in current_items:
+            items = query_item_ddb(table_name, ddb_client, KeyConditionExpression=Key(hash_key_name).eq(partition_key))
+            current_items[partition_key] = {tuple(item.get(name) for name in key_names): item for item in items}
+        return current_items[partition_key]
+
+    counts = {'rows': 0, 'written': 0, 'unchanged': 0}
+    in_flight = deque()  # (future, keys) of the batches submitted
+    in_flight_keys = set()
+    batch = {}
+
+    def _wait_oldest():
+        future, keys = in_flight.popleft()
+        counts['written'] += future.result()
+        in_flight_keys.difference_update(keys)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ddb-load') as executor, \
+            open(csv_file_path) as csv_file:
+
+        def _submit_batch():
+            # bound the rows in memory: wait for the oldest batch once every worker has a batch queued
+            while len(in_flight) >= 2 * workers:
+                _wait_oldest()
+            in_flight.append((executor.submit(write_items_ddb, table_name, list(batch.values()), ddb_client),
+                              set(batch)))
+            in_flight_keys.update(batch)
+            batch.clear()
+
+        for item in read_csv_items(csv_file, delimiter):
+            counts['rows'] += 1
+            item_key = tuple(item.get(name) for name in key_names)
+            if diff:
+                # an earlier row of the same key replaced the table item, the row is compared with it
+                items = _current_items(item_key[0])
+                if items.get(item_key) == item:
+                    counts['unchanged'] += 1
+                    continue
+                items[item_key] = item
+            if item_key in in_flight_keys:
+                # the earlier row may still be written concurrently: write this one after it
+                logger.warning(f'Duplicate key {item_key} in {csv_file_path}, the last row wins')
+                if batch:
+                    _submit_batch()
+                while in_flight:
+                    _wait_oldest()
+            batch[item_key] = item
+            if len(batch) >= DDBBatchWriter.MAX_BATCH_SIZE:
+                _submit_batch()
+        if batch:
+            _submit_batch()
+        while in_flight:
+            _wait_oldest()
+
+    logger.info(f'Loaded {csv_file_path} to {table_name}: {counts}')
+    return counts
+
+
+def bump_schedule_versions(table_name, stream_ids, ddb_client=None):
+    """
+    Increment the Schedule_Version of the streams in the schedule table, after their programs are written, so that the
+    cached schedules of the streams are read again
+    """
+    for stream_id in stream_ids:
+        update_item_ddb(table_name, ddb_client,
+                        Key={'Stream_ID': stream_id, 'Start_Time': SCHEDULE_VERSION_START_TIME},
+                        UpdateExpression='ADD Schedule_Version :one', ExpressionAttributeValues={':one': 1})
+
+
+class DDBBatchWriteError(Exception):
+    pass
+
+
+class DDBBatchWriter(object):
+    """
+    Buffers items in memory and writes them to a DDB table with BatchWriteItem, up to 25 items per request.
+    Items DDB reports back as unprocessed are retried with exponential backoff and jitter.
+    Use it as a context manager, or call flush() explicitly, to write whatever is still buffered.
+    """
+    MAX_BATCH_SIZE = 25
+
+    def __init__(self, table_name, ddb_client=None, flush_amount=MAX_BATCH_SIZE, max_retries=8, backoff_base_sec=0.05):
+        self.table_name = table_name
+        self.ddb = ddb_client if ddb_client is not None else dynamodb
+        self.flush_amount = min(flush_amount, self.MAX_BATCH_SIZE)
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.items = []
+        self.written_count = 0
+
+    def put_item(self, item):
+        self.items.append({'PutRequest': {'Item': item}})
+        if len(self.items) >= self.flush_amount:
+            self.flush()
+
+    def flush(self):
+        while self.items:
+            batch = self.items[:self.MAX_BATCH_SIZE]
+            self.items = self.items[self.MAX_BATCH_SIZE:]
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        timer = Timer(f'batch write {len(batch)} items to {self.table_name}', logger_fn=logger.info)
+        timer.tic()
+        pending = batch
+        attempt = 0
+        while pending:
+            try:
+                response = self.ddb.batch_write_item(RequestItems={self.table_name: pending})
+            except ClientError as e:
+                logger.error(f'Error batch writing items to ddb: {self.table_name}', exc_info=True)
+                raise e
+            self.written_count += len(pending)
+            pending = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if pending:
+                self.written_count -= len(pending)
+                if attempt >= self.max_retries:
+                    raise DDBBatchWriteError(
+                        f'{len(pending)} items still unprocessed by {self.table_name} after {attempt} retries')
+                backoff_sec = self.backoff_base_sec * (2 ** attempt)
+                backoff_sec += random.uniform(0, backoff_sec)
+                logger.info(f'{len(pending)} unprocessed items for {self.table_name}. Retry in {backoff_sec:0.3f}s')
+                time.sleep(backoff_sec)
+                attempt += 1
+        timer.toc()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        logger.info(f'Flushing {len(self.items)} buffered items to dynamodb [{self.table_name}]')
+        self.flush()
 
 
 class DDBUpdateBuilder(object):
@@ -243,7 +619,8 @@ class DDBUpdateBuilder(object):
 
 def detect_text_from_image(s3_bucket, s3_key):
     try:
-        response = rekognition.detect_text(
+        response = call_rekognition(
+            rekognition, 'detect_text',
             Image={
                 'S3Object': {
                     'Bucket': s3_bucket,
@@ -412,13 +789,12 @@ def get_secret(secret_name):
         return secret
 
 
-def convert_str_to_bool(string):
-    return string.lower() == 'true'
-
-
 def parse_expected_teams(team_info, expected_team_str):
-    expected_team_abbr = expected_team_str.split(" V ")
-    return [team_info.get_team_from_abbr(team_abbr) for team_abbr in expected_team_abbr]
+    """:return: the known teams of a Team_Info value like "AVL V NOR", an empty list when there's none"""
+    if not expected_team_str:
+        return []
+    expected_teams = [team_info.get_team_from_abbr(team_abbr) for team_abbr in expected_team_str.split(" V ")]
+    return [team for team in expected_teams if team is not None]
 
 
 def convert_to_ddb(node):
@@ -0,0 +1,41 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+
+class SportsCheck:
+    def execute(self, expected_program_info, detected):
+        """
+        Compare the detected sport against the expected value
+        :param expected: Expected Program data
+        {
+            "Team_Info": "AVL V NOR",
+            "Station_Logo": "Prime Video",
+                ...
+            "Start_Time": 180,
+            "languageCode": "en-en",
+            "Sports_Type": "soccer",
+            "Segment_Start_Time_In_Loop": 189.9875
+        }
+        :param detected:
+          [
+            {
+              "Name": "soccer",
+              "Confidence": 88.0790023803711,
+            },
+            ...
+          ]
+        """
+        if not expected_program_info.get('Sports_Type'):
+            # not a sports program, nothing to compare against
+            return
+
+        yield 'Sports_Expected', expected_program_info['Sports_Type']
+        if not detected:
+            # detection empty
+            yield 'Sports_Status', False
+        else:
+            detected_sport = detected[0]['Name']
+            yield 'Sports_Detected', detected_sport
+            yield 'Sports_Detected_Confidence', detected[0]['Confidence']
+            yield 'Sports_Status', detected_sport == expected_program_info['Sports_Type']
@@ -9,7 +9,7 @@ from collections import defaultdict, deque
 
 from common.config import LOG_LEVEL
 from common.utils import parse_expected_teams
-from sports_data.team import TeamInfoFactory
+from sports_data.team import team_index
 
 logging.basicConfig()
 logger = logging.getLogger('team-logo-check')
@@ -49,17 +49,15 @@ class TeamLogoCheck:
             ...
           ]
         """
-        team_info = TeamInfoFactory()
-        expected_teams = parse_expected_teams(team_info, expected_program_info.get('Team_Info'))
-        expected_teams.sort(key=lambda t: t.team_id)
-
-        if expected_teams is None:
+        expected_teams = parse_expected_teams(team_index, expected_program_info.get('Team_Info'))
+        if not expected_teams:
             logger.info('Expected Team Info not found')
             return
+        expected_teams.sort(key=lambda t: t.team_id)
 
         logo_detections = defaultdict(list)
         for detection in detected_logos:
-            detected_team = team_info.get_team_from_id(detection['Name'])
+            detected_team = team_index.get_team_from_id(detection['Name'])
             if detected_team is None:
                 logger.info(f'found no team matching id: {detection["Name"]}')
                 continue
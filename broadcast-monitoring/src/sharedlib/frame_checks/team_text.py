@@ -6,14 +6,18 @@ import logging
 from collections import defaultdict, deque
 from decimal import Decimal
 import json
-from common.config import LOG_LEVEL
+from common.config import LOG_LEVEL, TEAM_NAME_MAX_EDIT_DISTANCE, TEAM_NAME_FUZZY_MIN_LENGTH
 from common.utils import convert_dict_float_to_dec, parse_expected_teams, DecimalEncoder
-from sports_data.team import TeamInfoFactory
+from sports_data.matcher import TeamMatcher
+from sports_data.team import team_index
 
 logging.basicConfig()
 logger = logging.getLogger('team-text-check')
 logger.setLevel(LOG_LEVEL)
 
+team_matcher = TeamMatcher(team_index, max_distance=TEAM_NAME_MAX_EDIT_DISTANCE,
+                           min_fuzzy_length=TEAM_NAME_FUZZY_MIN_LENGTH)
+
 
 class TeamCheck:
     def __init__(self):
@@ -21,16 +25,14 @@ class TeamCheck:
 
     def execute(self, expected, data):
 
-        team_info = TeamInfoFactory()
-        expected_teams = parse_expected_teams(team_info, expected.get('Team_Info'))
-        expected_teams.sort(key=lambda t: t.team_id)
-
-        if expected_teams is None:
+        expected_teams = parse_expected_teams(team_index, expected.get('Team_Info'))
+        if not expected_teams:
             logger.info('Expected Team Info not found')
             return
+        expected_teams.sort(key=lambda t: t.team_id)
 
         expected_team_names = [team.name for team in expected_teams]
-        detected_team_info = detect_team_from_text_in_image(team_info, data)
+        detected_team_info = detect_team_from_text_in_image(team_matcher, data)
 
         result = {'Expected_Teams': expected_team_names, 'Detected_Teams': detected_team_info}
 
@@ -65,9 +67,10 @@ class TeamCheck:
         return result
 
 
-def detect_team_from_text_in_image(team_info, detected_words):
+def detect_team_from_text_in_image(matcher, detected_words):
     """
-    :param detected_text_response: see https://docs.aws.amazon.com/rekognition/latest/dg/API_DetectText.html
+    :param matcher: TeamMatcher
+    :param detected_words: see https://docs.aws.amazon.com/rekognition/latest/dg/API_DetectText.html
     [
       {
          "Confidence": number,
@@ -98,6 +101,7 @@ def detect_team_from_text_in_image(team_info, detected_words):
           "id": "string",
           "name": "string",
           "text_detected": "string",
+          "match": "abbr" | "name" | "fuzzy",
           "confidence": Decimal,
           "bb": {
             "Width": Decimal,
@@ -112,25 +116,17 @@ def detect_team_from_text_in_image(team_info, detected_words):
     """
     teams_found = defaultdict(list)
 
-    for result in [el for el in detected_words if el['Type'] == 'WORD']:
-        detected_text = result['DetectedText']
-
-        team_found = None
-
-        if team_info.abbr_exists(detected_text):
-            team_found = team_info.get_team_from_abbr(detected_text)
-        elif team_info.team_exists(detected_text.lower()):
-            team_found = team_info.get_team(detected_text.lower())
-
-        if team_found is not None:
-            logger.info(f'found team: {team_found.name} from text: {detected_text}')
-
-            teams_found[team_found.team_id].append({
-                'id': team_found.team_id,
-                'name': team_found.name,
-                'text_detected': detected_text,
-                'confidence': Decimal(str(result['Confidence'])),
-                'bb': convert_dict_float_to_dec(result['Geometry']['BoundingBox'])
-            })
+    for result, team_match in matcher.match(detected_words):
+        team_found = team_match.team
+        logger.info(f'found team: {team_found.name} from text: {team_match.text} ({team_match.match_type})')
+
+        teams_found[team_found.team_id].append({
+            'id': team_found.team_id,
+            'name': team_found.name,
+            'text_detected': team_match.text,
+            'match': team_match.match_type,
+            'confidence': Decimal(str(result['Confidence'])),
+            'bb': convert_dict_float_to_dec(result['Geometry']['BoundingBox'])
+        })
     logger.info(json.dumps(teams_found, indent=2, cls=DecimalEncoder))
     return teams_found
@@ -0,0 +1,211 @@
+# Copyright 2020 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: LicenseRef-.amazon.com.-AmznSL-1.0
+# Licensed under the Amazon Software License  http://aws.amazon.com/asl/
+
+import logging
+from collections import deque, defaultdict, namedtuple
+from itertools import combinations
+
+from .team import normalize_team_name
+
+logger = logging.getLogger("TeamMatcher")
+
+# characters OCR commonly reads as digits in upper case text, e.g. T0T for TOT
+OCR_DIGIT_TO_LETTER = str.maketrans({'0': 'O', '1': 'I', '5': 'S', '8': 'B'})
+
+# team found in a text detection: how it matched and the matched text
+TeamMatch = namedtuple('TeamMatch', ['team', 'text', 'match_type', 'distance'])
+
+MATCH_ABBR = 'abbr'
+MATCH_NAME = 'name'
+MATCH_FUZZY = 'fuzzy'
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton finding all the occurrences of a set of keywords in a text in a single pass.
+    Only occurrences delimited by non alphanumeric characters (or the ends of the text) are reported.
+    """
+
+    def __init__(self, keywords):
+        """
+        :param keywords: dict of keyword -> value returned when it's found
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword, value in keywords.items():
+            self._add(keyword, value)
+        self._build_failure_links()
+
+    def _add(self, keyword, value):
+        state = 0
+        for char in keyword:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(keyword), value))
+
+    def _build_failure_links(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """
+        :return: generator of (start, end, value) of the keywords found in text
+        """
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                start, end = i - length + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, value
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """Levenshtein distance between a and b, or max_distance + 1 as soon as it's known to be larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class DeletionIndex(object):
+    """
+    SymSpell style index for lookups within an edit distance: every key is indexed under all its variants with up to
+    max_distance characters deleted. Two words within the distance share a variant, so a lookup only generates the
+    deletions of the word and checks the keys indexed under them, whatever the number of keys.
+    """
+
+    def __init__(self, keys, max_distance):
+        """
+        :param keys: dict of key -> value
+        """
+        self.max_distance = max_distance
+        self.keys = dict(keys)
+        self.deletions = defaultdict(set)
+        for key in self.keys:
+            for variant in self._variants(key):
+                self.deletions[variant].add(key)
+
+    def _variants(self, word):
+        variants = set()
+        for n in range(min(self.max_distance, len(word) - 1) + 1):
+            for kept in combinations(range(len(word)), len(word) - n):
+                variants.add(''.join(word[i] for i in kept))
+        return variants
+
+    def lookup(self, word):
+        """
+        :return: (value, distance) of the closest key within max_distance of word, or None
+        """
+        candidates = set()
+        for variant in self._variants(word):
+            candidates.update(self.deletions.get(variant, ()))
+        best = None
+        for key in sorted(candidates):
+            distance = bounded_edit_distance(word, key, self.max_distance)
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (self.keys[key], distance)
+        return best
+
+
+class TeamMatcher(object):
+    """
+    Finds the teams named in the text rekognition detects in a frame:
+    - team names, including multi-word ones, anywhere in the detected LINEs
+    - abbreviations in the detected WORDs, also when OCR read some of their letters as digits
+    - near misses of single word team names in the WORDs, within max_distance edits. Words shorter than
+      min_fuzzy_length are only matched exactly, as short words are too often a few edits away from a team name.
+    The matcher is built once from a team index, lookups don't depend on the number of teams.
+    """
+
+    def __init__(self, team_index, max_distance=1, min_fuzzy_length=5):
+        self.team_index = team_index
+        self.min_fuzzy_length = min_fuzzy_length
+        self.names = AhoCorasick(dict(team_index.teams))
+        single_word_names = {name: team for name, team in team_index.teams.items()
+                             if ' ' not in name and len(name) >= min_fuzzy_length}
+        self.fuzzy_names = DeletionIndex(single_word_names, max_distance) if max_distance > 0 else None
+
+    def match_line(self, text):
+        """
+        :return: list of TeamMatch of the team names in a line of text. Overlapping names only match once, as the
+        longest one starting first, e.g. aston villa rather than villa.
+        """
+        normalized = normalize_team_name(text)
+        matches = []
+        matched_end = 0
+        for start, end, team in sorted(self.names.find(normalized), key=lambda m: (m[0], m[0] - m[1])):
+            if start >= matched_end:
+                matches.append(TeamMatch(team, normalized[start:end], MATCH_NAME, 0))
+                matched_end = end
+        return matches
+
+    def match_word(self, word):
+        """
+        :return: TeamMatch of the team abbreviated or named (approximately) by a word, or None
+        """
+        team = self.team_index.get_team_from_abbr(word)
+        if team is None and word.isupper():
+            team = self.team_index.get_team_from_abbr(word.translate(OCR_DIGIT_TO_LETTER))
+        if team is not None:
+            return TeamMatch(team, word, MATCH_ABBR, 0)
+
+        team = self.team_index.get_team(word)
+        if team is not None:
+            return TeamMatch(team, word, MATCH_NAME, 0)
+
+        normalized = normalize_team_name(word)
+        if self.fuzzy_names is None or len(normalized) < self.min_fuzzy_length:
+            return None
+        found = self.fuzzy_names.lookup(normalized)
+        if found is None:
+            return None
+        team, distance = found
+        return TeamMatch(team, word, MATCH_FUZZY, distance)
+
+    def match(self, detections):
+        """
+        Matches the LINE and WORD text detections of rekognition
+        :return: list of (detection, TeamMatch)
+        """
+        matches = []
+        # words of the lines in which a team name was found exactly, not matched again approximately
+        matched_words = defaultdict(set)
+        for detection in detections:
+            if detection['Type'] == 'LINE':
+                for team_match in self.match_line(detection['DetectedText']):
+                    matches.append((detection, team_match))
+                    matched_words[detection.get('Id')].update(team_match.text.split())
+        for detection in detections:
+            if detection['Type'] == 'WORD':
+                team_match = self.match_word(detection['DetectedText'])
+                if team_match is None:
+                    continue
+                if team_match.match_type != MATCH_ABBR and \
+                        normalize_team_name(team_match.text) in matched_words[detection.get('ParentId')]:
+                    continue
+                matches.append((detection, team_match))
+        return matches
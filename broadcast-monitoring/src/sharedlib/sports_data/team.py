@@ -5,17 +5,45 @@
 import yaml
 import os
 import logging
-import copy
+from types import MappingProxyType
 
 logger = logging.getLogger("TeamInfo")
 
+TEAM_INFO_YAML_FILE = os.path.dirname(os.path.realpath(__file__)) + '/data/teams.yaml'
+
+
+def normalize_team_name(team_name):
+    """Key of a team name in the index: case and whitespace insensitive"""
+    return ' '.join(team_name.lower().split())
+
 
 class Team(object):
-    def __init__(self, name, abbreviations, alt_names=[], team_id=None):
-        self.name = name
-        self.abbreviations = abbreviations
-        self.alt_names = alt_names
-        self.team_id = team_id
+    """
+    Immutable team: instances are shared by every lookup of the process-wide index, so they can't be modified.
+    """
+    __slots__ = ('name', 'abbreviations', 'alt_names', 'team_id')
+
+    def __init__(self, name, abbreviations, alt_names=(), team_id=None):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'abbreviations', tuple(abbreviations))
+        object.__setattr__(self, 'alt_names', tuple(alt_names))
+        object.__setattr__(self, 'team_id', team_id)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    # copies of an immutable team are the team itself, pickling rebuilds it through the constructor
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (self.name, self.abbreviations, self.alt_names, self.team_id)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -28,67 +56,90 @@ class Team(object):
     def __str__(self):
         return f'Name={self.name};' \
                f'Id={self.team_id};' \
-               f'Abbreviations={self.abbreviations};' \
-               f'AltNames={self.alt_names}'
+               f'Abbreviations={list(self.abbreviations)};' \
+               f'AltNames={list(self.alt_names)}'
+
+
+class TeamIndex(object):
+    """
+    Read only index of the teams by name (including alternative names), abbreviation and id.
+    Names are looked up by their normalized form, abbreviations and ids as is.
+    """
+    __slots__ = ('teams', 'abbr_to_team', 'team_id_to_team')
+
+    def __init__(self, items):
+        teams = {}  # map of normalized team name -> Team object
+        abbr_to_team = {}  # map of abbreviations -> Team object
+        team_id_to_team = {}  # map of team id -> Team object
+        for team_name in items:
+            team_id = items[team_name]['id']
+            abbrs = items[team_name]['abbr']
+            alt_names = items[team_name].get('alt', [])
+            team = Team(team_name, abbrs, alt_names, team_id)
+            team_id_to_team[team_id] = team
+            for abbr in abbrs:
+                if abbr in abbr_to_team:
+                    error_msg = f'found duplicate abbreviations: {abbr} for ' \
+                                f'{abbr_to_team[abbr].name} and {team_name}'
+                    logger.error(error_msg)
+                    raise ValueError(error_msg)
+                abbr_to_team[abbr] = team
+            for name in [team_name] + list(alt_names):
+                teams[normalize_team_name(name)] = team
+        self.teams = MappingProxyType(teams)
+        self.abbr_to_team = MappingProxyType(abbr_to_team)
+        self.team_id_to_team = MappingProxyType(team_id_to_team)
+
+    @classmethod
+    def from_yaml(cls, item_yaml_file):
+        with open(item_yaml_file, 'r') as f:
+            return cls(yaml.safe_load(f))
+
+    def abbr_exists(self, abbr):
+        return abbr in self.abbr_to_team
+
+    def team_exists(self, team_name):
+        return normalize_team_name(team_name) in self.teams
+
+    def get_team_from_abbr(self, abbr):
+        return self.abbr_to_team.get(abbr)
+
+    def get_team_from_id(self, team_id):
+        return self.team_id_to_team.get(team_id)
+
+    def get_team(self, team_name):
+        return self.teams.get(normalize_team_name(team_name))
+
+
+# loaded once per container and shared by every check
+team_index = TeamIndex.from_yaml(TEAM_INFO_YAML_FILE)
 
 
 class TeamInfoFactory(object):
     """
-    Factory method that provides info about teams. It reads in yaml configuration to load team names and abbreviations.
+    Provides info about teams from the shared team index, or from an index loaded from another yaml configuration.
     """
 
-    def __init__(self):
-        self.abbr_to_team = {}  # map of abbreviations -> Team object
-        self.teams = {}  # map of team name -> Team object
-        self.team_id_to_team = {}  # map of team id -> Team object
-        team_info_yaml_file = os.path.dirname(os.path.realpath(__file__)) + '/data/teams.yaml'
-        self.load_items_from_yaml(team_info_yaml_file)
+    def __init__(self, index=None):
+        self.index = index if index is not None else team_index
 
     def load_items_from_yaml(self, item_yaml_file):
         try:
-            with open(item_yaml_file, 'r') as f:
-                items = yaml.safe_load(f)
-                for team_name in items:
-                    team_id = items[team_name]['id']
-                    abbrs = items[team_name]['abbr']
-                    alt_names = []
-                    if 'alt' in items[team_name]:
-                        alt_names = items[team_name]['alt']
-                    team = Team(team_name, abbrs, alt_names, team_id)
-                    self.teams[team_name] = team
-                    self.team_id_to_team[team_id] = team
-                    for abbr in abbrs:
-                        if self.abbr_exists(abbr):
-                            error_msg = f'found duplicate abbreviations: {abbr} for ' \
-                                        f'{self.abbr_to_team[abbr].name} and {team_name}'
-                            logger.error(error_msg)
-                            raise ValueError(error_msg)
-                        self.abbr_to_team[abbr] = team
-                    for alt_name in alt_names:
-                        self.teams[alt_name] = team
+            self.index = TeamIndex.from_yaml(item_yaml_file)
         except yaml.YAMLError as exc:
             logger.exception(str(exc))
 
     def abbr_exists(self, abbr):
-        return abbr in self.abbr_to_team
+        return self.index.abbr_exists(abbr)
 
     def team_exists(self, team_name):
-        return bool(set(self.teams.keys()) & {team_name, team_name.lower()})
+        return self.index.team_exists(team_name)
 
     def get_team_from_abbr(self, abbr):
-        if self.abbr_exists(abbr):
-            return copy.deepcopy(self.abbr_to_team[abbr])
-        else:
-            return None
+        return self.index.get_team_from_abbr(abbr)
 
     def get_team_from_id(self, team_id):
-        if team_id in self.team_id_to_team:
-            return self.team_id_to_team[team_id]
-        else:
-            return None
+        return self.index.get_team_from_id(team_id)
 
     def get_team(self, team_name):
-        if self.team_exists(team_name):
-            return copy.deepcopy(self.teams[team_name] if team_name in self.teams else self.teams[team_name.lower()])
-        else:
-            return None
+        return self.index.get_team(team_name)
@@ -6,6 +6,7 @@ import os
 import logging
 import json
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote_plus
 
 # layers
@@ -14,28 +15,75 @@ import sys
 sys.path.append('/opt')
 from common.config import (LOG_LEVEL, STATION_LOGO_CHECK_CONFIG_KEY, TEAM_LOGO_CHECK_CONFIG_KEY, TEAM_CHECK_CONFIG_KEY,
                            REUSE_DETECTION_CONFIG_KEY, APPSYNC_NOTIFY_CONFIG_KEY, SPORTS_CHECK_CONFIG_KEY)
-from common.utils import convert_str_to_bool
+from common.manifest_parser import is_master_manifest_head
+from common.utils import convert_str_to_bool, read_file_head_from_s3
 
 logger = logging.getLogger('StartSFN')
 logger.setLevel(LOG_LEVEL)
 
 SFN_ARN = os.getenv('SFN_ARN')
+# executions started concurrently when an event holds several records
+SFN_START_WORKERS = int(os.getenv('SFN_START_WORKERS', 8))
+# bytes of a manifest read to tell master manifests apart, the master tags come first
+MANIFEST_HEAD_BYTES = int(os.getenv('MANIFEST_HEAD_BYTES', 1024))
 sfn_client = boto3.client('stepfunctions')
 
 
+def load_check_config():
+    return {
+        'audio_check_enabled': convert_str_to_bool(os.getenv('AUDIO_CHECK_ENABLED', "false")),
+        STATION_LOGO_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('STATION_LOGO_CHECK_ENABLED', "false")),
+        TEAM_LOGO_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('TEAM_LOGO_CHECK_ENABLED', "false")),
+        TEAM_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('TEAM_DETECT_CHECK_ENABLED', "false")),
+        APPSYNC_NOTIFY_CONFIG_KEY: convert_str_to_bool(os.getenv('APPSYNC_NOTIFY_ENABLED', "false")),
+        REUSE_DETECTION_CONFIG_KEY: convert_str_to_bool(os.getenv('REUSE_DETECTION_IF_AVAILABLE', "false")),
+        SPORTS_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('SPORTS_DETECT_CHECK_ENABLED', "false"))
+    }
+
+
+# the environment of a lambda doesn't change between invocations
+CHECK_CONFIG = load_check_config()
+
+
 def lambda_handler(event, context):
     """
-    Receive S3 put events and start a state machine execution for each s3 object
+    Receive S3 put events and start a state machine execution for each s3 object that isn't a master manifest
     :param event: S3 put event notification
     :param context: lambda environment context
     :return: none
     """
     logger.info('Received event: %s', json.dumps(event, indent=2))
-    for record in event['Records']:
-        state_machine_input = parse_s3_event(record)
+    records = event['Records']
+    if len(records) == 1:
+        start_execution(records[0])
+        return
+
+    with ThreadPoolExecutor(max_workers=min(SFN_START_WORKERS, len(records))) as executor:
+        futures = [executor.submit(start_execution, record) for record in records]
+    # raise the first error once every record was processed
+    for future in futures:
+        future.result()
 
-        response = sfn_client.start_execution(stateMachineArn=SFN_ARN, input=json.dumps(state_machine_input))
-        logger.info(f'Started SFN execution: {response}')
+
+def start_execution(record):
+    state_machine_input = parse_s3_event(record)
+    if is_master_manifest_object(state_machine_input):
+        logger.info(f'Skipping master manifest s3://{state_machine_input["s3Bucket"]}/{state_machine_input["s3Key"]}')
+        return None
+
+    response = sfn_client.start_execution(stateMachineArn=SFN_ARN, input=json.dumps(state_machine_input))
+    logger.info(f'Started SFN execution: {response}')
+    return response
+
+
+def is_master_manifest_object(state_machine_input):
+    """
+    Whether the manifest is a master manifest, from its first bytes. When they don't tell, the execution is started
+    and the state machine checks the whole manifest.
+    """
+    manifest_head = read_file_head_from_s3(state_machine_input['s3Bucket'], state_machine_input['s3Key'],
+                                           state_machine_input['s3VersionId'], MANIFEST_HEAD_BYTES)
+    return is_master_manifest_head(manifest_head) is True
 
 
 def parse_s3_event(record):
@@ -46,14 +94,6 @@ def parse_s3_event(record):
         's3Bucket': s3_bucket,
         's3Key': s3_key,
         's3VersionId': s3_version_id,
-        'config': {
-            'audio_check_enabled': convert_str_to_bool(os.getenv('AUDIO_CHECK_ENABLED', "false")),
-            STATION_LOGO_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('STATION_LOGO_CHECK_ENABLED', "false")),
-            TEAM_LOGO_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('TEAM_LOGO_CHECK_ENABLED', "false")),
-            TEAM_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('TEAM_DETECT_CHECK_ENABLED', "false")),
-            APPSYNC_NOTIFY_CONFIG_KEY: convert_str_to_bool(os.getenv('APPSYNC_NOTIFY_ENABLED', "false")),
-            REUSE_DETECTION_CONFIG_KEY: convert_str_to_bool(os.getenv('REUSE_DETECTION_IF_AVAILABLE', "false")),
-            SPORTS_CHECK_CONFIG_KEY: convert_str_to_bool(os.getenv('SPORTS_DETECT_CHECK_ENABLED', "false"))
-        }
+        'config': dict(CHECK_CONFIG)
     }
     return state_machine_input
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from common.utils import s3
+from .. import main
+from ..main import lambda_handler, sfn_client
+
+SFN_ARN = 'arn:aws:states:us-east-1:123456789012:stateMachine:test'
+
+MASTER_MANIFEST = b'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-INDEPENDENT-SEGMENTS\n#EXT-X-STREAM-INF:BANDWIDTH=5270540\n'
+CHILD_MANIFEST = b'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:7\n#EXT-X-MEDIA-SEQUENCE:10\n'
+
+
+@pytest.fixture()
+def stubs():
+    with Stubber(s3) as s3_stub, Stubber(sfn_client) as sfn_stub:
+        yield s3_stub, sfn_stub
+        s3_stub.assert_no_pending_responses()
+        sfn_stub.assert_no_pending_responses()
+
+
+def s3_record(key):
+    return {'s3': {'bucket': {'name': 'test-bucket'}, 'object': {'key': key, 'versionId': 'v1'}}}
+
+
+def manifest_head_response(content):
+    return {'Body': StreamingBody(io.BytesIO(content), len(content))}
+
+
+def test_lambda_handler_skips_master_manifests(stubs):
+    s3_stub, sfn_stub = stubs
+    s3_stub.add_response('get_object', manifest_head_response(MASTER_MANIFEST),
+                         {'Bucket': 'test-bucket', 'Key': 'live/test_1.m3u8', 'VersionId': 'v1',
+                          'Range': 'bytes=0-1023'})
+
+    lambda_handler({'Records': [s3_record('live/test_1.m3u8')]}, None)
+
+
+def test_lambda_handler_starts_executions_concurrently(stubs, monkeypatch):
+    monkeypatch.setattr(main, 'SFN_ARN', SFN_ARN)
+    s3_stub, sfn_stub = stubs
+    for _ in range(3):
+        s3_stub.add_response('get_object', manifest_head_response(CHILD_MANIFEST),
+                             {'Bucket': 'test-bucket', 'Key': ANY, 'VersionId': 'v1', 'Range': 'bytes=0-1023'})
+        sfn_stub.add_response('start_execution',
+                              {'executionArn': 'arn:aws:states:us-east-1:123456789012:execution:test:1',
+                               'startDate': '2020-03-05T18:49:28Z'},
+                              {'stateMachineArn': SFN_ARN, 'input': ANY})
+
+    lambda_handler({'Records': [s3_record(f'live/test_{i}.m3u8') for i in range(3)]}, None)
@@ -0,0 +1,25 @@
+from common.frame_hash import FrameDetectionCache, hamming_distance
+
+
+def test_hamming_distance():
+    assert hamming_distance('9959309156a15c2b', '9959309156a15c2b') == 0
+    assert hamming_distance('9959309156a15c2b', '9959309156a15c2a') == 1
+    assert hamming_distance('0000000000000000', 'ffffffffffffffff') == 64
+
+
+def test_lookup_closest_entry_within_distance():
+    sut = FrameDetectionCache('test_1', max_distance=4)
+    sut.add('00000000000000ff', '2020-01-23T21:35:00.000000Z', {'Logo_Labels': [], 'Sports_Labels': []}, now=0)
+    sut.add('000000000000000f', '2020-01-23T21:35:01.000000Z', {'Logo_Labels': []}, now=0)
+
+    assert sut.lookup('000000000000001f', ['Logo_Labels'])['Frame_DateTime'] == '2020-01-23T21:35:01.000000Z'
+    # the closest entry doesn't hold the sports labels
+    assert sut.lookup('000000000000001f', ['Sports_Labels'])['Frame_DateTime'] == '2020-01-23T21:35:00.000000Z'
+    assert sut.lookup('0000000000000000', ['Sports_Labels']) is None
+    assert sut.lookup('00000000000000ff', ['Text_Detections']) is None
+
+
+def test_add_sets_expiry():
+    sut = FrameDetectionCache('test_1', ttl_sec=300)
+    sut.add('00000000000000ff', '2020-01-23T21:35:00.000000Z', {}, now=1000)
+    assert sut.new_entries['00000000000000ff']['ExpireTTL'] == 1300
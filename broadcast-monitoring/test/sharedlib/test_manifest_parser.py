@@ -1,6 +1,7 @@
 from unittest import TestCase
 from ..testutils import read_file
-from common.manifest_parser import get_last_segment_and_start_timestamp, is_master_manifest
+from common.manifest_parser import get_last_segment_and_start_timestamp, is_master_manifest, is_master_manifest_head, \
+    parse_manifest_tail, parse_playlist
 import os
 from datetime import datetime
 
@@ -33,3 +34,81 @@ class TestManifestParser(TestCase):
 
         manifest = read_file(os.path.join(TEST_DATA_DIR, 'test_no_program_time.m3u8'))
         self.assertEqual(False, is_master_manifest(manifest), 'The manifest should be categorized as child.')
+
+    def test_is_master_manifest_head(self):
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'master_manifest.m3u'))
+        self.assertEqual(True, is_master_manifest_head(manifest[:120]))
+
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'test_no_program_time.m3u8'))
+        self.assertEqual(False, is_master_manifest_head(manifest[:120]))
+        self.assertIsNone(is_master_manifest_head('#EXTM3U\n#EXT-X-VERSION:3\n'))
+
+    def test_parse_manifest_tail(self):
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'master_manifest.m3u'))
+        self.assertTrue(parse_manifest_tail(manifest).is_master)
+
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'segment_right_after_program_time.m3u8'))
+        tail = parse_manifest_tail(manifest[-120:], partial=True)
+        self.assertFalse(tail.is_master)
+        self.assertTrue(tail.complete)
+        self.assertEqual(tail.segment, 'test_1_00006.ts')
+        self.assertEqual(tail.start_time, datetime(2020, 1, 21, hour=16, minute=35, second=15, microsecond=430000))
+
+        # the only program date time is at the top of the manifest
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'test_program_time.m3u8'))
+        self.assertFalse(parse_manifest_tail(manifest[-120:], partial=True).complete)
+        tail = parse_manifest_tail(manifest)
+        self.assertTrue(tail.complete)
+        self.assertEqual(tail.start_time, datetime(2020, 1, 21, hour=16, minute=58, second=41, microsecond=976000))
+
+        # program date time between the EXTINF and the URI of the last segment
+        tail = parse_manifest_tail('#EXTM3U\n#EXTINF:6.006,\n#EXT-X-PROGRAM-DATE-TIME:2020-01-21T16:35:15.430Z\n'
+                                   'test_1_00006.ts\n')
+        self.assertEqual((tail.segment, tail.duration_sec), ('test_1_00006.ts', 6.006))
+        self.assertEqual(tail.start_time, datetime(2020, 1, 21, hour=16, minute=35, second=15, microsecond=430000))
+
+    def test_parse_playlist(self):
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'master_manifest.m3u'))
+        self.assertTrue(parse_playlist(manifest).is_master)
+
+        manifest = read_file(os.path.join(TEST_DATA_DIR, 'test_program_time.m3u8'))
+        playlist = parse_playlist(manifest)
+        self.assertFalse(playlist.is_master)
+        self.assertEqual((playlist.media_sequence, playlist.target_duration), (10, 7))
+        self.assertEqual(len(playlist.segments), 10)
+        last_segment = playlist.last_segment
+        self.assertEqual((last_segment.uri, last_segment.media_sequence), ('test_1_00019.ts', 19))
+        self.assertEqual(last_segment.program_date_time,
+                         datetime(2020, 1, 21, hour=16, minute=58, second=41, microsecond=976000))
+        self.assertEqual(playlist.segment(12).uri, 'test_1_00012.ts')
+        self.assertIsNone(playlist.segment(9))
+        self.assertEqual([s.media_sequence for s in playlist.segments_after(16)], [17, 18, 19])
+        self.assertEqual(len(playlist.segments_after(5)), 10)
+
+        # no program date time is extrapolated across a discontinuity
+        playlist = parse_playlist('#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:3\n#EXT-X-DISCONTINUITY-SEQUENCE:1\n'
+                                  '#EXT-X-PROGRAM-DATE-TIME:2020-01-21T16:35:15.430Z\n#EXTINF:6.0,\na.ts\n'
+                                  '#EXT-X-DISCONTINUITY\n#EXTINF:6.0,\nb.ts\n#EXTINF:6.0,\nc.ts\n'
+                                  '#EXT-X-PROGRAM-DATE-TIME:2020-01-21T17:00:00.000Z\n#EXTINF:6.0,\nd.ts\n')
+        self.assertEqual([s.discontinuity_sequence for s in playlist.segments], [1, 2, 2, 2])
+        self.assertEqual([s.discontinuity for s in playlist.segments], [False, True, False, False])
+        self.assertIsNone(playlist.segment(5).program_date_time)
+        self.assertEqual(playlist.segment(6).program_date_time, datetime(2020, 1, 21, hour=17))
+
+    def test_parse_partial_playlist(self):
+        # end of a manifest, starting in the middle of a line
+        playlist = parse_playlist('.922Z\n#EXTINF:6.0,\na.ts\n#EXT-X-PROGRAM-DATE-TIME:2020-01-21T17:00:00.000Z\n'
+                                  '#EXTINF:6.0,\nb.ts\n#EXTINF:6.0,\nc.ts\n', partial=True)
+        self.assertTrue(playlist.partial)
+        self.assertEqual([(s.uri, s.media_sequence) for s in playlist.segments],
+                         [('a.ts', None), ('b.ts', None), ('c.ts', None)])
+        self.assertIsNone(playlist.segments[0].program_date_time)
+        self.assertEqual(playlist.last_segment.program_date_time, datetime(2020, 1, 21, hour=17, second=6))
+        self.assertEqual(playlist.segment_at(datetime(2020, 1, 21, hour=17)).uri, 'b.ts')
+        self.assertIsNone(playlist.segment_at(datetime(2020, 1, 21, hour=16)))
+        self.assertEqual([s.uri for s in playlist.segments_between(datetime(2020, 1, 21, hour=16),
+                                                                   datetime(2020, 1, 21, hour=17, second=6))],
+                         ['b.ts'])
+        # the segments between 16:59 and 17:00 may be further up
+        self.assertTrue(playlist.starts_by(datetime(2020, 1, 21, hour=17)))
+        self.assertFalse(playlist.starts_by(datetime(2020, 1, 21, hour=16, minute=59)))
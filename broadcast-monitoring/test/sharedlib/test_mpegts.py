@@ -0,0 +1,95 @@
+import io
+
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from common.mpegts import earliest_pts, read_start_time, read_start_time_from_s3, PTS_WRAP, TS_PACKET_SIZE
+from common.utils import s3
+
+PMT_PID = 0x100
+VIDEO_PID = 0x101
+AUDIO_PID = 0x102
+SCTE35_PID = 0x1f4
+
+
+def ts_packet(pid, payload, payload_unit_start=True, adaptation_field=b''):
+    header = bytes([0x47, (0x40 if payload_unit_start else 0) | (pid >> 8), pid & 0xff,
+                    (0x30 if adaptation_field else 0x10)])
+    if adaptation_field:
+        header += bytes([len(adaptation_field)]) + adaptation_field
+    # stuffing
+    return (header + payload + b'\xff' * TS_PACKET_SIZE)[:TS_PACKET_SIZE]
+
+
+def psi(table_id, table_id_extension, body):
+    section_length = 5 + len(body) + 4
+    section = bytes([table_id, 0xb0 | (section_length >> 8), section_length & 0xff,
+                     table_id_extension >> 8, table_id_extension & 0xff, 0xc1, 0, 0]) + body + b'\x00' * 4
+    return b'\x00' + section
+
+
+def pat():
+    return ts_packet(0, psi(0, 1, bytes([0, 1, 0xe0 | (PMT_PID >> 8), PMT_PID & 0xff])))
+
+
+def pmt(extra_streams=()):
+    streams = b''.join(bytes([stream_type, 0xe0 | (pid >> 8), pid & 0xff, 0xf0, 0])
+                       for stream_type, pid in [(0x1b, VIDEO_PID), (0x0f, AUDIO_PID), *extra_streams])
+    return ts_packet(PMT_PID, psi(2, 1, bytes([0xe0 | (VIDEO_PID >> 8), VIDEO_PID & 0xff, 0xf0, 0]) + streams))
+
+
+def pes(pid, pts):
+    pts_bytes = bytes([0x21 | ((pts >> 29) & 0x0e), (pts >> 22) & 0xff, 0x01 | ((pts >> 14) & 0xfe),
+                       (pts >> 7) & 0xff, 0x01 | ((pts << 1) & 0xfe)])
+    return ts_packet(pid, b'\x00\x00\x01\xe0\x00\x00\x80\x80\x05' + pts_bytes, adaptation_field=b'\x10')
+
+
+def test_read_start_time():
+    # the audio stream starts 1/60 second before the video stream
+    segment = pat() + pmt() + pes(VIDEO_PID, 900000) + ts_packet(VIDEO_PID, b'\x00' * 184, False) + \
+        pes(AUDIO_PID, 898500) + pes(VIDEO_PID, 903003)
+    assert read_start_time(segment) == (898500 / 90000, True)
+    # the audio stream doesn't start in the first bytes
+    assert read_start_time(segment[:TS_PACKET_SIZE * 4]) == (10.0, False)
+    # starting in the middle of a packet
+    assert read_start_time(segment[100:]) == (898500 / 90000, False)
+    assert read_start_time(b'') == (None, False)
+    # largest 33 bit PTS, without a program map table
+    assert read_start_time(pes(VIDEO_PID, 2 ** 33 - 1)) == ((2 ** 33 - 1) / 90000, False)
+
+
+def test_read_start_time_with_pts_wrap_around():
+    # the audio stream wrapped around past 2**33, after the video stream started
+    segment = pat() + pmt() + pes(VIDEO_PID, PTS_WRAP - 900) + pes(AUDIO_PID, 600)
+    assert read_start_time(segment) == ((PTS_WRAP - 900) / 90000, True)
+    # the audio stream starts before the wrap around, the video stream after it
+    segment = pat() + pmt() + pes(VIDEO_PID, 300) + pes(AUDIO_PID, PTS_WRAP - 1200)
+    assert read_start_time(segment) == ((PTS_WRAP - 1200) / 90000, True)
+
+
+def test_earliest_pts():
+    assert earliest_pts([900000, 898500]) == 898500
+    assert earliest_pts([PTS_WRAP - 1, 0]) == PTS_WRAP - 1
+    assert earliest_pts([0, PTS_WRAP - 1, 10]) == PTS_WRAP - 1
+    assert earliest_pts([5]) == 5
+
+
+def test_read_start_time_with_scte35_stream():
+    # SCTE-35 splice info sections of MediaLive never carry a PTS
+    segment = pat() + pmt([(0x86, SCTE35_PID)]) + ts_packet(SCTE35_PID, b'\x00\xfc\x30') + pes(VIDEO_PID, 900000) + \
+        pes(AUDIO_PID, 898500)
+    assert read_start_time(segment) == (898500 / 90000, True)
+
+
+def test_read_start_time_from_s3():
+    segment = pat() + pmt() + pes(VIDEO_PID, 900000) + ts_packet(VIDEO_PID, b'\x00' * 184, False) + \
+        pes(AUDIO_PID, 898500)
+    with Stubber(s3) as s3_stub:
+        head = segment[:TS_PACKET_SIZE * 4]
+        s3_stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(head), len(head))},
+                             {'Bucket': 'test-bucket', 'Key': 'live/test_1_00001.ts', 'VersionId': 'v1',
+                              'Range': f'bytes=0-{len(head) - 1}'})
+        s3_stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(segment), len(segment))},
+                             {'Bucket': 'test-bucket', 'Key': 'live/test_1_00001.ts', 'VersionId': 'v1'})
+        assert read_start_time_from_s3('test-bucket', 'live/test_1_00001.ts', 'v1', len(head)) == 898500 / 90000
+        s3_stub.assert_no_pending_responses()
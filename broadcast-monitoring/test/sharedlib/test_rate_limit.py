@@ -0,0 +1,110 @@
+import pytest
+from botocore.exceptions import ClientError, ConnectionClosedError
+
+from common.rate_limit import AdaptiveRateLimiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.sleeps.append(sec)
+        self.now += sec
+
+
+def client_error(code, status_code=400):
+    return ClientError({'Error': {'Code': code, 'Message': ''}, 'ResponseMetadata': {'HTTPStatusCode': status_code}},
+                       'DetectText')
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def limiter(clock, **kwargs):
+    return AdaptiveRateLimiter('test', 4, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_acquire_paces_calls(clock):
+    sut = limiter(clock)
+    for _ in range(9):
+        sut.acquire()
+    # the first call goes through right away, then one every 1/4 sec
+    assert clock.now == pytest.approx(2.0)
+
+
+def test_rate_aimd(clock):
+    sut = limiter(clock, min_rate=1, increase=1, decrease_factor=0.5)
+    sut.on_throttle()
+    assert sut.rate == 2
+    sut.on_throttle()
+    sut.on_throttle()
+    assert sut.rate == 1
+    sut.on_success()
+    assert sut.rate == 2
+    sut.on_success()
+    assert sut.rate == 2.5
+    for _ in range(10):
+        sut.on_success()
+    assert sut.rate == 4
+
+
+def test_call_retries_throttled(clock):
+    responses = [client_error('ThrottlingException'), client_error('ThrottlingException'), {'TextDetections': []}]
+
+    def detect_text(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    sut = limiter(clock, max_retries=2)
+    assert sut.call(detect_text, Image={}) == {'TextDetections': []}
+    assert sut.rate == pytest.approx(1 + 0.5)
+
+
+def test_call_retries_transient_errors(clock):
+    responses = [client_error('InternalServerError', 500), client_error('SomethingUnexpected', 503),
+                 ConnectionClosedError(endpoint_url='https://rekognition.us-east-1.amazonaws.com'),
+                 {'TextDetections': []}]
+
+    def detect_text(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    sut = limiter(clock, max_retries=3)
+    assert sut.call(detect_text, Image={}) == {'TextDetections': []}
+    # not throttled, the rate is kept
+    assert sut.rate == 4
+    assert len(clock.sleeps) >= 3
+
+
+def test_call_raises_when_retries_exhausted(clock):
+    def detect_text(**kwargs):
+        raise client_error('ThrottlingException')
+
+    sut = limiter(clock, max_retries=2)
+    with pytest.raises(ClientError):
+        sut.call(detect_text)
+
+
+def test_call_raises_other_errors(clock):
+    calls = []
+
+    def detect_text(**kwargs):
+        calls.append(kwargs)
+        raise client_error('InvalidS3ObjectException')
+
+    sut = limiter(clock)
+    with pytest.raises(ClientError):
+        sut.call(detect_text)
+    assert len(calls) == 1
+    assert sut.rate == 4
@@ -0,0 +1,132 @@
+from common.segment_analysis import SceneSampling, build_ffmpeg_command, convert_audio_results, parse_astats_output, \
+    parse_ebur128_output, parse_showinfo_output, parse_start_time_output, parse_video_fps_output, parse_volume_output, \
+    split_edge_silence, split_raw_frames
+
+raw_analysis_output = '''
+Input #0, mpegts, from '/tmp/test_1_00039.ts':
+  Duration: 00:00:06.01, start: 137.435000, bitrate: 1181 kb/s
+  Program 1
+    Stream #0:0[0x100]: Video: h264 (High), yuv420p(progressive), 4x2 [SAR 1:1 DAR 2:1], 29.97 fps, 29.97 tbr
+    Stream #0:1[0x101]: Audio: aac (LC) ([15][0][0][0] / 0x000F), 48000 Hz, stereo, fltp, 130 kb/s
+Stream mapping:
+  Stream #0:1 -> #0:0 (aac (native) -> pcm_s16le (native))
+  Stream #0:0 -> #1:0 (h264 (native) -> rawvideo (native))
+Output #1, rawvideo, to 'pipe:1':
+    Stream #1:0: Video: rawvideo, bgr24, 4x2, q=2-31, 5 kb/s, 29.97 fps, 29.97 tbn
+[Parsed_showinfo_1 @ 0x5581f0f3c0] n:   0 pts:12369150 pts_time:137.435 pos:    22560 fmt:yuv420p sar:1/1 s:4x2
+[Parsed_showinfo_1 @ 0x5581f0f3c0] n:   1 pts:12459240 pts_time:138.436 pos:   187812 fmt:yuv420p sar:1/1 s:4x2
+[Parsed_showinfo_1 @ 0x5581f0f3c0] n:   2 pts:12549330 pts_time:139.437 pos:   351716 fmt:yuv420p sar:1/1 s:4x2
+[silencedetect @ 0x5581f0f7d0c0] silence_start: 1.33494
+[silencedetect @ 0x5581f0f7d0c0] silence_end: 1.84523 | silence_duration: 0.510292
+[Parsed_volumedetect_0 @ 0x5581f0f3b2c0] mean_volume: -27.2 dB
+[Parsed_volumedetect_0 @ 0x5581f0f3b2c0] max_volume: -10.6 dB
+'''.splitlines()
+
+raw_audio_stats_output = '''
+[Parsed_ebur128_3 @ 0x55c3d8a1c0] t: 0.1        TARGET:-23 LUFS    M:-120.7 S:-120.7     I: -70.0 LUFS
+[Parsed_ebur128_3 @ 0x55c3d8a1c0] t: 2.9        TARGET:-23 LUFS    M: -22.1 S: -24.3     I: -23.2 LUFS
+[Parsed_ebur128_3 @ 0x55c3d8a1c0] t: 5.9        TARGET:-23 LUFS    M: -25.0 S: -23.6     I: -23.4 LUFS
+[Parsed_astats_2 @ 0x55c3d8a0c0] Channel: 1
+[Parsed_astats_2 @ 0x55c3d8a0c0] DC offset: -0.000012
+[Parsed_astats_2 @ 0x55c3d8a0c0] Peak level dB: -4.300000
+[Parsed_astats_2 @ 0x55c3d8a0c0] RMS level dB: -21.512000
+[Parsed_astats_2 @ 0x55c3d8a0c0] RMS peak dB: -12.100000
+[Parsed_astats_2 @ 0x55c3d8a0c0] Channel: 2
+[Parsed_astats_2 @ 0x55c3d8a0c0] DC offset: 0.000000
+[Parsed_astats_2 @ 0x55c3d8a0c0] Peak level dB: -inf
+[Parsed_astats_2 @ 0x55c3d8a0c0] RMS level dB: -inf
+[Parsed_astats_2 @ 0x55c3d8a0c0] Overall
+[Parsed_astats_2 @ 0x55c3d8a0c0] Peak level dB: -4.300000
+[Parsed_astats_2 @ 0x55c3d8a0c0] RMS level dB: -24.500000
+[Parsed_ebur128_3 @ 0x55c3d8a1c0] Summary:
+
+  Integrated loudness:
+    I:         -23.4 LUFS
+    Threshold: -33.6 LUFS
+
+  Loudness range:
+    LRA:         1.2 LU
+'''.splitlines()
+
+
+def test_parse_volume():
+    assert parse_volume_output(raw_analysis_output) == (-27.2, -10.6)
+    # a full scale signal peaks at 0 dB
+    full_scale_output = ['[Parsed_volumedetect_0 @ 0x5581f0f3b2c0] mean_volume: -3.0 dB',
+                         '[Parsed_volumedetect_0 @ 0x5581f0f3b2c0] max_volume: 0.0 dB']
+    assert parse_volume_output(full_scale_output) == (-3.0, 0.0)
+    assert parse_volume_output(raw_audio_stats_output) is None
+
+
+def test_parse_astats():
+    assert parse_astats_output(raw_audio_stats_output) == [(-21.512, -4.3), (-90.3, -90.3)]
+    assert parse_astats_output(raw_analysis_output) == []
+
+
+def test_parse_ebur128():
+    assert parse_ebur128_output(raw_audio_stats_output) == (-23.4, -23.6)
+    assert parse_ebur128_output(raw_analysis_output) is None
+
+
+def test_parse_start_time():
+    assert parse_start_time_output(raw_analysis_output) == 137.435
+    assert parse_start_time_output(['Stream mapping:']) is None
+
+
+def test_parse_video_fps():
+    assert parse_video_fps_output(raw_analysis_output) == 29.97
+
+
+def test_split_raw_frames():
+    frames_info = parse_showinfo_output(raw_analysis_output)
+    assert frames_info == [(137.435, 4, 2), (138.436, 4, 2), (139.437, 4, 2)]
+
+    frame_size = 4 * 2 * 3
+    raw_video = bytes(range(frame_size)) * 3
+    frames = split_raw_frames(raw_video, frames_info, fps=29.97)
+    assert [frame.frame_num for frame in frames] == [0, 30, 60]
+    assert [round(frame.millis) for frame in frames] == [0, 1001, 2002]
+    assert bytes(frames[1].data) == bytes(range(frame_size))
+
+    # stdout was cut short: only keep the complete frames
+    assert len(split_raw_frames(raw_video[:-1], frames_info, fps=29.97)) == 2
+
+
+def test_convert_audio_results():
+    assert convert_audio_results((0.0, 0.0), []) == {'volume': {'mean': 0.0, 'max': 0.0}, 'silence_chunks': []}
+    assert convert_audio_results((-27.2, -10.6), [(1.33494, 1.84523)]) == {
+        'volume': {'mean': -27.2, 'max': -10.6},
+        'silence_chunks': [{'start': 1.33494, 'end': 1.84523}]
+    }
+    assert convert_audio_results((-27.2, -10.6), [], [(-27.0, -10.6), (-27.4, -11.0)], (-26.5, -24.9)) == {
+        'volume': {'mean': -27.2, 'max': -10.6,
+                   'channels': [{'mean': -27.0, 'max': -10.6}, {'mean': -27.4, 'max': -11.0}],
+                   'loudness': {'integrated': -26.5, 'short_term_max': -24.9}},
+        'silence_chunks': []
+    }
+
+
+def test_build_ffmpeg_command():
+    command = build_ffmpeg_command('/tmp/test_1_00039.ts', sample_fps=1, audio=False)
+    assert '0:a:0' not in command
+    assert command[-1] == 'pipe:1'
+    assert "select='isnan(prev_selected_t)+gte(t-prev_selected_t,0.999000)',showinfo" in command
+
+    command = build_ffmpeg_command('/tmp/test_1_00039.ts', sample_fps=1, threshold='-50dB', duration=1)
+    assert 'volumedetect,silencedetect=n=-50dB:d=1,astats,ebur128=framelog=info' in command
+
+    # shorter silence is detected for the edges of the segment
+    command = build_ffmpeg_command('/tmp/test_1_00039.ts', sample_fps=1, threshold='-50dB', duration=1,
+                                   edge_duration=0.1)
+    assert 'volumedetect,silencedetect=n=-50dB:d=0.1,astats,ebur128=framelog=info' in command
+
+    command = build_ffmpeg_command('/tmp/test_1_00039.ts', audio=False, scene_sampling=SceneSampling(0.1, 0.2, 2))
+    # candidate frames at the max rate, the frame extractor samples on scene changes among them
+    assert "select='isnan(prev_selected_t)+gte(t-prev_selected_t,0.499000)',showinfo" in command
+
+
+def test_split_edge_silence():
+    chunks = [(0.0, 0.4), (1.0, 1.2), (2.0, 3.5), (5.8, 6.0)]
+    assert split_edge_silence(chunks, 1) == ([(2.0, 3.5)], [(0.0, 0.4), (5.8, 6.0)])
+    assert split_edge_silence([(0.0, 6.0)], '1') == ([(0.0, 6.0)], [])
+    assert split_edge_silence([], 1) == ([], [])
@@ -1,6 +1,8 @@
+import copy
+import pickle
 from unittest import TestCase
 import os
-from sports_data.team import TeamInfoFactory
+from sports_data.team import TeamInfoFactory, team_index
 
 TEST_DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
 
@@ -19,3 +21,25 @@ class TestTeams(TestCase):
         with self.assertRaises(ValueError) as context:
             team_info.load_items_from_yaml(os.path.join(TEST_DATA_DIR, 'test_team_info.yaml'))
         self.assertTrue('duplicate abbreviations' in str(context.exception))
+
+    def test_team_index(self):
+        self.assertTrue(team_index.team_exists('  manchester   UNITED '))
+        self.assertFalse(team_index.team_exists('Chicago Bears'))
+        self.assertIsNone(team_index.get_team('Chicago Bears'))
+
+        # lookups return the shared instances, which can't be modified
+        team_mu = team_index.get_team_from_abbr('MU')
+        self.assertIs(team_mu, team_index.get_team('Manchester Utd'))
+        self.assertIs(team_mu, TeamInfoFactory().get_team_from_id(team_mu.team_id))
+        with self.assertRaises(AttributeError):
+            team_mu.name = 'Chicago Bears'
+
+    def test_team_copy(self):
+        team_mu = team_index.get_team_from_abbr('MU')
+        self.assertIs(copy.copy(team_mu), team_mu)
+        self.assertIs(copy.deepcopy({'team': team_mu})['team'], team_mu)
+
+        unpickled = pickle.loads(pickle.dumps(team_mu))
+        self.assertEqual(unpickled, team_mu)
+        self.assertEqual((unpickled.abbreviations, unpickled.alt_names, unpickled.team_id),
+                         (team_mu.abbreviations, team_mu.alt_names, team_mu.team_id))
@@ -1,7 +1,7 @@
 from pathlib import Path
 
 import pytest
-from ..app.station_logo_check import StationLogoCheck
+from frame_checks.station_logo import StationLogoCheck
 
 
 @pytest.fixture
@@ -13,3 +13,8 @@ def test_parse_expected_teams():
 
     teams = parse_expected_teams(team_info, 'BOU V ARS')
     assert team_names(teams) == ['AFC Bournemouth', 'Arsenal']
+
+    # programs without teams, and unknown teams
+    assert parse_expected_teams(team_info, None) == []
+    assert parse_expected_teams(team_info, '') == []
+    assert team_names(parse_expected_teams(team_info, 'AVL V XYZ')) == ['Aston Villa']
@@ -1,5 +1,5 @@
 import pytest
-from ..app.team_logo_check import TeamLogoCheck
+from frame_checks.team_logo import TeamLogoCheck
 
 
 @pytest.fixture
@@ -0,0 +1,54 @@
+from sports_data.matcher import AhoCorasick, DeletionIndex, TeamMatcher, bounded_edit_distance, MATCH_ABBR, \
+    MATCH_NAME, MATCH_FUZZY
+from sports_data.team import team_index
+
+
+def text_detection(text, detection_type, detection_id, parent_id=None):
+    detection = {'DetectedText': text, 'Type': detection_type, 'Id': detection_id, 'Confidence': 90.0,
+                 'Geometry': {'BoundingBox': {'Width': 0.1, 'Height': 0.1, 'Left': 0.1, 'Top': 0.1}}}
+    if parent_id is not None:
+        detection['ParentId'] = parent_id
+    return detection
+
+
+def test_aho_corasick():
+    automaton = AhoCorasick({'villa': 1, 'aston villa': 2, 'ars': 3})
+    assert sorted(automaton.find('aston villa v arsenal')) == [(0, 11, 2), (6, 11, 1)]
+    assert list(automaton.find('ars')) == [(0, 3, 3)]
+
+
+def test_bounded_edit_distance():
+    assert bounded_edit_distance('arsenal', 'arsenal', 1) == 0
+    assert bounded_edit_distance('arsena1', 'arsenal', 1) == 1
+    assert bounded_edit_distance('arsen', 'arsenal', 1) == 2
+    assert bounded_edit_distance('chelsea', 'arsenal', 2) == 3
+
+
+def test_deletion_index():
+    index = DeletionIndex({'arsenal': 'ARS', 'everton': 'EVE'}, max_distance=1)
+    assert index.lookup('arsenal') == ('ARS', 0)
+    assert index.lookup('arsnal') == ('ARS', 1)
+    assert index.lookup('arsenall') == ('ARS', 1)
+    assert index.lookup('evertun') == ('EVE', 1)
+    assert index.lookup('arsen') is None
+
+
+def test_team_matcher():
+    matcher = TeamMatcher(team_index, max_distance=1, min_fuzzy_length=5)
+    detections = [
+        text_detection('Aston Villa 1 - 0 T0T', 'LINE', 0),
+        text_detection('Aston', 'WORD', 1, 0),
+        text_detection('Villa', 'WORD', 2, 0),
+        text_detection('T0T', 'WORD', 3, 0),
+        text_detection('Arsenai', 'WORD', 4, 5),
+        text_detection('THE', 'WORD', 5, 5),
+    ]
+    matches = [(detection['Id'], team_match.team.team_id, team_match.match_type)
+               for detection, team_match in matcher.match(detections)]
+    assert matches == [
+        (0, 'aston_villa', MATCH_NAME),
+        (3, 'tottenham', MATCH_ABBR),
+        (4, 'arsenal', MATCH_FUZZY),
+    ]
+
+    assert TeamMatcher(team_index, max_distance=0).match_word('Arsenai') is None
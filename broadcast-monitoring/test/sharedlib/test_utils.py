@@ -1,4 +1,7 @@
+import io
 import os
+import subprocess
+import sys
 from datetime import datetime
 from pathlib import Path
 
@@ -7,12 +10,13 @@ from decimal import Decimal
 import boto3
 import pytest
 from boto3.dynamodb.conditions import Key
-from botocore.stub import Stubber
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber, ANY
 
-from common.utils import (DDBUpdateBuilder, check_enabled, cleanup_dir,
-                          convert_csv_to_ddb, convert_str_to_bool, dynamodb,
-                          parse_date_time_from_str, parse_date_time_to_str, convert_to_ddb,
-                          query_item_ddb)
+from common.utils import (DDBBatchWriter, DDBBatchWriteError, DDBUpdateBuilder, batch_get_items_ddb,
+                          bump_schedule_versions, check_enabled, cleanup_dir, convert_csv_to_ddb, convert_str_to_bool,
+                          dynamodb, parse_date_time_from_str, parse_date_time_to_str, convert_to_ddb,
+                          query_item_ddb, read_csv_items, s3, S3UploadPool, stream_to_process)
 test_table_name = 'test'
 TEST_DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data')
 
@@ -71,6 +75,77 @@ def test_convert_csv_to_ddb(local_ddb):
     assert ddb_items[3]['Test_Str_Column'] == 'test'
 
 
+def test_read_csv_items():
+    with open(os.path.join(TEST_DATA_DIR, 'test-csv-import.csv')) as csv_file:
+        items = list(read_csv_items(csv_file))
+    assert len(items) == 5
+    assert items[0] == {'Test_Hashkey': 'test_str', 'Test_RangeKey': 1, 'Test_Num_Column': Decimal('3.2')}
+    assert items[1] == {'Test_Hashkey': 'test_str', 'Test_RangeKey': 5}
+    assert items[3]['Test_Str_Column'] == 'test'
+
+    with pytest.raises(ValueError):
+        list(read_csv_items(io.StringIO('Test_Hashkey,Test_RangeKey (N)\ntest_str,1\n')))
+
+
+def test_load_csv_to_ddb_diff(ddb_resource_stub):
+    test_csv = os.path.join(TEST_DATA_DIR, 'test-csv-import.csv')
+    ddb_resource_stub.add_response('describe_table', {'Table': {'KeySchema': [
+        {'AttributeName': 'Test_RangeKey', 'KeyType': 'RANGE'},
+        {'AttributeName': 'Test_Hashkey', 'KeyType': 'HASH'}]}}, {'TableName': test_table_name})
+    # 1 is unchanged, 5 has a new value, 3 and 9 are new
+    ddb_resource_stub.add_response('query', {'Items': [
+        {'Test_Hashkey': {'S': 'test_str'}, 'Test_RangeKey': {'N': '1'}, 'Test_Num_Column': {'N': '3.2'}},
+        {'Test_Hashkey': {'S': 'test_str'}, 'Test_RangeKey': {'N': '5'}, 'Test_Num_Column': {'N': '1'}}]},
+        {'TableName': test_table_name, 'KeyConditionExpression': ANY})
+    ddb_resource_stub.add_response('query', {'Items': []}, {'TableName': test_table_name,
+                                                            'KeyConditionExpression': ANY})
+    written = [{'Test_Hashkey': 'test_str', 'Test_RangeKey': 5},
+               {'Test_Hashkey': 'test_str', 'Test_RangeKey': 3, 'Test_Num_Column': Decimal('2.2222')},
+               {'Test_Hashkey': 'test_str', 'Test_RangeKey': 9, 'Test_Num_Column': Decimal('0.2222'),
+                'Test_Str_Column': 'test'},
+               {'Test_Hashkey': 'test_str_2', 'Test_RangeKey': 9, 'Test_Num_Column': Decimal('0.2222'),
+                'Test_Str_Column': 'test'}]
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': {}},
+                                   {'RequestItems': {test_table_name: [{'PutRequest': {'Item': item}}
+                                                                       for item in written]}})
+
+    counts = convert_csv_to_ddb(test_csv, test_table_name, workers=1, diff=True)
+    assert counts == {'rows': 5, 'written': 4, 'unchanged': 1}
+
+
+def test_bump_schedule_versions(ddb_resource_stub):
+    for stream_id in ['test_1', 'test_2']:
+        ddb_resource_stub.add_response('update_item', {}, {
+            'TableName': test_table_name, 'Key': {'Stream_ID': stream_id, 'Start_Time': -1},
+            'UpdateExpression': 'ADD Schedule_Version :one', 'ExpressionAttributeValues': {':one': 1}})
+    bump_schedule_versions(test_table_name, ['test_1', 'test_2'])
+
+
+def test_read_csv_bool_items():
+    items = list(read_csv_items(io.StringIO('Test_Hashkey (S),Test_Bool_Column (BOOL)\ntest_str,false\n'
+                                            'test_str_2,TRUE\n')))
+    assert items == [{'Test_Hashkey': 'test_str', 'Test_Bool_Column': False},
+                     {'Test_Hashkey': 'test_str_2', 'Test_Bool_Column': True}]
+
+
+def test_load_csv_to_ddb_duplicate_keys(ddb_resource_stub, tmp_path):
+    test_csv = tmp_path / 'test-duplicates.csv'
+    rows = [f'test_str,{i},false' for i in range(25)] + ['test_str,0,true']
+    test_csv.write_text('\n'.join(['Test_Hashkey (S),Test_RangeKey (N),Test_Bool_Column (BOOL)'] + rows))
+    ddb_resource_stub.add_response('describe_table', {'Table': {'KeySchema': [
+        {'AttributeName': 'Test_Hashkey', 'KeyType': 'HASH'},
+        {'AttributeName': 'Test_RangeKey', 'KeyType': 'RANGE'}]}}, {'TableName': test_table_name})
+    # the last row is written after the batch of the first one, on its own
+    for items in [[{'Test_Hashkey': 'test_str', 'Test_RangeKey': i, 'Test_Bool_Column': False} for i in range(25)],
+                  [{'Test_Hashkey': 'test_str', 'Test_RangeKey': 0, 'Test_Bool_Column': True}]]:
+        ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': {}},
+                                       {'RequestItems': {test_table_name: [{'PutRequest': {'Item': item}}
+                                                                           for item in items]}})
+
+    counts = convert_csv_to_ddb(str(test_csv), test_table_name, workers=2)
+    assert counts == {'rows': 26, 'written': 26, 'unchanged': 0}
+
+
 def test_query_item_pagination(local_ddb):
     hash_key = 'test_hash'
     # set up the table with 200 elements
@@ -105,6 +180,101 @@ def test_ddb_update_builder_context_manager(ddb_test_table_stub):
         update_builder.update_attr('test', 'some-value')
 
 
+@pytest.fixture
+def ddb_resource_stub():
+    with Stubber(dynamodb.meta.client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_ddb_batch_writer_flushes_in_batches_of_25(ddb_resource_stub):
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': {}})
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': {}})
+
+    # 30 items are written with one full batch on put and the remainder upon exiting the context manager
+    with DDBBatchWriter('test-table') as batch_writer:
+        for i in range(30):
+            batch_writer.put_item({'Key': f'test-key-{i}'})
+        assert len(batch_writer.items) == 5
+    assert len(batch_writer.items) == 0
+    assert batch_writer.written_count == 30
+
+
+def test_ddb_batch_writer_retries_unprocessed_items(ddb_resource_stub):
+    unprocessed = {'test-table': [{'PutRequest': {'Item': {'Key': {'S': 'test-key-1'}}}}]}
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': unprocessed})
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': {}})
+
+    batch_writer = DDBBatchWriter('test-table', backoff_base_sec=0)
+    batch_writer.put_item({'Key': 'test-key-0'})
+    batch_writer.put_item({'Key': 'test-key-1'})
+    batch_writer.flush()
+    assert batch_writer.written_count == 2
+
+
+def test_ddb_batch_writer_gives_up_after_max_retries(ddb_resource_stub):
+    def unprocessed():
+        return {'test-table': [{'PutRequest': {'Item': {'Key': {'S': 'test-key-0'}}}}]}
+
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': unprocessed()})
+    ddb_resource_stub.add_response('batch_write_item', {'UnprocessedItems': unprocessed()})
+
+    batch_writer = DDBBatchWriter('test-table', max_retries=1, backoff_base_sec=0)
+    batch_writer.put_item({'Key': 'test-key-0'})
+    with pytest.raises(DDBBatchWriteError):
+        batch_writer.flush()
+
+
+def test_batch_get_items_ddb(ddb_resource_stub):
+    keys = [{'Key': f'test-key-{i}'} for i in range(150)]
+    expected_request = {
+        'Keys': keys[:100],
+        'ProjectionExpression': '#a0, #a1',
+        'ExpressionAttributeNames': {'#a0': 'Key', '#a1': 'Status'}
+    }
+    ddb_resource_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'test-table': [{'Key': {'S': f'test-key-{i}'}, 'Status': {'BOOL': True}}
+                                      for i in range(1, 100)]},
+         'UnprocessedKeys': {'test-table': {'Keys': [{'Key': {'S': 'test-key-0'}}]}}},
+        {'RequestItems': {'test-table': expected_request}}
+    )
+    ddb_resource_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'test-table': [{'Key': {'S': 'test-key-0'}, 'Status': {'BOOL': False}}]}}
+    )
+    # test-key-149 has no item
+    ddb_resource_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'test-table': [{'Key': {'S': f'test-key-{i}'}, 'Status': {'BOOL': True}}
+                                      for i in range(100, 149)]}}
+    )
+
+    items = batch_get_items_ddb('test-table', keys, projection_attrs=['Status'], backoff_base_sec=0)
+    assert [item['Key'] for item in items] == [f'test-key-{i}' for i in range(149)]
+    assert items[0]['Status'] is False
+
+
+@pytest.fixture
+def s3_stub():
+    with Stubber(s3) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_s3_upload_pool_reports_each_upload(s3_stub):
+    s3_stub.add_response('put_object', {})
+    s3_stub.add_client_error('put_object', service_error_code='SlowDown')
+
+    # a single worker keeps the order of the stubbed responses deterministic
+    with S3UploadPool(max_workers=1, max_pending=1) as upload_pool:
+        uploaded = upload_pool.submit('test-bucket', 'frame-0.jpg', b'0', ContentType='image/jpeg')
+        failed = upload_pool.submit('test-bucket', 'frame-1.jpg', b'1', ContentType='image/jpeg')
+    assert uploaded.done() and failed.done()
+    assert uploaded.exception() is None
+    assert isinstance(failed.exception(), ClientError)
+
+
 def test_parse_date_time():
     datetime_str = '2020-01-21T16:59:07.001000Z'
     parsed_date_time = parse_date_time_from_str(datetime_str)
@@ -195,3 +365,29 @@ def test_process_detections(in_val, expected):
     res = convert_to_ddb(in_val)
 
     assert expected == res
+
+
+def test_stream_to_process():
+    # echo stdin to stdout, and its size to stderr
+    script = ('import sys; data = sys.stdin.buffer.read(); '
+              'sys.stdout.buffer.write(data); sys.stderr.write(str(len(data)))')
+    process = subprocess.Popen([sys.executable, '-c', script],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    data = os.urandom(1024 * 1024)
+
+    stdout, stderr = stream_to_process(process, io.BytesIO(data), chunk_size=4096)
+
+    assert process.returncode == 0
+    assert stdout == data
+    assert stderr == b'1048576'
+
+
+def test_stream_to_process_raises_input_errors():
+    class BrokenStream(object):
+        def read(self, amt):
+            raise IOError('connection reset')
+
+    process = subprocess.Popen([sys.executable, '-c', 'import sys; sys.stdin.buffer.read()'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with pytest.raises(IOError):
+        stream_to_process(process, BrokenStream())